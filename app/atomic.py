@@ -0,0 +1,74 @@
+import os
+import secrets
+import stat
+
+def fsync_path(path):
+    """Flush a file's written data to disk."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def fsync_directory(directory):
+    """Persist renames inside *directory* (a no-op where directories cannot be opened)."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def _create_temporary(path):
+    """Create a new file next to *path* and return (fd, temporary path).
+
+    It is created with mode 0666 so the kernel applies the umask, as for a
+    file from open(); unlike tempfile.mkstemp, which always uses 0600.
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0)
+    while True:
+        temp_path = os.path.join(directory, f".{name}.{secrets.token_hex(4)}.tmp")
+        try:
+            return os.open(temp_path, flags, 0o666), temp_path
+        except FileExistsError:  # pragma: no cover
+            continue
+
+def atomic_write(path, write, binary=False):
+    """Replace *path* with the output of ``write(file)`` so that readers see the old or the new file, never a partial one.
+
+    The data goes to a temporary file in the same directory, is fsynced and
+    is then renamed over *path*. The new file keeps the permissions of the
+    one it replaces, or gets the umask's defaults like a file from open().
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        mode = None
+    fd, temp_path = _create_temporary(path)
+    try:
+        with (os.fdopen(fd, 'wb') if binary else os.fdopen(fd, 'w', newline='', encoding='utf-8')) as f:
+            if mode is not None:
+                os.chmod(temp_path, mode)
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    fsync_directory(directory)
+
+def file_identity(path):
+    """A value that changes whenever *path* is replaced or rewritten, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [st.st_ino, st.st_size, st.st_mtime_ns]
@@ -0,0 +1,202 @@
+"""Incremental history backups.
+
+Every snapshot is stored as a compressed delta against its parent: a list
+of ``copy`` ranges of the parent's rows and ``rows`` that are new. Snapshots
+are listed in ``manifest.json`` with their parent, row count and file size,
+so they can be listed without opening them. Every
+HISTORY_BACKUP_FULL_INTERVAL snapshots, or when most rows changed, a full
+snapshot starts a new chain, which bounds the deltas applied by a restore.
+"""
+import difflib
+import hashlib
+import json
+import lzma
+import os
+import zlib
+from datetime import datetime
+from app.atomic import atomic_write
+from app.config import HISTORY_BACKUP_COMPRESSION, HISTORY_BACKUP_FULL_INTERVAL
+from app.exceptions import HistoryError
+from app.logger import get_logger
+
+logger = get_logger("backups")  # pragma: no cover
+
+MANIFEST = 'manifest.json'
+COMPRESSORS = {
+    'zlib': ('.zlib', lambda data: zlib.compress(data, 6), zlib.decompress),
+    'lzma': ('.xz', lzma.compress, lzma.decompress),
+}
+
+def store_rows(store):
+    """The rows of a HistoryStore as (input, result, timestamp in microseconds, steps JSON) tuples."""
+    return list(zip(store.inputs(), store.result_values(), store.timestamps().tolist(), store.encoded_steps()))
+
+def rows_to_store(rows):
+    from app.store import HistoryStore
+    if not rows:
+        return HistoryStore()
+    inputs, results, timestamps, steps = zip(*rows)
+    return HistoryStore.from_arrays(inputs, results, timestamps, steps)
+
+def row_digest(row):
+    return hashlib.blake2b(json.dumps(row).encode('utf-8'), digest_size=16).digest()
+
+def diff_rows(parent, digests, rows):
+    """Delta operations that turn the rows behind *parent* digests into *rows*."""
+    prefix = 0
+    limit = min(len(parent), len(digests))
+    while prefix < limit and parent[prefix] == digests[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and parent[-1 - suffix] == digests[-1 - suffix]:
+        suffix += 1
+    ops = [['copy', 0, prefix]] if prefix else []
+    # Only the changed middle goes through the matcher; appends and trailing deletes skip it entirely
+    matcher = difflib.SequenceMatcher(None, parent[prefix:len(parent) - suffix], digests[prefix:len(digests) - suffix], autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append(['copy', prefix + i1, prefix + i2])
+        elif j2 > j1:
+            ops.append(['rows', rows[prefix + j1:prefix + j2]])
+    if suffix:
+        ops.append(['copy', len(parent) - suffix, len(parent)])
+    return ops
+
+def apply_delta(parent, ops):
+    rows = []
+    for op in ops:
+        if op[0] == 'copy':
+            rows.extend(parent[op[1]:op[2]])
+        else:
+            rows.extend(tuple(row) for row in op[1])
+    return rows
+
+class BackupCatalog:
+    """Incremental snapshots of the history in *directory*, described by its manifest."""
+
+    def __init__(self, directory, compression=HISTORY_BACKUP_COMPRESSION, full_interval=HISTORY_BACKUP_FULL_INTERVAL):
+        if compression not in COMPRESSORS:
+            raise HistoryError(f"Unsupported backup compression '{compression}', Available: '{', '.join(COMPRESSORS)}'")
+        self.directory = directory
+        self.compression = compression
+        self.full_interval = full_interval
+        self._latest = None
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.directory, MANIFEST)
+
+    def snapshots(self):
+        """Manifest entries, oldest first."""
+        if not os.path.exists(self.manifest_path):
+            return []
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)['snapshots']
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Failed to read backup manifest {self.manifest_path}: {str(e)}")
+            raise HistoryError(f"Invalid backup manifest: {str(e)}")
+
+    def find(self, name):
+        """The manifest entry whose name or file is *name*, or None."""
+        for entry in self.snapshots():
+            if name in (entry['name'], entry['file']):
+                return entry
+        return None
+
+    def _unique_name(self, entries):
+        base = f"history_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        names = {entry['name'] for entry in entries}
+        name, counter = base, 1
+        while name in names:
+            counter += 1
+            name = f"{base}_{counter}"
+        return name
+
+    def _read_ops(self, entry):
+        decompress = COMPRESSORS[entry.get('compression', 'zlib')][2]
+        with open(os.path.join(self.directory, entry['file']), 'rb') as f:
+            return json.loads(decompress(f.read()))['ops']
+
+    def _materialize(self, entry, entries):
+        """Rows and digests of *entry*, applying its chain of deltas from the last full snapshot."""
+        if self._latest is not None and self._latest[0] == entry['name']:
+            return self._latest[1], self._latest[2]
+        by_name = {e['name']: e for e in entries}
+        chain = [entry]
+        while chain[-1]['parent'] is not None:
+            parent = by_name.get(chain[-1]['parent'])
+            if parent is None:
+                raise HistoryError(f"Backup {chain[-1]['name']} is missing its parent {chain[-1]['parent']}")
+            chain.append(parent)
+        rows = []
+        for link in reversed(chain):
+            rows = apply_delta(rows, self._read_ops(link))
+        digests = [row_digest(row) for row in rows]
+        self._latest = (entry['name'], rows, digests)
+        return rows, digests
+
+    def save(self, store):
+        """Snapshot *store* as a delta against the latest snapshot and return its manifest entry."""
+        entries = self.snapshots()
+        rows = store_rows(store)
+        digests = [row_digest(row) for row in rows]
+        parent = entries[-1] if entries else None
+        ops = None
+        if parent is not None and parent['depth'] + 1 < self.full_interval:
+            parent_rows, parent_digests = self._materialize(parent, entries)
+            ops = diff_rows(parent_digests, digests, rows)
+            added = sum(len(op[1]) for op in ops if op[0] == 'rows')
+            if added * 2 > len(rows) and added > 0:
+                ops = None
+        if ops is None:
+            parent = None
+            ops = [['rows', rows]] if rows else []
+            added = len(rows)
+        copied = sum(op[2] - op[1] for op in ops if op[0] == 'copy')
+        extension, compress, _ = COMPRESSORS[self.compression]
+        name = self._unique_name(entries)
+        data = compress(json.dumps({'ops': ops}).encode('utf-8'))
+        entry = {
+            'name': name,
+            'file': name + extension,
+            'parent': parent['name'] if parent else None,
+            'depth': parent['depth'] + 1 if parent else 0,
+            'compression': self.compression,
+            'created': datetime.now().isoformat(),
+            'rows': len(rows),
+            'added': added,
+            'removed': (parent['rows'] - copied) if parent else 0,
+            'bytes': len(data),
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        atomic_write(os.path.join(self.directory, entry['file']), lambda f: f.write(data), binary=True)
+        # The manifest is written last, so a crash never lists a snapshot without its file
+        atomic_write(self.manifest_path, lambda f: json.dump({'snapshots': entries + [entry]}, f, indent=1))
+        self._latest = (name, rows, digests)
+        logger.info(f"Saved backup {name}: {len(rows)} rows, {added} added, {entry['removed']} removed, {len(data)} bytes")
+        return entry
+
+    def restore(self, name):
+        """Materialize snapshot *name* into a new HistoryStore."""
+        entries = self.snapshots()
+        entry = self.find(name)
+        if entry is None:
+            raise HistoryError(f"Backup {name} does not exist")
+        rows, _ = self._materialize(entry, entries)
+        return rows_to_store(rows)
+
+    def listing(self):
+        """Every backup in the directory with its size, read from the manifest and file sizes only."""
+        entries = self.snapshots()
+        listed = {entry['file'] for entry in entries} | {MANIFEST}
+        backups = [{'name': entry['name'], 'kind': 'full' if entry['parent'] is None else 'delta', 'rows': entry['rows'],
+                    'bytes': entry['bytes'], 'created': entry['created'], 'parent': entry['parent']} for entry in entries]
+        if os.path.isdir(self.directory):
+            for filename in sorted(os.listdir(self.directory)):
+                path = os.path.join(self.directory, filename)
+                if filename in listed or filename.startswith('.') or not os.path.isfile(path):
+                    continue
+                backups.append({'name': filename, 'kind': 'file', 'rows': None, 'bytes': os.path.getsize(path),
+                                'created': datetime.fromtimestamp(os.path.getmtime(path)).isoformat(), 'parent': None})
+        return backups
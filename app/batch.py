@@ -0,0 +1,107 @@
+import sys
+from typing import NamedTuple, Optional
+from app.calculator import evaluate_expression
+from app.config import BATCH_CHUNK_SIZE
+from app.exceptions import OperationError, CalculatorError, HistoryError
+from app.logger import get_logger
+
+log = get_logger("batch")  # pragma: no cover
+
+class BatchResult(NamedTuple):
+    line: int
+    expression: str
+    result: Optional[float]
+    error: Optional[str]
+
+class PendingHistory:
+    """History view that also sees results evaluated but not yet committed.
+
+    Lets ans(n) inside a batch refer to earlier expressions of the same batch
+    while the history itself is only written once per chunk.
+    """
+
+    def __init__(self, history):
+        self.history = history
+        self.pending = []
+
+    def __len__(self):
+        return len(self.history) + len(self.pending)
+
+    @property
+    def exact(self):
+        return getattr(self.history, 'exact', None)
+
+    def get_previous_result(self, n):
+        committed = len(self.history)
+        if committed < n <= committed + len(self.pending):
+            return self.pending[n - committed - 1][1]
+        return self.history.get_previous_result(n)
+
+    def commit(self):
+        if self.pending:
+            self.history.save_calculation_groups(self.pending)
+            self.pending = []
+
+def iter_expressions(lines):
+    """Yield (line number, expression) pairs, skipping blank lines and '#' comments."""
+    for line_no, raw in enumerate(lines, 1):
+        expression = raw.strip()
+        if expression and not expression.startswith('#'):
+            yield line_no, expression
+
+def calculate_batch(expressions, history, chunk_size=BATCH_CHUNK_SIZE):
+    """Evaluate an iterable of expressions, yielding a BatchResult per expression.
+
+    Blank lines and lines starting with '#' are skipped. Successful results are
+    committed to *history* every *chunk_size* entries and when the input ends.
+    """
+    pending = PendingHistory(history)
+    try:
+        for line_no, expression in iter_expressions(expressions):
+            try:
+                result, steps = evaluate_expression(expression.lower(), pending)
+            except (OperationError, CalculatorError, HistoryError) as e:
+                yield BatchResult(line_no, expression, None, str(e))
+                continue
+            pending.pending.append((expression, result, steps))
+            if len(pending.pending) >= chunk_size:
+                pending.commit()
+            yield BatchResult(line_no, expression, result, None)
+    finally:
+        pending.commit()
+
+def write_results(results, output, buffer_size=BATCH_CHUNK_SIZE):
+    """Write one result or error line per BatchResult, buffering *buffer_size* lines per write.
+
+    Returns a tuple of (evaluated, failed) counts.
+    """
+    evaluated = failed = 0
+    lines = []
+    for item in results:
+        evaluated += 1
+        if item.error is None:
+            lines.append(f"{item.result}\n")
+        else:
+            failed += 1
+            lines.append(f"Error: {item.error}\n")
+        if len(lines) >= buffer_size:
+            output.write(''.join(lines))
+            lines = []
+    output.write(''.join(lines))
+    output.flush()
+    return evaluated, failed
+
+def run_batch(source, output, history, chunk_size=BATCH_CHUNK_SIZE):
+    """Stream expressions from *source* to *output*, one result or error line per expression.
+
+    Returns a tuple of (evaluated, failed) counts.
+    """
+    evaluated, failed = write_results(calculate_batch(source, history, chunk_size), output, chunk_size)
+    log.info(f"Batch evaluated {evaluated} expressions with {failed} errors")
+    return evaluated, failed
+
+def open_source(path):
+    return sys.stdin if path == '-' else open(path, 'r', encoding='utf-8')
+
+def open_output(path):
+    return sys.stdout if path in (None, '-') else open(path, 'w', encoding='utf-8')
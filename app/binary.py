@@ -0,0 +1,281 @@
+"""Binary history format.
+
+Layout (little-endian)::
+
+    header       magic b'CALCHIST', version u32, flags u32, count u64,
+                 input blob size u64, steps blob size u64
+    results      float64[count]
+    timestamps   int64[count]   microseconds since the epoch (int64 min = none)
+    input index  uint64[count + 1]   byte offsets into the input blob
+    steps index  uint64[count + 1]   byte offsets into the steps blob
+    input blob   UTF-8 inputs, back to back
+    steps blob   UTF-8 JSON steps, back to back
+
+With the FLAG_EXACT flag, exact int results (NUMERIC_MODE=exact) follow,
+starting on the next 8-byte boundary; their rows keep a float
+approximation in the results column::
+
+    exact count  u64
+    exact rows   uint64[exact count]       ascending row positions
+    exact index  uint64[exact count + 1]   byte offsets into the exact blob
+    exact blob   signed little-endian integers, back to back
+
+Every fixed-width section starts on an 8-byte boundary, so the columns are
+read straight from a memory map and a single row touches only its own bytes.
+"""
+import argparse
+import mmap
+import os
+import struct
+import sys
+import numpy as np
+from app.atomic import atomic_write
+from app.exceptions import HistoryError
+from app.logger import get_logger
+from app.store import HistoryStore, from_microseconds, decode_steps, read_csv, write_csv
+
+logger = get_logger("binary")  # pragma: no cover
+
+MAGIC = b'CALCHIST'
+VERSION = 1
+HEADER = struct.Struct('<8sIIQQQ')
+FLAG_EXACT = 1
+
+def is_binary_history(path):
+    """True if *path* starts with the binary history magic."""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+def _blob(strings):
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    np.cumsum(np.fromiter(map(len, encoded), dtype=np.uint64, count=len(encoded)), out=offsets[1:])
+    return offsets, b''.join(encoded)
+
+def _int_bytes(value):
+    return value.to_bytes(value.bit_length() // 8 + 1, 'little', signed=True)
+
+def _exact_chunks(exact, offset):
+    """The exact section for (position, int) pairs, padded to start at an 8-byte boundary after *offset*."""
+    encoded = [_int_bytes(value) for _, value in exact]
+    offsets = np.zeros(len(encoded) + 1, dtype='<u8')
+    np.cumsum(np.fromiter(map(len, encoded), dtype=np.uint64, count=len(encoded)), out=offsets[1:])
+    return [
+        b'\0' * (-offset % 8),
+        struct.pack('<Q', len(exact)),
+        np.array([position for position, _ in exact], dtype='<u8').tobytes(),
+        offsets.tobytes(),
+        b''.join(encoded),
+    ]
+
+def encode_binary(store):
+    """Serialize *store* into the chunks of a binary history file."""
+    count = len(store)
+    input_offsets, inputs = _blob(store.inputs())
+    steps_offsets, steps = _blob(store.encoded_steps())
+    exact = store.exact_results()
+    chunks = [
+        HEADER.pack(MAGIC, VERSION, FLAG_EXACT if exact else 0, count, len(inputs), len(steps)),
+        np.ascontiguousarray(store.results(), dtype='<f8').tobytes(),
+        np.ascontiguousarray(store.timestamps(), dtype='<i8').tobytes(),
+        input_offsets.astype('<u8').tobytes(),
+        steps_offsets.astype('<u8').tobytes(),
+        inputs,
+        steps,
+    ]
+    if exact:
+        chunks.extend(_exact_chunks(exact, HEADER.size + 8 * (4 * count + 2) + len(inputs) + len(steps)))
+    return chunks
+
+def write_chunks(chunks, path):
+    """Write encoded chunks to *path*, replacing the file atomically."""
+    # A reader that still maps the old file keeps a valid mapping after the rename
+    atomic_write(path, lambda f: f.writelines(chunks), binary=True)
+
+def write_binary(store, path):
+    """Write *store* to *path* in the binary format, replacing the file atomically."""
+    write_chunks(encode_binary(store), path)
+    logger.debug(f"Wrote binary history {path}: {len(store)} entries")
+
+class BinaryHistory:
+    """Read-only, memory-mapped view of a binary history file.
+
+    Only the header is parsed on open; ``result``, ``input`` and ``steps``
+    read the bytes of a single row, so ``ans(n)`` lookups and history pages
+    do not depend on the size of the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._open_columns()
+        except Exception as e:
+            self.close()
+            raise HistoryError(f"Invalid binary history {path}: {str(e)}")
+
+    def _open_columns(self):
+        if len(self._map) < HEADER.size:
+            raise ValueError("file is shorter than the header")
+        magic, version, flags, count, input_size, steps_size = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError("not a binary history file")
+        if version != VERSION:
+            raise ValueError(f"unsupported version {version}")
+        end = HEADER.size + 8 * (4 * count + 2) + input_size + steps_size
+        self._exact_rows = None
+        if flags & FLAG_EXACT:
+            self._open_exact(end + (-end % 8))
+        elif end != len(self._map):
+            raise ValueError("file size does not match its header")
+        offset = HEADER.size
+        sections = []
+        for dtype, length in (('<f8', count), ('<i8', count), ('<u8', count + 1), ('<u8', count + 1)):
+            sections.append(np.frombuffer(self._map, dtype=dtype, count=length, offset=offset))
+            offset += 8 * length
+        self._results, self._timestamps, self._input_offsets, self._steps_offsets = sections
+        self._input_start = offset
+        self._steps_start = offset + input_size
+        self._count = count
+
+    def _open_exact(self, offset):
+        if offset + 8 > len(self._map):
+            raise ValueError("file is shorter than its exact results")
+        exact_count, = struct.unpack_from('<Q', self._map, offset)
+        offset += 8
+        if offset + 8 * (2 * exact_count + 1) > len(self._map):
+            raise ValueError("file is shorter than its exact results")
+        self._exact_rows = np.frombuffer(self._map, dtype='<u8', count=exact_count, offset=offset)
+        self._exact_offsets = np.frombuffer(self._map, dtype='<u8', count=exact_count + 1, offset=offset + 8 * exact_count)
+        self._exact_start = offset + 8 * (2 * exact_count + 1)
+        if self._exact_start + int(self._exact_offsets[-1]) != len(self._map):
+            raise ValueError("file size does not match its exact results")
+
+    def _exact(self, index):
+        """The exact int result of row *index*, or None if it has none."""
+        rows = self._exact_rows
+        if rows is None:
+            return None
+        position = int(np.searchsorted(rows, index))
+        if position == len(rows) or rows[position] != index:
+            return None
+        start = self._exact_start
+        return int.from_bytes(self._map[start + int(self._exact_offsets[position]):start + int(self._exact_offsets[position + 1])], 'little', signed=True)
+
+    def _exact_values(self):
+        if self._exact_rows is None:
+            return []
+        data = self._map[self._exact_start:]
+        bounds = self._exact_offsets.tolist()
+        values = [int.from_bytes(data[a:b], 'little', signed=True) for a, b in zip(bounds, bounds[1:])]
+        return list(zip(self._exact_rows.tolist(), values))
+
+    def __len__(self):
+        return self._count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        # Views into the map must go before it can be closed
+        self._results = self._timestamps = self._input_offsets = self._steps_offsets = None
+        self._exact_rows = self._exact_offsets = None
+        if getattr(self, '_map', None) is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def _check(self, index):
+        if not 0 <= index < self._count:
+            raise IndexError(f"History row {index} out of range")
+
+    def _text(self, start, offsets, index):
+        return self._map[start + int(offsets[index]):start + int(offsets[index + 1])].decode('utf-8')
+
+    def result(self, index):
+        self._check(index)
+        exact = self._exact(index)
+        return float(self._results[index]) if exact is None else exact
+
+    def timestamp(self, index):
+        self._check(index)
+        return from_microseconds(self._timestamps[index])
+
+    def input(self, index):
+        self._check(index)
+        return self._text(self._input_start, self._input_offsets, index)
+
+    def steps(self, index):
+        self._check(index)
+        return decode_steps(self._text(self._steps_start, self._steps_offsets, index))
+
+    def row(self, index):
+        return {
+            'input': self.input(index),
+            'result': self.result(index),
+            'timestamp': self.timestamp(index),
+            'steps': self.steps(index)
+        }
+
+    def rows(self, start=0, stop=None):
+        """Yield rows ``start`` to ``stop`` (0-based, exclusive)."""
+        stop = self._count if stop is None else min(stop, self._count)
+        for index in range(max(start, 0), stop):
+            yield self.row(index)
+
+    def _strings(self, start, offsets, size):
+        data = self._map[start:start + size]
+        text = data.decode('utf-8')
+        bounds = offsets.tolist()
+        if len(text) != len(data):
+            # Non-ASCII text: byte offsets differ from character offsets
+            return [data[a:b].decode('utf-8') for a, b in zip(bounds, bounds[1:])]
+        return [text[a:b] for a, b in zip(bounds, bounds[1:])]
+
+    def to_store(self):
+        """Copy the whole file into a HistoryStore; steps stay JSON-encoded until read."""
+        inputs = self._strings(self._input_start, self._input_offsets, self._steps_start - self._input_start)
+        steps_end = self._steps_start + int(self._steps_offsets[-1])
+        steps = self._strings(self._steps_start, self._steps_offsets, steps_end - self._steps_start)
+        return HistoryStore.from_arrays(inputs, self._results, self._timestamps, steps, self._exact_values())
+
+def read_binary(path):
+    """Read a binary history file into a new HistoryStore."""
+    with BinaryHistory(path) as history:
+        return history.to_store()
+
+def csv_to_binary(csv_path, binary_path):
+    # Integer results are kept exact; CSVs written in float mode have none
+    store = read_csv(csv_path, exact=True)
+    write_binary(store, binary_path)
+    return len(store)
+
+def binary_to_csv(binary_path, csv_path):
+    store = read_binary(binary_path)
+    write_csv(store, csv_path)
+    return len(store)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert history files between CSV and the binary format")
+    parser.add_argument('direction', choices=('to-binary', 'to-csv'))
+    parser.add_argument('source')
+    parser.add_argument('destination')
+    args = parser.parse_args(argv)
+    try:
+        convert = csv_to_binary if args.direction == 'to-binary' else binary_to_csv
+        count = convert(args.source, args.destination)
+    except Exception as e:
+        print(f"Error: Failed to convert {args.source}: {str(e)}", file=sys.stderr)
+        return 1
+    print(f"Converted {count} entries from {args.source} to {args.destination}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+import threading
+from collections import OrderedDict
+from app.calculation import CalculationFactory
+from app.config import OPERATION_CACHE_SIZE, OPERATION_CACHE_OPERATORS, EXACT_INT_MAX_BITS
+from app.exceptions import OperationError
+
+OPERATIONS = CalculationFactory.dispatch_table()
+
+def apply_operator(operator, a, b):
+    """Evaluate ``a operator b`` through the CalculationFactory dispatch table, reporting failures as OperationError."""
+    operation = OPERATIONS.get(operator)
+    try:
+        if operation is None:
+            result = CalculationFactory.create_calculation(operator, a, b).execute()
+        else:
+            result = operation(a, b)
+    except ValueError as ve:
+        raise OperationError(f"Calculation error: {str(ve)}")
+    if result.__class__ is int and result.bit_length() > EXACT_INT_MAX_BITS:
+        raise OperationError(f"Integer overflow: result exceeds {EXACT_INT_MAX_BITS} bits")
+    return result
+
+class CachedFailure:
+    """Cached outcome of an operation that raised OperationError."""
+    __slots__ = ('message',)
+
+    def __init__(self, message):
+        self.message = message
+
+class OperationCache:
+    """Bounded LRU cache of operator results keyed on ``(operator, a, b)``.
+
+    Operations are pure, so failures are cached too: an OperationError is
+    stored as its message and a fresh OperationError is raised on every hit.
+    Anything else (e.g. HistoryError, programming errors) is never cached.
+    Zero operands bypass the cache because 0.0 and -0.0 compare equal but can
+    produce results with different signs. Operand types are part of the key,
+    so exact int operands never share an entry with the equal floats.
+    Lookups and stores hold a lock, so server sessions on different threads
+    can share one cache; the operation itself runs outside it.
+    """
+
+    def __init__(self, maxsize=OPERATION_CACHE_SIZE, operators=OPERATION_CACHE_OPERATORS):
+        self.maxsize = maxsize
+        self.operators = None if operators == 'all' else frozenset(op.strip() for op in operators.split(',') if op.strip())
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def caches(self, operator):
+        return self.maxsize > 0 and (self.operators is None or operator in self.operators)
+
+    def execute(self, operator, a, b):
+        if not (a and b) or not self.caches(operator):
+            return apply_operator(operator, a, b)
+        key = (operator, a, b, a.__class__, b.__class__)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            else:
+                self.misses += 1
+        if entry is not None:
+            if entry.__class__ is CachedFailure:
+                raise OperationError(entry.message)
+            return entry
+        try:
+            result = apply_operator(operator, a, b)
+        except OperationError as e:
+            self._store(key, CachedFailure(str(e)))
+            raise
+        self._store(key, result)
+        return result
+
+    def _store(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+operation_cache = OperationCache()
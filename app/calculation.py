@@ -2,6 +2,8 @@ from abc import ABC, abstractmethod
 from app.operations import Operation
 
 class Calculation(ABC):
+    __slots__ = ('a', 'b')
+
     def __init__(self, a: float, b: float) -> None:  # pragma: no cover
         self.a: float = a  # pragma: no cover
         self.b: float = b  # pragma: no cover
@@ -20,6 +22,7 @@ class Calculation(ABC):
 
 class CalculationFactory:
     _calculation = {}
+    _operations = {}
 
     @classmethod
     def register_calculation(cls, calculation_type: str):
@@ -27,6 +30,7 @@ class CalculationFactory:
             if calculation_type in cls._calculation:  # pragma: no cover
                 raise ValueError(f"Calculation type '{calculation_type}' is already part of calculations")  # pragma: no cover
             cls._calculation[calculation_type] = subclass
+            cls._operations[calculation_type] = subclass.operation
             return subclass
         return decorator
     
@@ -38,52 +42,77 @@ class CalculationFactory:
             raise ValueError(f"Unsupported calculation '{calculation_type}', Available: '{available_types}'")
         return calculation_class(a, b)
 
+    @classmethod
+    def dispatch_table(cls):
+        """Operator symbol to Operation function, kept in step with the registry."""
+        return cls._operations
+
 @CalculationFactory.register_calculation('+')
 class AddCalculation(Calculation):
+    operation = staticmethod(Operation.addition)
+
     def execute(self) -> float:
-        return Operation.addition(self.a, self.b)
+        return self.operation(self.a, self.b)
 
 @CalculationFactory.register_calculation('-')
 class SubtractCalculation(Calculation):
+    operation = staticmethod(Operation.subtraction)
+
     def execute(self) -> float:
-        return Operation.subtraction(self.a, self.b)
+        return self.operation(self.a, self.b)
 
 @CalculationFactory.register_calculation('/')
 class DivisionCalculation(Calculation):
+    operation = staticmethod(Operation.divide)
+
     def execute(self) -> float:
-        return Operation.divide(self.a, self.b)
+        return self.operation(self.a, self.b)
 
 @CalculationFactory.register_calculation('*')
 class MultiplyCalculation(Calculation):
+    operation = staticmethod(Operation.multiply)
+
     def execute(self) -> float:
-        return Operation.multiply(self.a, self.b)
+        return self.operation(self.a, self.b)
 
 @CalculationFactory.register_calculation('%')
 class ModuloCalculation(Calculation):
+    operation = staticmethod(Operation.modulo)
+
     def execute(self) -> float:
-        return Operation.modulo(self.a, self.b)
+        return self.operation(self.a, self.b)
 
 @CalculationFactory.register_calculation('^')
 class PowCalculation(Calculation):
+    operation = staticmethod(Operation.pow)
+
     def execute(self) -> float:
-        return Operation.pow(self.a, self.b)
+        return self.operation(self.a, self.b)
 
 @CalculationFactory.register_calculation('?')
 class RootCalculation(Calculation):
+    operation = staticmethod(Operation.root)
+
     def execute(self) -> float:
-        return Operation.root(self.a, self.b)
+        return self.operation(self.a, self.b)
 
 @CalculationFactory.register_calculation('//')
 class IntegerDivisionCalculation(Calculation):
+    operation = staticmethod(Operation.intDivide)
+
     def execute(self) -> float:
-        return Operation.intDivide(self.a, self.b)
+        return self.operation(self.a, self.b)
 
 @CalculationFactory.register_calculation('--')
 class AbsoluteDiffCalculation(Calculation):
+    operation = staticmethod(Operation.absSubtraction)
+
     def execute(self) -> float:
-        return Operation.absSubtraction(self.a, self.b)
+        return self.operation(self.a, self.b)
 
 @CalculationFactory.register_calculation('/%')
 class PercentageCalculation(Calculation):
+    operation = staticmethod(Operation.percentage)
+
     def execute(self) -> float:
-        return Operation.percentage(self.a, self.b)
+        return self.operation(self.a, self.b)
@@ -1,27 +1,25 @@
+import logging
 import sys
 import re
-from app.calculation import CalculationFactory
+from app.cache import operation_cache
+from app.compiler import compile_expression, plan_cache_info, clear_plan_cache, precedence, NUMBER, ANS
+from app.dependencies import reference_positions
 from app.logger import get_logger
 from app.memento import CalculationMemento, CalculationHistory
-from app.history import display_history, save_history, new_history, delete_calculation, load_history, HistoryDisplayObserver
+from app.stats import HistoryStatsObserver
+from app.history import display_history, display_history_page, display_history_head, display_history_tail, save_history, new_history, delete_calculation, load_history, show_dependencies, display_backups, display_matches, display_stats, display_observer_metrics, display_perf, HistoryDisplayObserver
 from app.exceptions import OperationError, CalculatorError, HistoryError
-from app.config import HISTORY_FILE_PATH
+from app.config import HISTORY_FILE_PATH, HISTORY_PAGE_SIZE, NUMERIC_MODE
+from app.perf import clock, perf, Profiler
 from colorama import init, Fore, Style
 
 init()
 log = get_logger("calculator")  # pragma: no cover
-precedence = {"1": ['+', '-', '--'], "2": ['*', '/', '%', '/%', '//'], "3": ['^', '?']}
-
-def get_precedence_group(operator):
-    for group, ops in precedence.items():
-        if operator in ops:
-            return group
-    return None
 
 def parse_ans_reference(token, history):
     try:
         if token == 'ans':
-            return history.get_previous_result(len(history.get_history()))
+            return history.get_previous_result(len(history))
         match = re.match(r'ans\((\d+)\)', token)
         if match:
             n = int(match.group(1))
@@ -39,104 +37,188 @@ def format_ans_token(token, value=None):
         return f"{token} ({value})"
     return token
 
+def resolve_references(plan, history):
+    """Look up the value of every ans token in *plan*, in evaluation order."""
+    return [parse_ans_reference(op[2], history) for op in plan.ops if op[0] == ANS]
+
+def evaluate_plan(plan, ans_values):
+    """Run a compiled plan and return the result with one memento per operator."""
+    stack = []
+    steps = []
+    values = iter(ans_values)
+    # Checked once per plan: the per-step messages are not even built unless DEBUG is on
+    debug = log.isEnabledFor(logging.DEBUG)
+    for op in plan.ops:
+        kind = op[0]
+        if kind == NUMBER:
+            stack.append((op[1], op[2]))
+        elif kind == ANS:
+            value = next(values)
+            stack.append((value, format_ans_token(op[2], value)))
+        else:
+            operator = op[1]
+            b, b_text = stack.pop()
+            a, a_text = stack.pop()
+            if debug:
+                log.debug(f"Processing {a} {operator} {b}")
+            result = operation_cache.execute(operator, a, b)
+            if debug:
+                log.debug(f"Current result: {result}")
+            steps.append(CalculationMemento(None, operator, a, b, result, a_text, b_text))
+            stack.append((result, None))
+    return stack[0][0], steps
+
+def numeric_exact(history):
+    """Whether expressions for *history* evaluate integers exactly: its own numeric mode, else NUMERIC_MODE."""
+    exact = getattr(history, 'exact', None)
+    return exact if isinstance(exact, bool) else NUMERIC_MODE == 'exact'
+
+def evaluate_expression(input_str, history):
+    """Compile and evaluate *input_str* in *history*'s numeric mode without recording it in history."""
+    start = clock()
+    plan = compile_expression(input_str, numeric_exact(history))
+    compiled = clock()
+    ans_values = resolve_references(plan, history)
+    resolved = clock()
+    evaluated = evaluate_plan(plan, ans_values)
+    perf.record('compile', compiled - start)
+    if ans_values:
+        perf.record('ans', resolved - compiled)
+    perf.record('evaluate', clock() - resolved)
+    return evaluated
+
 def calculate_expression(input_str, history):
     try:
-        log.debug(f"User entered input: {input_str}")
-        u_input_lst = input_str.strip().split()
-        
-        if len(u_input_lst) < 3 or len(u_input_lst) % 2 == 0:
-            log.error("Invalid format: Expected 'number operator number [operator number]...'")  # pragma: no cover
-            raise CalculatorError("Invalid format: Expected 'number operator number [operator number]...'")
-        
-        values = u_input_lst.copy()
-        try:
-            first_token = values.pop(0)
-            if first_token.startswith('ans'):
-                result = parse_ans_reference(first_token, history)
-                formatted_first_token = format_ans_token(first_token, result)
-            else:
-                result = float(first_token)
-                formatted_first_token = first_token
-            log.debug(f"Initial result: {result}")
-        except ValueError as e:
-            log.error(f"Invalid format: First value must be a number or ans(n), input {input_str}")  # pragma: no cover
-            raise CalculatorError("Invalid command: Input must start with a number or ans(n)")
-        
-        precedence_group = None
-        steps = []
-        original_input = [first_token]
-        formatted_input = [formatted_first_token] + values
-        while values:
-            if len(values) < 2:
-                log.error("Incomplete expression: Expected operator and number")  # pragma: no cover
-                raise CalculatorError("Incomplete expression: Expected operator and number")
-            
-            operator = values.pop(0)
-            original_input.append(operator)
-            formatted_input.append(operator)
-            current_group = get_precedence_group(operator)
-            if current_group is None:
-                log.warning(f"Unsupported operator detected: {operator}")  # pragma: no cover
-                raise OperationError(f"Unsupported operator {operator}. Only {', '.join(sum(precedence.values(), []))} allowed")
-            
-            if precedence_group is None:
-                precedence_group = current_group
-                log.debug(f"Set precedence group to {precedence_group}")
-            elif current_group != precedence_group:
-                log.warning(f"Mixed operator precedence detected: {operator} (group {current_group}) with group {precedence_group}")  # pragma: no cover
-                raise OperationError(f"Mixed operator precedence not allowed: Cannot use {operator} (group {current_group}) with group {precedence_group} operators")
-            
-            try:
-                next_token = values.pop(0)
-                original_input.append(next_token)
-                if next_token.startswith('ans'):
-                    num = parse_ans_reference(next_token, history)
-                    formatted_next_token = format_ans_token(next_token, num)
-                else:
-                    num = float(next_token)
-                    formatted_next_token = next_token
-                formatted_input.append(formatted_next_token)
-                log.debug(f"Processing {operator} {num}")
-            except ValueError as e:
-                log.error(f"Expected a number or ans(n) after operator: {str(e)}")  # pragma: no cover
-                raise CalculatorError(f"Expected a number or ans(n) after operator")
-            
-            try:
-                calc = CalculationFactory.create_calculation(operator, result, num)
-                result = calc.execute()
-                log.debug(f"Current result: {result}")
-                step_input = f"{formatted_input[0]} {operator} {formatted_next_token}"
-                formatted_input = [str(result)] + values
-                original_input = [str(result)] + values
-                memento = CalculationMemento(step_input, operator, calc.a, calc.b, result)
-                steps.append(memento)
-            except ValueError as ve:
-                log.error(f"Calculation error: {str(ve)}")  # pragma: no cover
-                raise OperationError(f"Calculation error: {str(ve)}")
-        
-        history.save_calculation_group(input_str, result, steps)
-        log.info(f"Final calculation result: {result}")
+        log.debug("User entered input: %s", input_str)
+        start = clock()
+        # ans(n) must still mean the same row when the result is saved, even if other processes share the history
+        with history.transaction():
+            result, steps = evaluate_expression(input_str, history)
+            history.save_calculation_group(input_str, result, steps)
+        perf.record('calculate', clock() - start)
+        log.info("Final calculation result: %s", result)
         return result
-    
+
     except (OperationError, CalculatorError, HistoryError) as e:
         log.warning(f"Invalid input: {str(e)}")
         raise
 
+def recalculate(history, n, input_str):
+    """Replace entry *n* with *input_str* and recompute only the entries that depend on it.
+
+    Returns the new result of entry *n* and the positions of the recomputed
+    dependents. Nothing is changed if any recomputation fails.
+    """
+    exact = numeric_exact(history)
+    plan = compile_expression(input_str, exact)
+    positions = reference_positions(input_str, n)
+    if any(not 0 < position < n for position in positions):
+        raise CalculatorError(f"ans references in an edit must point at calculations before {n}")
+    # The positions read here must still be the entries that are updated, even if other threads or processes change the history
+    with history.transaction():
+        result, steps = evaluate_plan(plan, [history.get_previous_result(position) for position in positions])
+        updates = [(n, input_str, result, steps)]
+        new_results = {n: result}
+        for position in history.downstream_of(n):
+            entry = history.get_entry(position)
+            values = [new_results[ref] if ref in new_results else history.get_previous_result(ref) for ref in history.references_of(position)]
+            try:
+                new_result, new_steps = evaluate_plan(compile_expression(entry['input'].lower(), exact), values)
+            except (OperationError, CalculatorError) as e:
+                raise OperationError(f"Cannot edit calculation {n}: dependent calculation {position} fails: {str(e)}")
+            new_results[position] = new_result
+            updates.append((position, entry['input'], new_result, new_steps))
+        history.update_calculations(updates)
+    log.info(f"Edited calculation {n}; recomputed {len(updates) - 1} dependents")
+    return result, [update[0] for update in updates[1:]]
+
+def history_command(history, args):
+    """Handle 'history [page] [size]', 'history head|tail [count]' and 'history range <first> <last>'."""
+    try:
+        if args and args[0] in ('head', 'tail'):
+            if len(args) > 2:
+                raise ValueError(f"too many arguments for 'history {args[0]}'")
+            count = int(args[1]) if len(args) == 2 else HISTORY_PAGE_SIZE
+            if count < 1:
+                raise ValueError("count must be positive")
+            show = display_history_head if args[0] == 'head' else display_history_tail
+            show(history, count)
+        elif args and args[0] == 'range':
+            if len(args) != 3:
+                raise ValueError("expected a first and last calculation")
+            display_history(history, int(args[1]), int(args[2]))
+        else:
+            if len(args) > 2:
+                raise ValueError("expected at most a page and a page size")
+            display_history_page(history, *(int(arg) for arg in args))
+    except ValueError as e:
+        print(f"{Fore.RED}Error: Invalid history command: {str(e)}{Style.RESET_ALL}")
+        print(f"{Fore.RED}Please use format: history [page] [size], history head [count], history tail [count] or history range <first> <last>{Style.RESET_ALL}")
+
+def search_command(history, command, text):
+    """Handle 'find <text>', 'find /<regex>/' and 'filter <term> [<term>...]'."""
+    # Imported here so that starting the calculator does not load the search indexes' NumPy dependency
+    from app.search import SearchQuery, parse_filter
+    try:
+        if command == 'find':
+            if len(text) > 1 and text.startswith('/') and text.endswith('/'):
+                query = SearchQuery(pattern=text[1:-1])
+            else:
+                query = SearchQuery(text=text)
+        else:
+            query = parse_filter(text.split())
+        if not query:
+            raise HistoryError("nothing to search for")
+    except (HistoryError, re.error) as e:
+        print(f"{Fore.RED}Error: Invalid {command} command: {str(e)}{Style.RESET_ALL}")
+        print(f"{Fore.RED}Please use format: find <text>, find /<regex>/ or filter result>=<n> result<<n> op=<operator> since=<date> until=<date> input~<text> regex=<pattern>{Style.RESET_ALL}")
+        return
+    display_matches(history, query)
+
+def profile_command(profiler, state):
+    """Start or stop the REPL profiler and report where the profile was written."""
+    if state == 'on':
+        if profiler.active:
+            print(f"{Fore.YELLOW}Profiling is already on{Style.RESET_ALL}")
+            return
+        profiler.start()
+        print(f"{Fore.GREEN}Profiling on; 'profile off' writes the profile{Style.RESET_ALL}")
+    elif state == 'off':
+        paths = profiler.stop()
+        if paths is None:
+            print(f"{Fore.YELLOW}Profiling is not on{Style.RESET_ALL}")
+            return
+        print(f"{Fore.GREEN}Profile written to {Fore.CYAN}{paths[0]}{Fore.GREEN} and collapsed stacks to {Fore.CYAN}{paths[1]}{Style.RESET_ALL}")
+    else:
+        print(f"{Fore.RED}Please use format: profile on or profile off{Style.RESET_ALL}")
+
 def calculator(history=None):
     if history is None:
         history = CalculationHistory(HISTORY_FILE_PATH)
     history.register_observer(HistoryDisplayObserver())
+    history_stats = HistoryStatsObserver(history)
+    # The statistics read the history on demand, so they must see every event before the next command
+    history.register_observer(history_stats, dispatch='sync')
+    profiler = Profiler()
     print(f"{Fore.BLUE}Welcome to Dom Urso's Calculator!{Style.RESET_ALL}")
     print(f"Enter calculations like '1 + 2 + 3' or 'ans(1) + 2', 'history' to view past calculations, or 'exit' to quit.")
     while True:
         try:
+            # Let asynchronously dispatched observers finish printing before the prompt
+            history.flush_observers()
+            # Time spent waiting at the prompt stays out of the profile
+            profiler.suspend()
             u_input = input(f"{Fore.BLUE}>> {Style.RESET_ALL}").strip().lower()
+            profiler.resume()
             if not u_input:
                 print(f"{Fore.RED}Please enter a calculation, 'history', 'save', 'new', 'delete <index>', 'load <filename>', or 'exit'{Style.RESET_ALL}")
                 continue
             
             if u_input == 'exit':
                 log.info("Exiting calculator")
+                if profiler.active:
+                    profile_command(profiler, 'off')
+                history.close()
                 print(f"{Fore.BLUE}Exiting the Calculator{Style.RESET_ALL}")
                 sys.exit(0)
             
@@ -144,6 +226,7 @@ def calculator(history=None):
                 print(f"{Fore.YELLOW}Welcome To Dom Urso's Calculator{Style.RESET_ALL}")
                 print(f"""
                     Enter calculations in the format: {Fore.GREEN}number operator number [operator number]...{Style.RESET_ALL}
+                    Operators follow the precedence groups below (higher groups bind tighter) and parentheses group sub-expressions, e.g., {Fore.GREEN}'(1 + 2) * 3'{Style.RESET_ALL}
                     Numbers can be numeric values or {Fore.GREEN}'ans(n)'{Style.RESET_ALL} (e.g., 'ans(1)' for the first calculation, 'ans(2)' for the second, etc.)
                     'ans' alone refers to the most recent calculation.
                     In history, ans(n) will show its resolved value in parentheses, e.g., {Fore.GREEN}'ans(1) (6.0) * 2'{Style.RESET_ALL}
@@ -158,16 +241,29 @@ def calculator(history=None):
                     {Fore.YELLOW}Commands:{Style.RESET_ALL}
                       {Fore.GREEN}help{Style.RESET_ALL} - display this help message
                       {Fore.GREEN}precedence{Style.RESET_ALL} - view operator precedence groupings
-                      {Fore.GREEN}history{Style.RESET_ALL} - view past calculations with steps
-                      {Fore.GREEN}save{Style.RESET_ALL} - save current history to a timestamped CSV file
+                      {Fore.GREEN}history [page] [size]{Style.RESET_ALL} - view past calculations with steps, one page at a time (e.g., 'history 2' or 'history 1 50')
+                      {Fore.GREEN}history head [count]{Style.RESET_ALL} / {Fore.GREEN}history tail [count]{Style.RESET_ALL} - view the first or last calculations
+                      {Fore.GREEN}history range <first> <last>{Style.RESET_ALL} - view calculations first to last (e.g., 'history range 10 20')
+                      {Fore.GREEN}save{Style.RESET_ALL} - save current history to a timestamped backup (CSV, or a snapshot with HISTORY_BACKUP_MODE=incremental)
                       {Fore.GREEN}new{Style.RESET_ALL} - start a new history (clears current history)
                       {Fore.GREEN}delete <index>{Style.RESET_ALL} - delete the calculation at the given index (e.g., 'delete 1')
-                      {Fore.GREEN}load <filename>{Style.RESET_ALL} - load history from a backup CSV file (e.g., 'load history_20250630_221858.csv')
+                      {Fore.GREEN}load <filename>{Style.RESET_ALL} - load history from a backup CSV file or snapshot (e.g., 'load history_20250630_221858.csv')
+                      {Fore.GREEN}backups{Style.RESET_ALL} - list backups and snapshots with their sizes
+                      {Fore.GREEN}find <text>{Style.RESET_ALL} / {Fore.GREEN}find /<regex>/{Style.RESET_ALL} - find calculations whose input contains text or matches a regex
+                      {Fore.GREEN}filter <term>...{Style.RESET_ALL} - filter by result, operator, time and input (e.g., 'filter result>=10 result<100 op=^ since=2025-06-30 input~ans')
+                      {Fore.GREEN}stats{Style.RESET_ALL} - show count, sum, mean, min/max, variance and per-operator counts ('stats verify' checks them against a full recompute)
+                      {Fore.GREEN}observers{Style.RESET_ALL} - show events delivered, dropped and coalesced and the latency of each history observer
+                      {Fore.GREEN}edit <index> <expression>{Style.RESET_ALL} - replace a calculation and recompute the calculations that use its result
+                      {Fore.GREEN}deps <index>{Style.RESET_ALL} - show which calculations a calculation uses and which use it
+                      {Fore.GREEN}cache{Style.RESET_ALL} - show operation and expression cache statistics ('cache clear' empties them)
+                      {Fore.GREEN}perf{Style.RESET_ALL} - show p50/p95/p99 latency of each calculation and history stage ('perf reset' clears them)
+                      {Fore.GREEN}profile on{Style.RESET_ALL} / {Fore.GREEN}profile off{Style.RESET_ALL} - profile the following commands and write a .pstats file and collapsed stacks for a flame graph
                       {Fore.GREEN}exit{Style.RESET_ALL} - exit the program
                     {Fore.YELLOW}Examples:{Style.RESET_ALL}
                       {Fore.GREEN}1 + 2 - 3{Style.RESET_ALL}
                       {Fore.GREEN}ans(1) * 2{Style.RESET_ALL}
                       {Fore.GREEN}ans + 5{Style.RESET_ALL}
+                      {Fore.GREEN}2 + 3 * (4 - 1){Style.RESET_ALL}
                       {Fore.GREEN}25 ? 2{Style.RESET_ALL} (square root)
                       {Fore.GREEN}delete 1{Style.RESET_ALL}
                       {Fore.GREEN}load history_20250630_221858.csv{Style.RESET_ALL}
@@ -178,8 +274,37 @@ def calculator(history=None):
                 print(f"{Fore.YELLOW}Precedence groups define the order of operations:{Style.RESET_ALL}\n{precedence}")
                 continue
             
-            if u_input == 'history':
-                display_history(history)
+            if u_input == 'cache':
+                stats = operation_cache.stats()
+                plans = plan_cache_info()
+                print(f"{Fore.YELLOW}Operation cache:{Style.RESET_ALL} {stats['size']}/{stats['maxsize']} entries, "
+                      f"{stats['hits']} hits, {stats['misses']} misses, {stats['evictions']} evictions "
+                      f"({stats['hit_rate']:.1%} hit rate)")
+                print(f"{Fore.YELLOW}Expression cache:{Style.RESET_ALL} {plans.currsize}/{plans.maxsize} plans, "
+                      f"{plans.hits} hits, {plans.misses} misses")
+                continue
+
+            if u_input == 'cache clear':
+                operation_cache.clear()
+                clear_plan_cache()
+                print(f"{Fore.GREEN}Cleared the operation and expression caches{Style.RESET_ALL}")
+                continue
+
+            if u_input == 'perf':
+                display_perf(perf.summary())
+                continue
+
+            if u_input == 'perf reset':
+                perf.reset()
+                print(f"{Fore.GREEN}Cleared the stage timings{Style.RESET_ALL}")
+                continue
+
+            if u_input.startswith('profile'):
+                profile_command(profiler, u_input[len('profile'):].strip())
+                continue
+
+            if u_input == 'history' or u_input.startswith('history '):
+                history_command(history, u_input.split()[1:])
                 continue
             
             if u_input == 'save':
@@ -189,6 +314,23 @@ def calculator(history=None):
             if u_input == 'new':
                 new_history(history)
                 continue
+
+            if u_input.startswith('find ') or u_input.startswith('filter '):
+                command, text = u_input.split(' ', 1)
+                search_command(history, command, text.strip())
+                continue
+
+            if u_input in ('stats', 'stats verify'):
+                display_stats(history_stats, verify=u_input == 'stats verify')
+                continue
+
+            if u_input == 'observers':
+                display_observer_metrics(history)
+                continue
+
+            if u_input == 'backups':
+                display_backups(history)
+                continue
             
             if u_input.startswith('delete '):
                 try:
@@ -203,6 +345,32 @@ def calculator(history=None):
                     print(f"{Fore.RED}Please use format: delete <index> (e.g., 'delete 1'){Style.RESET_ALL}")
                 continue
             
+            if u_input.startswith('deps '):
+                try:
+                    show_dependencies(history, int(u_input.split(' ', 1)[1].strip()))
+                except ValueError as e:
+                    print(f"{Fore.RED}Error: Invalid index format: {str(e)}{Style.RESET_ALL}")
+                    print(f"{Fore.RED}Please use format: deps <index> (e.g., 'deps 1'){Style.RESET_ALL}")
+                except HistoryError as e:
+                    print(f"{Fore.RED}Error: {str(e)}{Style.RESET_ALL}")
+                continue
+
+            if u_input.startswith('edit '):
+                parts = u_input.split(' ', 2)
+                try:
+                    if len(parts) < 3:
+                        raise ValueError("missing expression")
+                    index = int(parts[1])
+                except ValueError as e:
+                    print(f"{Fore.RED}Error: Invalid edit command: {str(e)}{Style.RESET_ALL}")
+                    print(f"{Fore.RED}Please use format: edit <index> <expression> (e.g., 'edit 1 2 + 3'){Style.RESET_ALL}")
+                    continue
+                result, recomputed = recalculate(history, index, parts[2])
+                print(f"{Fore.GREEN}Result: {result}{Style.RESET_ALL}")
+                if recomputed:
+                    print(f"{Fore.GREEN}Recomputed dependent calculations: {Fore.CYAN}{', '.join(map(str, recomputed))}{Style.RESET_ALL}")
+                continue
+
             if u_input.startswith('load '):
                 try:
                     filename = u_input.split(' ', 1)[1].strip()
@@ -212,13 +380,6 @@ def calculator(history=None):
                     print(f"{Fore.RED}Please use format: load <filename> (e.g., 'load history_20250630_221858.csv'){Style.RESET_ALL}")
                 continue
             
-            try:
-                first_token = u_input.split()[0]
-                if not (first_token.startswith('ans') or float(first_token)):
-                    raise CalculatorError("Invalid command: Input must start with a number or ans(n)")
-            except (ValueError, IndexError) as e:
-                raise CalculatorError(f"Invalid command: Input must start with a number or ans(n)")
-            
             result = calculate_expression(u_input, history)
             print(f"{Fore.GREEN}Result: {result}{Style.RESET_ALL}")
         
@@ -0,0 +1,156 @@
+import re
+from functools import lru_cache
+from typing import NamedTuple
+from app.calculation import CalculationFactory
+from app.config import EXPRESSION_CACHE_SIZE, NUMERIC_MODE
+from app.exceptions import CalculatorError, OperationError
+
+precedence = {"1": ['+', '-', '--'], "2": ['*', '/', '%', '/%', '//'], "3": ['^', '?']}
+
+# Plan instructions
+NUMBER = 0
+ANS = 1
+APPLY = 2
+
+NUMBER_PATTERN = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+INTEGER_PATTERN = re.compile(r'[-+]?\d+')
+ANS_PATTERN = re.compile(r'ans(?:\((\d+)\))?(?![\w(])')
+UNKNOWN_OPERATOR_PATTERN = re.compile(r'[^\s\d()]+')
+
+INVALID_FORMAT = "Invalid format: Expected 'number operator number [operator number]...'"
+
+class CompiledExpression(NamedTuple):
+    """A parsed expression ready for evaluation.
+
+    *ops* is a postfix program of ``(NUMBER, value, text)``, ``(ANS, n, text)``
+    and ``(APPLY, operator)`` instructions; *references* lists the ans tokens
+    in the order they are pushed (``None`` for a bare ``ans``).
+    """
+    text: str
+    ops: tuple
+    references: tuple
+
+def operator_precedence(operator):
+    """Return the binding strength of *operator*; unlisted operators bind loosest."""
+    for group, ops in precedence.items():
+        if operator in ops:
+            return int(group)
+    return 1
+
+def supported_operators():
+    listed = sum(precedence.values(), [])
+    return listed + [op for op in CalculationFactory._calculation if op not in listed]
+
+def number_value(literal, exact=False):
+    """The value of a number literal: an int for integer literals when *exact*, otherwise a float."""
+    if exact and INTEGER_PATTERN.fullmatch(literal):
+        return int(literal)
+    return float(literal)
+
+def tokenize(text, exact=False):
+    """Split *text* into ``(kind, value, text)`` tokens, with kind one of number, ans, op, ( and )."""
+    operators = sorted(CalculationFactory._calculation, key=len, reverse=True)
+    tokens = []
+    expect_operand = True
+    pos = 0
+    length = len(text)
+    while pos < length:
+        char = text[pos]
+        if char.isspace():
+            pos += 1
+            continue
+        if expect_operand:
+            if char == '(':
+                tokens.append(('(', None, char))
+                pos += 1
+                continue
+            match = NUMBER_PATTERN.match(text, pos)
+            if match:
+                tokens.append(('number', number_value(match.group(), exact), match.group()))
+                pos = match.end()
+                expect_operand = False
+                continue
+            match = ANS_PATTERN.match(text, pos)
+            if match:
+                n = match.group(1)
+                tokens.append(('ans', int(n) if n is not None else None, match.group()))
+                pos = match.end()
+                expect_operand = False
+                continue
+            chunk = text[pos:].split()[0]
+            if chunk.startswith('ans'):
+                raise CalculatorError(f"Invalid ans reference: {chunk}")
+            if all(token[0] == '(' for token in tokens):
+                raise CalculatorError("Invalid command: Input must start with a number or ans(n)")
+            raise CalculatorError("Expected a number or ans(n) after operator")
+        if char == ')':
+            tokens.append((')', None, char))
+            pos += 1
+            continue
+        for operator in operators:
+            if text.startswith(operator, pos):
+                tokens.append(('op', operator, operator))
+                pos += len(operator)
+                expect_operand = True
+                break
+        else:
+            match = UNKNOWN_OPERATOR_PATTERN.match(text, pos)
+            if match is None:
+                raise CalculatorError(INVALID_FORMAT)
+            raise OperationError(f"Unsupported operator {match.group()}. Only {', '.join(supported_operators())} allowed")
+    if expect_operand:
+        raise CalculatorError(INVALID_FORMAT)
+    return tokens
+
+def parse(tokens):
+    """Convert infix tokens into a postfix program using the shunting-yard algorithm."""
+    output = []
+    stack = []
+    for kind, value, text in tokens:
+        if kind == 'number':
+            output.append((NUMBER, value, text))
+        elif kind == 'ans':
+            output.append((ANS, value, text))
+        elif kind == 'op':
+            strength = operator_precedence(value)
+            while stack and stack[-1] != '(' and operator_precedence(stack[-1]) >= strength:
+                output.append((APPLY, stack.pop()))
+            stack.append(value)
+        elif kind == '(':
+            stack.append('(')
+        else:
+            while stack and stack[-1] != '(':
+                output.append((APPLY, stack.pop()))
+            if not stack:
+                raise CalculatorError("Unbalanced parentheses: unexpected ')'")
+            stack.pop()
+    while stack:
+        operator = stack.pop()
+        if operator == '(':
+            raise CalculatorError("Unbalanced parentheses: missing ')'")
+        output.append((APPLY, operator))
+    return output
+
+@lru_cache(maxsize=EXPRESSION_CACHE_SIZE)
+def _compile(text, exact):
+    ops = parse(tokenize(text, exact))
+    if not any(op[0] == APPLY for op in ops):
+        raise CalculatorError(INVALID_FORMAT)
+    references = tuple(op[1] for op in ops if op[0] == ANS)
+    return CompiledExpression(text, tuple(ops), references)
+
+def normalize(text):
+    return ' '.join(text.split())
+
+def compile_expression(text, exact=NUMERIC_MODE == 'exact'):
+    """Compile *text* into a CompiledExpression, reusing cached plans for repeated input.
+
+    With *exact*, integer literals are compiled to ints instead of floats.
+    """
+    return _compile(normalize(text), exact)
+
+def plan_cache_info():
+    return _compile.cache_info()
+
+def clear_plan_cache():
+    _compile.cache_clear()
@@ -1,13 +1,117 @@
 import os
 
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Settings may come from a .env file in the project root; it is loaded here, before any
+# setting is read, because this module is imported before the logger. Variables already
+# set in the environment win.
+DOTENV_PATH = os.path.join(PROJECT_ROOT, '.env')
+if os.path.isfile(DOTENV_PATH):
+    from dotenv import load_dotenv  # Only pay for python-dotenv when there is a .env file
+    load_dotenv(DOTENV_PATH)
+
 # Directory for history files relative to project root
-HISTORY_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'logs')
+HISTORY_DIR = os.path.join(PROJECT_ROOT, 'logs')
+
+# Format the history file is written in: 'csv' or 'binary' (memory-mapped columns,
+# see app/binary.py); either format is recognised when reading
+HISTORY_FORMAT = os.getenv('HISTORY_FORMAT', 'csv').lower()
 
 # History file name
-HISTORY_FILE = 'calculation_history.csv'
+HISTORY_FILE = 'calculation_history.bin' if HISTORY_FORMAT == 'binary' else 'calculation_history.csv'
 
 # Full path to history file
 HISTORY_FILE_PATH = os.path.join(HISTORY_DIR, HISTORY_FILE)
 
 # Backup directory for history files
 HISTORY_BACKUP_DIR = os.path.join(HISTORY_DIR, 'history_backups')
+
+# Backups: 'csv' writes a full CSV per save, 'incremental' stores compressed deltas against
+# the previous snapshot listed in a manifest (see app/backups.py). Compression is 'zlib' or
+# 'lzma'; a full snapshot starts a new delta chain every HISTORY_BACKUP_FULL_INTERVAL saves
+HISTORY_BACKUP_MODE = os.getenv('HISTORY_BACKUP_MODE', 'csv').lower()
+HISTORY_BACKUP_COMPRESSION = os.getenv('HISTORY_BACKUP_COMPRESSION', 'zlib').lower()
+HISTORY_BACKUP_FULL_INTERVAL = int(os.getenv('HISTORY_BACKUP_FULL_INTERVAL', '10'))
+
+# History storage mode: 'csv' rewrites the history file on every change,
+# 'journal' appends changes to a journal file and compacts it periodically,
+# 'sqlite' keeps the rows in an SQLite database (WAL mode) next to the history file
+HISTORY_STORAGE_MODE = os.getenv('HISTORY_STORAGE_MODE', 'csv').lower()
+
+# Suffix of the journal file kept next to the history file in journal mode
+HISTORY_JOURNAL_SUFFIX = '.journal'
+
+# Minimum number of journal records before the journal is compacted into the history file
+# (compaction also waits until the journal holds at least as many records as the history has rows)
+HISTORY_JOURNAL_COMPACT_THRESHOLD = int(os.getenv('HISTORY_JOURNAL_COMPACT_THRESHOLD', '1000'))
+
+# Suffix of the SQLite database kept next to the history file in sqlite mode, and the
+# number of pooled read connections (reads run alongside the writer in WAL mode)
+HISTORY_DATABASE_SUFFIX = '.db'
+HISTORY_DATABASE_READERS = int(os.getenv('HISTORY_DATABASE_READERS', '4'))
+
+# Shared histories: several calculator processes may use the same history file. Every change
+# then holds an advisory lock on the history file plus HISTORY_LOCK_SUFFIX and first picks up
+# what the other processes changed (needs HISTORY_WRITE_MODE=sync)
+HISTORY_SHARED = os.getenv('HISTORY_SHARED', 'false').lower() in ('1', 'true', 'yes')
+HISTORY_LOCK_SUFFIX = '.lock'
+
+# Numbers: 'float' evaluates every operand as a float, 'exact' keeps integer literals as Python
+# ints so +, -, *, //, %, ^ and exact roots and divisions of integers stay exact at any size
+# (falling back to float otherwise). Int results may not exceed EXACT_INT_MAX_BITS bits; the
+# default keeps them under Python's 4300-digit limit for converting ints to text
+NUMERIC_MODE = os.getenv('NUMERIC_MODE', 'float').lower()
+EXACT_INT_MAX_BITS = int(os.getenv('EXACT_INT_MAX_BITS', '14000'))
+
+# Maximum number of compiled expression plans kept in the LRU cache
+EXPRESSION_CACHE_SIZE = int(os.getenv('EXPRESSION_CACHE_SIZE', '1024'))
+
+# Number of batch results committed to history with a single write
+BATCH_CHUNK_SIZE = int(os.getenv('BATCH_CHUNK_SIZE', '1000'))
+
+# Parallel batch evaluation: worker processes (0 = one per CPU), expressions per
+# task and maximum number of tasks in flight (0 = twice the worker count)
+PARALLEL_WORKERS = int(os.getenv('PARALLEL_WORKERS', '0'))
+PARALLEL_CHUNK_SIZE = int(os.getenv('PARALLEL_CHUNK_SIZE', '1000'))
+PARALLEL_MAX_PENDING = int(os.getenv('PARALLEL_MAX_PENDING', '0'))
+
+# Memoization of operator results: maximum cached (operator, a, b) entries (0 disables
+# the cache) and the operators whose results are cached ('all' for every operator)
+OPERATION_CACHE_SIZE = int(os.getenv('OPERATION_CACHE_SIZE', '4096'))
+OPERATION_CACHE_OPERATORS = os.getenv('OPERATION_CACHE_OPERATORS', '^,?')
+
+# Fast start: read the history file on first use instead of at startup
+FAST_START = os.getenv('FAST_START', 'false').lower() in ('1', 'true', 'yes')
+
+# History display: calculations per page of the 'history' command and lines per bulk write
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', '20'))
+HISTORY_WRITE_BUFFER_LINES = int(os.getenv('HISTORY_WRITE_BUFFER_LINES', '256'))
+
+# History writes: 'sync' writes before each command returns, 'async' hands changes to a
+# background writer that groups bursts into one write. The durability policy decides when
+# the writer fsyncs: after every write ('always'), every HISTORY_FSYNC_INTERVAL seconds
+# ('interval') or only on flush, save and exit ('exit')
+HISTORY_WRITE_MODE = os.getenv('HISTORY_WRITE_MODE', 'sync').lower()
+HISTORY_DURABILITY = os.getenv('HISTORY_DURABILITY', 'always').lower()
+HISTORY_FSYNC_INTERVAL = float(os.getenv('HISTORY_FSYNC_INTERVAL', '1.0'))
+
+# Observer dispatch: 'sync' calls each observer inside the history change, 'async' delivers
+# events from a bounded queue per observer on a worker thread. When a queue holds
+# OBSERVER_QUEUE_SIZE events, OBSERVER_OVERFLOW decides: 'block' waits for room,
+# 'drop-oldest' discards the oldest queued event and 'coalesce' replaces the newest queued
+# event of the same kind. Observers with update_batch() get up to OBSERVER_BATCH_SIZE events per call
+OBSERVER_DISPATCH = os.getenv('OBSERVER_DISPATCH', 'sync').lower()
+OBSERVER_QUEUE_SIZE = int(os.getenv('OBSERVER_QUEUE_SIZE', '1024'))
+OBSERVER_OVERFLOW = os.getenv('OBSERVER_OVERFLOW', 'block').lower()
+OBSERVER_BATCH_SIZE = int(os.getenv('OBSERVER_BATCH_SIZE', '64'))
+
+# Calculation server (python -m app.server or main.py --serve): address to listen on and the
+# maximum pipelined requests in flight per connection
+SERVER_HOST = os.getenv('SERVER_HOST', '127.0.0.1')
+SERVER_PORT = int(os.getenv('SERVER_PORT', '8765'))
+SERVER_MAX_PIPELINE = int(os.getenv('SERVER_MAX_PIPELINE', '64'))
+
+# Hot-path timing: per-stage latency histograms shown by the 'perf' command, and the
+# directory that 'profile off' writes its .pstats and collapsed-stack (.folded) files to
+PERF_TIMING = os.getenv('PERF_TIMING', 'true').lower() in ('1', 'true', 'yes')
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(HISTORY_DIR, 'profiles'))
@@ -0,0 +1,281 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from app.config import HISTORY_DATABASE_SUFFIX, HISTORY_DATABASE_READERS
+from app.exceptions import HistoryError
+from app.logger import get_logger
+from app.numeric import approximate
+from app.storage import StorageBackend
+
+logger = get_logger("database")  # pragma: no cover
+
+MAGIC = b'SQLite format 3\x00'
+
+SCHEMA = (
+    # position is the 1-based history position, so ans(n) is a primary key lookup
+    "CREATE TABLE IF NOT EXISTS history ("
+    "position INTEGER PRIMARY KEY, input TEXT NOT NULL, result REAL, exact TEXT, timestamp TEXT, steps TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS history_timestamp ON history (timestamp)",
+    "CREATE INDEX IF NOT EXISTS history_result ON history (result)",
+    # generation changes with every change other than an append; see SqliteStorage.changes
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+)
+
+# Constant SQL text, so sqlite3's statement cache prepares each statement once per connection
+INSERT = "INSERT INTO history (position, input, result, exact, timestamp, steps) VALUES (?, ?, ?, ?, ?, ?)"
+APPEND = "INSERT INTO history (position, input, result, exact, timestamp, steps) " \
+         "VALUES ((SELECT COALESCE(MAX(position), 0) + 1 FROM history), ?, ?, ?, ?, ?)"
+UPDATE = "UPDATE history SET input = ?, result = ?, exact = ?, timestamp = ?, steps = ? WHERE position = ?"
+DELETE = "DELETE FROM history WHERE position = ?"
+# Two passes through negative positions keep every intermediate position unique
+SHIFT_OUT = "UPDATE history SET position = -position WHERE position > ?"
+SHIFT_IN = "UPDATE history SET position = -position - 1 WHERE position < 0"
+RESET = "DELETE FROM history"
+# A random generation cannot repeat one that another process saw before a restore
+NEW_GENERATION = "REPLACE INTO meta (key, value) VALUES ('generation', random())"
+VERSION = "SELECT (SELECT value FROM meta WHERE key = 'generation'), (SELECT COALESCE(MAX(position), 0) FROM history)"
+ROWS_AFTER = "SELECT input, result, exact, timestamp, steps FROM history WHERE position > ? ORDER BY position"
+SIZE = "SELECT COALESCE(MAX(position), 0) FROM history"
+RESULT = "SELECT result, exact FROM history WHERE position = ?"
+ROW = "SELECT input, result, exact, timestamp, steps FROM history WHERE position = ?"
+ROWS = "SELECT input, result, exact, timestamp, steps FROM history ORDER BY position"
+
+def is_database(path):
+    """True if *path* is an SQLite database file."""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+def _result_columns(result):
+    """The (result, exact) column values: exact ints keep their digits next to the float approximation."""
+    if result.__class__ is int:
+        return approximate(result), str(result)
+    return result, None
+
+def _result(result, exact):
+    if exact is not None:
+        return int(exact)
+    # SQLite stores NaN as NULL
+    return float('nan') if result is None else result
+
+def _encode_steps(steps):
+    return steps if isinstance(steps, str) else json.dumps(steps if isinstance(steps, list) else [])
+
+def _record_values(record):
+    result, exact = _result_columns(record['result'])
+    return record['input'], result, exact, record.get('timestamp'), _encode_steps(record.get('steps'))
+
+def _read_rows(connection):
+    """Build a HistoryStore from every row; steps stay JSON text until a row is read."""
+    from app.store import HistoryStore
+    inputs, results, timestamps, steps = [], [], [], []
+    for input_str, result, exact, timestamp, raw_steps in connection.execute(ROWS):
+        inputs.append(input_str)
+        results.append(_result(result, exact))
+        timestamps.append(timestamp)
+        steps.append(raw_steps)
+    return HistoryStore.from_columns(inputs, results, timestamps, steps)
+
+def read_database(path):
+    """Read a history database (e.g. a backup) into a new store without modifying it."""
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        return _read_rows(connection)
+    finally:
+        connection.close()
+
+class SqliteStorage(StorageBackend):
+    """History rows in an SQLite database in WAL mode.
+
+    One writer connection applies each batch of mutation records in a single
+    ``BEGIN IMMEDIATE`` transaction; reads go through a pool of up to
+    *readers* connections, which WAL lets run alongside the writer. Rows are
+    keyed by their 1-based position, so ``result`` is an indexed point
+    lookup; deletes renumber the rows after the deleted one. The version is
+    (generation, row count), where the generation changes with every change
+    except appends, so appends by other processes are read row by row. Exact int
+    results are kept as decimal text next to their float approximation.
+    With *sync*, commits use ``synchronous=FULL`` and are durable once
+    ``apply`` returns; otherwise ``NORMAL``, which WAL keeps crash-safe.
+    """
+
+    backup_suffix = HISTORY_DATABASE_SUFFIX
+
+    def __init__(self, history_file, readers=HISTORY_DATABASE_READERS, sync=True):
+        self.path = history_file + HISTORY_DATABASE_SUFFIX
+        self.created = not os.path.exists(self.path)
+        self.synchronous = 'FULL' if sync else 'NORMAL'
+        self._lock = threading.Lock()
+        self._readers = queue.Queue(max(readers, 1))
+        try:
+            self._connection = self._connect()
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            with self._transaction() as connection:
+                for statement in SCHEMA:
+                    connection.execute(statement)
+        except sqlite3.Error as e:
+            logger.error(f"Failed to open history database {self.path}: {str(e)}")
+            raise HistoryError(f"Failed to open history database: {str(e)}")
+
+    def _connect(self):
+        # Connections are shared between threads, never used by two at once
+        connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        connection.execute(f"PRAGMA synchronous={self.synchronous}")
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            connection = self._connection
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    @contextmanager
+    def _reader(self):
+        try:
+            connection = self._readers.get_nowait()
+        except queue.Empty:
+            connection = self._connect()
+        try:
+            yield connection
+        finally:
+            try:
+                self._readers.put_nowait(connection)
+            except queue.Full:
+                connection.close()
+
+    def __len__(self):
+        with self._reader() as connection:
+            return connection.execute(SIZE).fetchone()[0]
+
+    def result(self, index):
+        with self._reader() as connection:
+            found = connection.execute(RESULT, (index + 1,)).fetchone()
+        if found is None:
+            raise IndexError(f"History row {index} out of range")
+        return _result(*found)
+
+    def row(self, index):
+        with self._reader() as connection:
+            found = connection.execute(ROW, (index + 1,)).fetchone()
+        if found is None:
+            raise IndexError(f"History row {index} out of range")
+        input_str, result, exact, timestamp, steps = found
+        return {'input': input_str, 'result': _result(result, exact), 'timestamp': timestamp, 'steps': json.loads(steps)}
+
+    def load(self):
+        with self._reader() as connection:
+            return _read_rows(connection)
+
+    def apply(self, records):
+        if not records:
+            return
+        try:
+            with self._transaction() as connection:
+                adds = []
+                if any(record.get('op') != 'add' for record in records):
+                    connection.execute(NEW_GENERATION)
+                for record in records:
+                    op = record.get('op')
+                    if op == 'add':
+                        # Consecutive adds go in as one executemany
+                        adds.append(_record_values(record))
+                        continue
+                    if adds:
+                        connection.executemany(APPEND, adds)
+                        adds = []
+                    if op == 'update':
+                        connection.execute(UPDATE, (*_record_values(record), record['index']))
+                    elif op == 'delete':
+                        connection.execute(DELETE, (record['index'],))
+                        connection.execute(SHIFT_OUT, (record['index'],))
+                        connection.execute(SHIFT_IN)
+                    elif op == 'reset':
+                        connection.execute(RESET)
+                    else:
+                        raise HistoryError(f"Unknown history record '{op}'")
+                if adds:
+                    connection.executemany(APPEND, adds)
+        except sqlite3.Error as e:
+            logger.error(f"Failed to write {len(records)} records to {self.path}: {str(e)}")
+            raise HistoryError(f"Failed to write history database: {str(e)}")
+
+    def snapshot(self, store):
+        values = store.result_values()
+        rows = []
+        for index in range(len(store)):
+            result, exact = _result_columns(values[index])
+            rows.append((index + 1, store.input(index), result, exact, store.timestamp(index), _encode_steps(store.raw_steps(index))))
+        return lambda: self.replace_rows(rows)
+
+    def replace_rows(self, rows):
+        try:
+            with self._transaction() as connection:
+                connection.execute(RESET)
+                connection.executemany(INSERT, rows)
+                connection.execute(NEW_GENERATION)
+        except sqlite3.Error as e:
+            logger.error(f"Failed to replace the rows of {self.path}: {str(e)}")
+            raise HistoryError(f"Failed to write history database: {str(e)}")
+
+    def backup(self, path):
+        """Copy the database to *path* with the online backup API; the copy uses a rollback journal."""
+        temporary = path + '.tmp'
+        target = sqlite3.connect(temporary)
+        try:
+            with self._lock:
+                self._connection.backup(target)
+            target.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            target.close()
+        os.replace(temporary, path)
+
+    def is_backup(self, path):
+        return is_database(path)
+
+    def restore(self, path):
+        source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            if source.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'history'").fetchone() is None:
+                raise HistoryError(f"{os.path.basename(path)} is not a history database")
+            with self._lock:
+                source.backup(self._connection)
+                self._connection.execute("PRAGMA journal_mode=WAL")
+            with self._transaction() as connection:
+                # Backups from before a schema change get the missing tables
+                for statement in SCHEMA:
+                    connection.execute(statement)
+                connection.execute(NEW_GENERATION)
+        finally:
+            source.close()
+
+    def version(self):
+        with self._reader() as connection:
+            return connection.execute(VERSION).fetchone()
+
+    def changes(self, seen, version):
+        if seen is None or seen[0] != version[0] or version[1] < seen[1]:
+            return None
+        with self._reader() as connection:
+            found = connection.execute(ROWS_AFTER, (seen[1],)).fetchall()
+        return [{'op': 'add', 'input': input_str, 'result': _result(result, exact), 'timestamp': timestamp, 'steps': steps}
+                for input_str, result, exact, timestamp, steps in found]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                return
@@ -0,0 +1,88 @@
+import re
+from collections import deque
+from app.compiler import compile_expression, ANS_PATTERN
+from app.exceptions import CalculatorError, OperationError
+
+ANS_TOKEN_PATTERN = re.compile(ANS_PATTERN.pattern, re.IGNORECASE)
+
+def reference_positions(input_str, position):
+    """Return the 1-based history positions referenced by the ans tokens of *input_str*.
+
+    *position* is the 1-based position of the entry itself; a bare ``ans``
+    refers to the entry just before it. Inputs that do not compile have no references.
+    """
+    if 'ans' not in input_str.lower():
+        return []
+    try:
+        references = compile_expression(input_str.lower()).references
+    except (CalculatorError, OperationError):
+        return []
+    return [position - 1 if n is None else n for n in references]
+
+def rewrite_references(input_str, position, targets):
+    """Rewrite the ans tokens of *input_str* so they point at *targets*.
+
+    *targets* holds, per ans token in order, either the new 1-based position of
+    the referenced entry or ``(None, value)`` when that entry no longer exists,
+    in which case the token is replaced by the value itself.
+    """
+    targets = iter(targets)
+
+    def replace(match):
+        target = next(targets, None)
+        if isinstance(target, tuple):
+            return str(target[1])
+        if target is None or (match.group(1) is None and target == position - 1):
+            return match.group(0)
+        return f"ans({target})"
+    return ANS_TOKEN_PATTERN.sub(replace, input_str)
+
+class DependencyIndex:
+    """Edges between history entries created by ans(n) references.
+
+    Entries are identified by their stable store ids, so edges survive deletes
+    of unrelated entries. ``references`` maps an entry to the ids it reads (in
+    ans-token order) and ``dependents`` is the reverse index.
+    """
+
+    def __init__(self):
+        self.references = {}
+        self.dependents = {}
+
+    def __len__(self):
+        return len(self.references)
+
+    def add(self, entry_id, referenced_ids):
+        referenced_ids = tuple(referenced_ids)
+        if not referenced_ids:
+            return
+        self.references[entry_id] = referenced_ids
+        for referenced_id in referenced_ids:
+            self.dependents.setdefault(referenced_id, set()).add(entry_id)
+
+    def remove(self, entry_id):
+        """Forget the edges going out of *entry_id*; edges pointing at it are kept."""
+        for referenced_id in self.references.pop(entry_id, ()):
+            dependents = self.dependents.get(referenced_id)
+            if dependents is not None:
+                dependents.discard(entry_id)
+                if not dependents:
+                    del self.dependents[referenced_id]
+
+    def clear(self):
+        self.references.clear()
+        self.dependents.clear()
+
+    def direct_dependents(self, entry_id):
+        return set(self.dependents.get(entry_id, ()))
+
+    def downstream(self, entry_id):
+        """Return every entry that transitively depends on *entry_id*."""
+        seen = set()
+        queue = deque([entry_id])
+        while queue:
+            for dependent in self.dependents.get(queue.popleft(), ()):
+                if dependent not in seen:
+                    seen.add(dependent)
+                    queue.append(dependent)
+        return seen
@@ -1,9 +1,10 @@
 from app.exceptions import HistoryError
 from app.logger import get_logger
-from app.config import HISTORY_BACKUP_DIR
+from app.config import HISTORY_PAGE_SIZE, HISTORY_WRITE_BUFFER_LINES
 from app.observer import Observer
 from colorama import Fore, Style
 import json
+import sys
 
 logger = get_logger("history")
 
@@ -22,25 +23,98 @@ class HistoryDisplayObserver(Observer):
             print(f"{Fore.GREEN}Deleted calculation {Fore.CYAN}{data['index']}{Style.RESET_ALL}")
         elif event == "history_loaded":
             print(f"{Fore.GREEN}Loaded history from {Fore.CYAN}{data['filename']}{Style.RESET_ALL}")
+        elif event == "calculation_updated":
+            print(f"{Fore.GREEN}Updated calculation {Fore.CYAN}{data['index']}{Style.RESET_ALL}: {data['input']} = {data['result']}")
 
-def display_history(history):
-    """Display the calculation history with colored output."""
+def row_lines(position, row):
+    """Yield the display lines of one calculation and its steps."""
+    yield f"{Fore.CYAN}{position}.{Style.RESET_ALL} {Fore.YELLOW}{row['timestamp']}{Style.RESET_ALL}: {Fore.GREEN}{row['input']}{Style.RESET_ALL} = {Fore.YELLOW}{row['result']}{Style.RESET_ALL}\n"
+    steps = json.loads(row['steps']) if isinstance(row['steps'], str) else row['steps']
+    for step_idx, step in enumerate(steps, 1):
+        yield f"   Step {Fore.CYAN}{step_idx}{Style.RESET_ALL}: {step['input']} = {Fore.YELLOW}{step['result']}{Style.RESET_ALL}\n"
+
+def history_lines(history, first, last):
+    """Yield the display lines for calculations *first* to *last* (1-based, inclusive).
+
+    Rows are fetched one at a time, so only the steps of the displayed rows are decoded.
+    """
+    yield f"{Fore.YELLOW}Calculation History:{Style.RESET_ALL}\n"
+    for position, row in history.rows(first, last):
+        yield from row_lines(position, row)
+
+def write_lines(lines, buffer_lines=HISTORY_WRITE_BUFFER_LINES):
+    """Write *lines* to stdout in bulk, one write per *buffer_lines* lines."""
+    stream = sys.stdout
+    buffer = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) >= buffer_lines:
+            stream.write(''.join(buffer))
+            buffer.clear()
+    if buffer:
+        stream.write(''.join(buffer))
+    stream.flush()
+
+def display_history(history, first=1, last=None):
+    """Display calculations *first* to *last* (1-based, inclusive; the whole history by default) with colored output.
+
+    Returns the displayed (first, last, total), or None for an empty history.
+    """
     try:
-        if history.get_history().empty:
+        total = len(history)
+        if total == 0:
             print(f"{Fore.RED}No calculations in history{Style.RESET_ALL}")
-            return
-        
-        print(f"{Fore.YELLOW}Calculation History:{Style.RESET_ALL}")
-        for idx, row in history.get_history().iterrows():
-            print(f"{Fore.CYAN}{idx + 1}.{Style.RESET_ALL} {Fore.YELLOW}{row['timestamp']}{Style.RESET_ALL}: {Fore.GREEN}{row['input']}{Style.RESET_ALL} = {Fore.YELLOW}{row['result']}{Style.RESET_ALL}")
-            steps = json.loads(row['steps']) if isinstance(row['steps'], str) else row['steps']
-            for step_idx, step in enumerate(steps, 1):
-                print(f"   Step {Fore.CYAN}{step_idx}{Style.RESET_ALL}: {step['input']} = {Fore.YELLOW}{step['result']}{Style.RESET_ALL}")
+            return None
+        first = max(first, 1)
+        last = total if last is None else min(last, total)
+        if first > last:
+            raise HistoryError(f"No calculations between {first} and {last}; history has {total} calculations")
+        write_lines(history_lines(history, first, last))
+        return first, last, total
     except Exception as e:
         logger.error(f"Failed to display history: {str(e)}")
         print(f"{Fore.RED}Failed to display history: {str(e)}{Style.RESET_ALL}")
         raise HistoryError(f"Failed to display history: {str(e)}")
 
+def display_history_page(history, page=1, size=HISTORY_PAGE_SIZE):
+    """Display one page of *size* calculations, followed by the page position when there is more than one page."""
+    if page < 1 or size < 1:
+        print(f"{Fore.RED}Failed to display history: page and page size must be positive{Style.RESET_ALL}")
+        raise HistoryError("Failed to display history: page and page size must be positive")
+    shown = display_history(history, (page - 1) * size + 1, page * size)
+    if shown is not None:
+        first, last, total = shown
+        pages = (total + size - 1) // size
+        if pages > 1:
+            print(f"{Fore.YELLOW}Calculations {Fore.CYAN}{first}-{last}{Fore.YELLOW} of {Fore.CYAN}{total}{Fore.YELLOW}, page {Fore.CYAN}{page}{Fore.YELLOW} of {Fore.CYAN}{pages}{Style.RESET_ALL}")
+    return shown
+
+def display_history_head(history, count=HISTORY_PAGE_SIZE):
+    return display_history(history, 1, count)
+
+def display_history_tail(history, count=HISTORY_PAGE_SIZE):
+    return display_history(history, len(history) - count + 1)
+
+def display_matches(history, query, limit=HISTORY_PAGE_SIZE):
+    """Display the first *limit* calculations matching a SearchQuery and how many matched in total."""
+    try:
+        total, positions = history.search(query, limit)
+    except HistoryError as e:
+        logger.error(f"Failed to search history: {str(e)}")
+        print(f"{Fore.RED}Failed to search history: {str(e)}{Style.RESET_ALL}")
+        raise
+    if total == 0:
+        print(f"{Fore.YELLOW}No matching calculations{Style.RESET_ALL}")
+        return total
+    def lines():
+        yield f"{Fore.YELLOW}Found {Fore.CYAN}{total}{Fore.YELLOW} matching calculations:{Style.RESET_ALL}\n"
+        for position in positions:
+            yield from row_lines(position, history.get_entry(position))
+        if total > len(positions):
+            yield f"{Fore.YELLOW}Showing the first {Fore.CYAN}{len(positions)}{Style.RESET_ALL}\n"
+    write_lines(lines())
+    return total
+
 def save_history(history):
     """Save the current history to a backup file with colored output."""
     try:
@@ -80,3 +154,92 @@ def load_history(history, filename):
         logger.error(f"Failed to load history from {filename}: {str(e)}")
         print(f"{Fore.RED}Failed to load history from {Fore.CYAN}{filename}{Style.RESET_ALL}: {str(e)}")
         raise
+
+def show_dependencies(history, index):
+    """Show the calculations an entry references and the ones that depend on it."""
+    try:
+        references = history.references_of(index)
+        dependents = history.dependents_of(index)
+        downstream = history.downstream_of(index)
+        print(f"{Fore.YELLOW}Calculation {Fore.CYAN}{index}{Style.RESET_ALL}")
+        print(f"   Uses: {Fore.CYAN}{', '.join(map(str, references)) or 'none'}{Style.RESET_ALL}")
+        print(f"   Used by: {Fore.CYAN}{', '.join(map(str, dependents)) or 'none'}{Style.RESET_ALL}")
+        indirect = sorted(set(downstream) - set(dependents))
+        if indirect:
+            print(f"   Indirectly used by: {Fore.CYAN}{', '.join(map(str, indirect))}{Style.RESET_ALL}")
+    except HistoryError as e:
+        logger.error(f"Failed to show dependencies of calculation {index}: {str(e)}")
+        print(f"{Fore.RED}Failed to show dependencies of calculation {Fore.CYAN}{index}{Style.RESET_ALL}: {str(e)}")
+        raise
+
+def format_size(size):
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+def display_backups(history):
+    """List backups with their kind, row count and size on disk."""
+    try:
+        backups = history.list_backups()
+    except HistoryError as e:
+        logger.error(f"Failed to list backups: {str(e)}")
+        print(f"{Fore.RED}Failed to list backups: {str(e)}{Style.RESET_ALL}")
+        raise
+    if not backups:
+        print(f"{Fore.YELLOW}No backups in {history.backup_dir}{Style.RESET_ALL}")
+        return
+    print(f"{Fore.YELLOW}Backups:{Style.RESET_ALL}")
+    for backup in backups:
+        rows = f"{backup['rows']} rows" if backup['rows'] is not None else "unknown rows"
+        parent = f", delta of {backup['parent']}" if backup['parent'] else ""
+        print(f"{Fore.CYAN}{backup['name']}{Style.RESET_ALL} ({backup['kind']}{parent}): {rows}, {format_size(backup['bytes'])}, {backup['created']}")
+
+def display_stats(stats_observer, verify=False):
+    """Display aggregate statistics of the history; with *verify*, check them against a full recompute first."""
+    try:
+        mismatches = stats_observer.verify() if verify else None
+        summary = stats_observer.summary()
+    except HistoryError as e:
+        logger.error(f"Failed to compute history statistics: {str(e)}")
+        print(f"{Fore.RED}Failed to compute history statistics: {str(e)}{Style.RESET_ALL}")
+        raise
+    if verify:
+        if mismatches:
+            print(f"{Fore.RED}Running statistics differed from a full recompute: {', '.join(mismatches)}; using the recomputed values{Style.RESET_ALL}")
+        else:
+            print(f"{Fore.GREEN}Running statistics match a full recompute{Style.RESET_ALL}")
+    if summary['count'] == 0:
+        print(f"{Fore.YELLOW}No calculations in history{Style.RESET_ALL}")
+        return summary
+    print(f"{Fore.YELLOW}History statistics:{Style.RESET_ALL}")
+    print(f"   Count: {Fore.CYAN}{summary['count']}{Style.RESET_ALL}")
+    for label, key in (('Sum', 'sum'), ('Mean', 'mean'), ('Min', 'min'), ('Max', 'max'), ('Variance', 'variance'), ('Std dev', 'std')):
+        print(f"   {label}: {Fore.CYAN}{summary[key]:.10g}{Style.RESET_ALL}")
+    operators = ', '.join(f"{operator} {count}" for operator, count in summary['operators'].items())
+    print(f"   Operators: {Fore.CYAN}{operators or 'none'}{Style.RESET_ALL}")
+    return summary
+
+def display_observer_metrics(history):
+    """Show the delivery counters and latencies of the history's observers."""
+    metrics = history.observer_metrics()
+    if not metrics:
+        print(f"{Fore.YELLOW}No observers registered{Style.RESET_ALL}")
+        return
+    print(f"{Fore.YELLOW}Observers ({history.dispatch} dispatch):{Style.RESET_ALL}")
+    for entry in metrics:
+        print(f"{Fore.CYAN}{entry['observer']}{Style.RESET_ALL}: {entry['delivered']} delivered, {entry['dropped']} dropped, "
+              f"{entry['coalesced']} coalesced, {entry['errors']} errors, {entry['queued']} queued, "
+              f"latency {entry['mean_latency'] * 1000:.3f} ms mean, {entry['max_latency'] * 1000:.3f} ms max")
+
+def display_perf(summary):
+    """Show the per-stage latency percentiles recorded by app.perf, in microseconds."""
+    if not summary:
+        print(f"{Fore.YELLOW}No timings recorded yet (PERF_TIMING may be off){Style.RESET_ALL}")
+        return
+    width = max(len(entry['stage']) for entry in summary)
+    print(f"{Fore.YELLOW}{'stage':<{width}} {'count':>8} {'p50 µs':>10} {'p95 µs':>10} {'p99 µs':>10} {'max µs':>10} {'total ms':>10}{Style.RESET_ALL}")
+    for entry in summary:
+        print(f"{Fore.CYAN}{entry['stage']:<{width}}{Style.RESET_ALL} {entry['count']:>8} {entry['p50']:>10.1f} "
+              f"{entry['p95']:>10.1f} {entry['p99']:>10.1f} {entry['max']:>10.1f} {entry['total'] / 1000:>10.2f}")
@@ -0,0 +1,220 @@
+import json
+import os
+from app.atomic import file_identity
+from app.logger import get_logger
+from app.numeric import result_value
+from app.exceptions import HistoryError
+
+logger = get_logger("journal")  # pragma: no cover
+
+class HistoryJournal:
+    """Append-only log of history mutations kept next to the history snapshot.
+
+    Each line is a JSON record: ``add`` (a calculation group), ``update``
+    (a group replacing the entry at a 1-based index), ``delete`` (1-based
+    index) or ``reset``. Replaying the journal on top of the last
+    snapshot reproduces the current history.
+
+    The journal is a write-ahead log for its *snapshot* file. Its first line
+    is a ``base`` record holding the identity of the snapshot the records
+    apply to, so records left behind by a crash between rewriting the
+    snapshot and truncating the journal are recognised as already folded in.
+    A torn last line from a crash mid-append is cut off when the journal is
+    read. With *sync*, every append is fsynced before it returns.
+    """
+
+    def __init__(self, path, snapshot=None, sync=False):
+        self.path = path
+        self.snapshot = snapshot
+        self.sync = sync
+        self.records = 0
+        self._checked = False
+
+    def _base(self):
+        return {'op': 'base', 'snapshot': file_identity(self.snapshot) if self.snapshot else None}
+
+    def _write(self, mode, data):
+        with open(self.path, mode, encoding='utf-8') as f:
+            f.write(data)
+            if self.sync:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def append(self, record):
+        self.append_many([record])
+
+    def append_many(self, records):
+        """Append records with a single write."""
+        if not records:
+            return
+        data = ''.join(json.dumps(record) + '\n' for record in records)
+        try:
+            if not self._checked:
+                self._check()
+            self._write('a', data)
+            self.records += len(records)
+        except Exception as e:
+            logger.error(f"Failed to append to journal {self.path}: {str(e)}")
+            raise HistoryError(f"Failed to write journal: {str(e)}")
+
+    def _check(self):
+        """Make sure appends land after a base record for the current snapshot."""
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0 or self._stale(self._header()):
+            self.truncate()
+        self._checked = True
+
+    def _read_lines(self):
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        if end < len(data):
+            # A crash mid-append leaves a partial last line; cut it so the next append starts cleanly
+            logger.warning(f"Discarding torn journal record at the end of {self.path} ({len(data) - end} bytes)")
+            os.truncate(self.path, end)
+        return data[:end].decode('utf-8').splitlines()
+
+    def read(self):
+        """Return the records that still apply to the snapshot."""
+        if not os.path.exists(self.path):
+            self.records = 0
+            return []
+        records = []
+        for line_no, line in enumerate(self._read_lines(), 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                logger.warning(f"Skipping invalid journal record at {self.path}:{line_no}: {str(e)}")
+        if records and records[0].get('op') == 'base':
+            base = records.pop(0)
+            if self.snapshot and base.get('snapshot') != file_identity(self.snapshot):
+                logger.info(f"Dropping {len(records)} journal records from {self.path}; they are already in {self.snapshot}")
+                self.truncate()
+                records = []
+        self.records = len(records)
+        return records
+
+    def read_from(self, offset):
+        """Records appended after byte *offset*, e.g. by another process sharing the journal.
+
+        Unlike ``read``, a partial last line is left alone rather than cut off.
+        """
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+        records = []
+        for line in data[:data.rfind(b'\n') + 1].decode('utf-8').splitlines():
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.warning(f"Skipping invalid journal record in {self.path}: {str(e)}")
+                continue
+            if record.get('op') != 'base':
+                records.append(record)
+        self.records += len(records)
+        return records
+
+    def _header(self):
+        """The journal's first line parsed as a record, or None if it is missing or invalid."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.loads(f.readline())
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def _stale(self, header):
+        return header is not None and header.get('op') == 'base' and self.snapshot is not None and \
+            header.get('snapshot') != file_identity(self.snapshot)
+
+    def pending(self):
+        """True if the journal file holds records that are not in the snapshot yet."""
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return False
+        if size == 0:
+            return False
+        header = self._header()
+        if header is None or header.get('op') != 'base':
+            return True
+        if self._stale(header):
+            return False
+        return size > len(json.dumps(header)) + 1
+
+    def truncate(self):
+        """Drop all records, typically after the snapshot has been rewritten.
+
+        The journal restarts with a ``base`` record for the new snapshot.
+        """
+        self._write('w', json.dumps(self._base()) + '\n')
+        self.records = 0
+        self._checked = True
+
+    @staticmethod
+    def apply(store, records):
+        """Apply journal records to a HistoryStore in place."""
+        for record in records:
+            op = record.get('op')
+            if op == 'add':
+                store.append(record.get('input'), result_value(record.get('result')), record.get('timestamp'), record.get('steps') or [])
+            elif op == 'delete':
+                index = record.get('index', 0)
+                if 0 < index <= len(store):
+                    store.delete(index - 1)
+                else:
+                    logger.warning(f"Ignoring journal delete of index {index}; only {len(store)} entries")
+            elif op == 'update':
+                index = record.get('index', 0)
+                if 0 < index <= len(store):
+                    store.update(index - 1, record.get('input'), result_value(record.get('result')), record.get('steps') or [])
+                else:
+                    logger.warning(f"Ignoring journal update of index {index}; only {len(store)} entries")
+            elif op == 'reset':
+                store.clear()
+            elif op == 'base':
+                pass
+            else:
+                logger.warning(f"Ignoring unknown journal record: {record}")
+        return store
+
+class AppendedRows:
+    """Rows of a snapshot reader followed by the groups in journal ``add`` records.
+
+    Lets a lazy history answer lookups from a memory-mapped snapshot and the
+    journal tail without loading the snapshot.
+    """
+
+    def __init__(self, base, records):
+        self.base = base
+        self.added = records
+
+    def __len__(self):
+        return len(self.base) + len(self.added)
+
+    def _record(self, index):
+        if not 0 <= index < len(self):
+            raise IndexError(f"History row {index} out of range")
+        return self.added[index - len(self.base)]
+
+    def result(self, index):
+        if index < len(self.base):
+            return self.base.result(index)
+        return result_value(self._record(index)['result'])
+
+    def row(self, index):
+        if index < len(self.base):
+            return self.base.row(index)
+        record = self._record(index)
+        return {
+            'input': record.get('input'),
+            'result': result_value(record.get('result')),
+            'timestamp': record.get('timestamp'),
+            'steps': record.get('steps') or []
+        }
+
+    def close(self):
+        self.base.close()
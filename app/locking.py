@@ -0,0 +1,58 @@
+import os
+import threading
+from app.logger import get_logger
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    # No flock on Windows; the lock then only serializes threads of this process
+    fcntl = None
+
+logger = get_logger("locking")  # pragma: no cover
+
+class FileLock:
+    """Exclusive advisory lock on *path*, shared with other processes through ``flock``.
+
+    Re-entrant within a process: nested acquisitions by the thread that
+    holds it only count depth. The lock file is created if needed and kept
+    open until ``close``; its contents are never used.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+        if fcntl is None:  # pragma: no cover
+            logger.warning(f"File locking is not available on this platform; {path} only guards this process")
+
+    def acquire(self):
+        self._thread_lock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                if self._fd is None:
+                    self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            except BaseException:
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0 and fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def close(self):
+        with self._thread_lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
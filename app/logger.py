@@ -1,8 +1,10 @@
+import atexit
 import logging
 import os
-from logging.handlers import TimedRotatingFileHandler
-from dotenv import load_dotenv
+import queue
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
 from datetime import datetime
+from app.perf import clock, perf
 
 # Set up a fallback console logger for errors during initialization
 fallback_logger = logging.getLogger('fallback')
@@ -23,16 +25,20 @@ try:
     dotenv_path = os.path.join(parent_dir, '.env')
     if not os.path.isfile(dotenv_path):
         raise FileNotFoundError(f".env file not found at: {dotenv_path}")
+    from dotenv import load_dotenv  # Only pay for python-dotenv when there is a .env file
     load_dotenv(dotenv_path)
 except Exception as e:
     fallback_logger.error(f"Failed to load .env file: {str(e)}")
     # Set defaults if .env loading fails
     LOG_LEVEL = 'INFO'
     LOG_FILE_PREFIX = 'app'
+    LOG_QUEUE = True
 else:
     # Get configuration from environment variables
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
     LOG_FILE_PREFIX = os.getenv('LOG_FILE_PREFIX', 'app')
+    # Queued logging hands records to a listener thread that does the file and console I/O
+    LOG_QUEUE = os.getenv('LOG_QUEUE', 'true').lower() in ('1', 'true', 'yes')
 
 # Validate log level
 valid_log_levels = {'DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'}
@@ -40,6 +46,8 @@ if LOG_LEVEL not in valid_log_levels:
     fallback_logger.error(f"Invalid LOG_LEVEL '{LOG_LEVEL}' in .env; defaulting to INFO")
     LOG_LEVEL = 'INFO'
 
+formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(name)s - %(message)s')
+
 # Create a shared TimedRotatingFileHandler for all loggers
 log_dir = os.path.join(parent_dir, 'logs')  # Log directory (my_project/logs/)
 # Set initial log file with today's date
@@ -55,31 +63,79 @@ try:
         when="midnight",  # Rotate at midnight
         interval=1,       # Rotate every 1 day
         backupCount=0,    # Keep all rotated files (no deletion)
-        utc=False         # Use local time for rotation
+        utc=False,        # Use local time for rotation
+        delay=True        # Open the log file on the first record, not at import
     )
     file_handler.setLevel(getattr(logging, LOG_LEVEL))
     file_handler.suffix = "-%Y-%m-%d.log"
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(name)s - %(message)s')
     file_handler.setFormatter(formatter)
 except Exception as e:
     fallback_logger.error(f"Failed to create log file {log_file}: {str(e)}")
     file_handler = None  # Fallback to console-only logging
 
+console_handler = logging.StreamHandler()
+console_handler.setLevel(getattr(logging, LOG_LEVEL))
+console_handler.setFormatter(formatter)
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread.
+
+    The stock handler formats every record before queueing it; here the
+    record is queued as it is, so the message, timestamp and traceback are
+    rendered off the calling thread. Log arguments must not be modified
+    after the call, which holds for the values this application logs.
+    """
+
+    def prepare(self, record):
+        return record
+
+    def emit(self, record):
+        start = clock()
+        super().emit(record)
+        perf.record('logging', clock() - start)
+
+log_queue = queue.SimpleQueue()
+queue_handler = DeferredQueueHandler(log_queue)
+queue_handler.setLevel(getattr(logging, LOG_LEVEL))
+listener = None
+if LOG_QUEUE:
+    handlers = [file_handler, console_handler] if file_handler else [console_handler]
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    # Stopping the listener writes out every queued record before the process exits
+    atexit.register(listener.stop)
+
+_loggers = set()
+
+def set_log_level(level):
+    """Change the level of every logger from get_logger; the file and console handlers keep LOG_LEVEL."""
+    level = getattr(logging, level) if isinstance(level, str) else level
+    queue_handler.setLevel(level)
+    for name in _loggers:
+        logging.getLogger(name).setLevel(level)
+
 def get_logger(module_name):
-    """Return a configured logger for the specified module."""
+    """Return a configured logger for the specified module.
+
+    With LOG_QUEUE (the default) the logger only enqueues records; the shared
+    QueueListener thread writes them to the log file and the console.
+    """
     # Create or get logger for the module
     logger = logging.getLogger(module_name)
     logger.setLevel(getattr(logging, LOG_LEVEL))
-    
+    _loggers.add(module_name)
+
+    if LOG_QUEUE:
+        if queue_handler not in logger.handlers:
+            logger.addHandler(queue_handler)
+        return logger
+
     # Add shared file handler if not already added and file_handler was created
-    if file_handler and not any(isinstance(h, TimedRotatingFileHandler) for h in logger.handlers):
+    if file_handler and file_handler not in logger.handlers:
         logger.addHandler(file_handler)
-    
-    # Add console handler if not already added
-    if not any(isinstance(h, logging.StreamHandler) for h in logger.handlers):
-        console_handler = logging.StreamHandler()
-        console_handler.setLevel(getattr(logging, LOG_LEVEL))
-        console_handler.setFormatter(formatter)
+
+    # Add shared console handler if not already added
+    if console_handler not in logger.handlers:
         logger.addHandler(console_handler)
-    
+
     return logger
@@ -1,168 +1,892 @@
-import pandas as pd
-import json
+import collections
+import functools
 import os
+import sys
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 from app.logger import get_logger
 from app.exceptions import HistoryError
-from app.config import HISTORY_DIR, HISTORY_BACKUP_DIR
+from app.config import HISTORY_DIR, HISTORY_BACKUP_DIR, HISTORY_FORMAT, HISTORY_WRITE_MODE, HISTORY_DURABILITY, HISTORY_FSYNC_INTERVAL, HISTORY_STORAGE_MODE, HISTORY_JOURNAL_SUFFIX, HISTORY_JOURNAL_COMPACT_THRESHOLD, HISTORY_BACKUP_MODE, OBSERVER_DISPATCH, OBSERVER_QUEUE_SIZE, OBSERVER_OVERFLOW, OBSERVER_BATCH_SIZE, NUMERIC_MODE, HISTORY_SHARED, HISTORY_LOCK_SUFFIX
+from app.atomic import file_identity
+from app.journal import AppendedRows, HistoryJournal
+from app.locking import FileLock
+from app.writer import HistoryWriter
+from app.dependencies import DependencyIndex, reference_positions, rewrite_references
+from app.numeric import result_value
 from app.observer import Subject
+from app.perf import clock, perf
+from app.storage import STORAGE_BACKENDS, storage_backend
+
+# pandas and the NumPy-backed HistoryStore are imported when history is first
+# read or written so that starting the calculator does not pay for them.
+
+STORAGE_MODES = ('csv', 'journal') + tuple(STORAGE_BACKENDS)
+HISTORY_FORMATS = ('csv', 'binary')
+WRITE_MODES = ('sync', 'async')
+BACKUP_MODES = ('csv', 'incremental')
+NUMERIC_MODES = ('float', 'exact')
 
 logger = get_logger("memento")  # pragma: no cover
 
+def _locked(method):
+    """Run a history mutation in a transaction, so the background writer and other processes see whole changes."""
+    stage = f"history.{method.__name__}"
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        start = clock()
+        try:
+            with self.transaction():
+                return method(self, *args, **kwargs)
+        finally:
+            perf.record(stage, clock() - start)
+    return wrapper
+
+def _synced(method):
+    """Let a shared history pick up changes made by other processes before a read."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self._file_lock is not None and self._version() != self._seen:
+            with self.transaction():
+                pass
+        return method(self, *args, **kwargs)
+    return wrapper
+
+def _is_parser_error(e):
+    pandas = sys.modules.get('pandas')
+    return pandas is not None and isinstance(e, pandas.errors.ParserError)
+
 class CalculationMemento:
-    def __init__(self, input_str, operation, a, b, result):  # pragma: no cover
-        self._state = {  # pragma: no cover
-            'input': input_str,  # pragma: no cover
-            'operation': operation,  # pragma: no cover
-            'a': a,  # pragma: no cover
-            'b': b,  # pragma: no cover
-            'result': result  # pragma: no cover
-        }  # pragma: no cover
-    
-    def get_state(self):  # pragma: no cover
-        return self._state  # pragma: no cover
+    """One evaluation step.
+
+    Steps produced by evaluate_plan pass ``input_str=None`` with the operand
+    texts; the step text is then only formatted when the state is requested
+    for saving or display. An operand text of None means ``str(value)``.
+    """
+    __slots__ = ('_input', 'operation', 'a', 'b', 'result', '_a_text', '_b_text')
+
+    def __init__(self, input_str, operation, a, b, result, a_text=None, b_text=None):
+        self._input = input_str
+        self.operation = operation
+        self.a = a
+        self.b = b
+        self.result = result
+        self._a_text = a_text
+        self._b_text = b_text
+
+    @property
+    def input(self):
+        if self._input is None:
+            a_text = self._a_text if self._a_text is not None else str(self.a)
+            b_text = self._b_text if self._b_text is not None else str(self.b)
+            self._input = f"{a_text} {self.operation} {b_text}"
+        return self._input
+
+    def get_state(self):
+        return {
+            'input': self.input,
+            'operation': self.operation,
+            'a': self.a,
+            'b': self.b,
+            'result': self.result
+        }
 
 class CalculationHistory(Subject):
-    def __init__(self, history_file):
-        super().__init__()
+    def __init__(self, history_file, storage_mode=HISTORY_STORAGE_MODE, compact_threshold=HISTORY_JOURNAL_COMPACT_THRESHOLD, lazy=False, history_format=HISTORY_FORMAT,
+                 write_mode=HISTORY_WRITE_MODE, durability=HISTORY_DURABILITY, backup_mode=HISTORY_BACKUP_MODE, dispatch=OBSERVER_DISPATCH,
+                 numeric_mode=NUMERIC_MODE, shared=HISTORY_SHARED, backup_dir=None):
+        """With *lazy*, the history file is read on first access instead of here.
+
+        *history_format* is the format the history file is written in; files in
+        either format are read. While a lazy binary history is not loaded,
+        ``ans(n)`` lookups read single rows from the memory-mapped file.
+
+        With *write_mode* 'async', changes are persisted by a background
+        HistoryWriter using group commit and the *durability* fsync policy;
+        call ``flush()`` or ``close()`` to wait for them.
+
+        With *backup_mode* 'incremental', ``save_history_to_file`` stores a
+        compressed delta against the previous backup (see app/backups.py).
+
+        With *dispatch* 'async', observers receive events from bounded queues
+        on worker threads (see AsyncDelivery), so a slow observer does not
+        delay saves.
+
+        With *numeric_mode* 'exact', integer results are stored as exact ints
+        and read back as ints from CSV files.
+
+        With *shared*, other processes may use the same history file. Every
+        change holds an advisory lock on ``<history file>.lock`` and first
+        catches up with what the others changed, and reads catch up when the
+        files changed, so ``ans(n)`` means the same row in every process.
+        Catching up applies only the new journal records in journal mode and
+        only the new rows in storage backends when the others only appended;
+        a CSV history is reloaded, as every change rewrites it.
+
+        Storage modes listed in STORAGE_BACKENDS keep the rows in a
+        StorageBackend instead of the history file; an existing history file
+        is copied into a newly created backend. While such a history is not
+        loaded, ``ans(n)`` and history pages read single rows from the backend,
+        and ``save_history_to_file`` writes the backend's own backup format.
+
+        Backups are saved to and loaded from *backup_dir*, by default
+        HISTORY_BACKUP_DIR.
+        """
+        super().__init__(dispatch, OBSERVER_QUEUE_SIZE, OBSERVER_OVERFLOW, OBSERVER_BATCH_SIZE)
+        if storage_mode not in STORAGE_MODES:
+            raise HistoryError(f"Unsupported storage mode '{storage_mode}', Available: '{', '.join(STORAGE_MODES)}'")
+        if history_format not in HISTORY_FORMATS:
+            raise HistoryError(f"Unsupported history format '{history_format}', Available: '{', '.join(HISTORY_FORMATS)}'")
+        if write_mode not in WRITE_MODES:
+            raise HistoryError(f"Unsupported write mode '{write_mode}', Available: '{', '.join(WRITE_MODES)}'")
+        if backup_mode not in BACKUP_MODES:
+            raise HistoryError(f"Unsupported backup mode '{backup_mode}', Available: '{', '.join(BACKUP_MODES)}'")
+        if numeric_mode not in NUMERIC_MODES:
+            raise HistoryError(f"Unsupported numeric mode '{numeric_mode}', Available: '{', '.join(NUMERIC_MODES)}'")
+        if shared and write_mode != 'sync':
+            raise HistoryError("Shared histories need write mode 'sync'")
         self.history_file = history_file
-        self.history = pd.DataFrame(columns=['input', 'result', 'timestamp', 'steps'])
+        self.storage_mode = storage_mode
+        self.history_format = history_format
+        self.compact_threshold = compact_threshold
+        self.backup_mode = backup_mode
+        self.exact = numeric_mode == 'exact'
+        self._backup_dir = backup_dir
+        self._backups = None
+        # Synchronous writes fsync each journal append; the background writer syncs by its own policy
+        sync = write_mode == 'sync' and durability == 'always'
+        self.journal = HistoryJournal(history_file + HISTORY_JOURNAL_SUFFIX, history_file, sync) if storage_mode == 'journal' else None
+        self.storage = None
+        self._loaded_store = None
+        self._mapped_file = None
+        self._dependencies = None
+        self._search_index = None
+        self._lock = threading.RLock()
+        # Transactions entered on the lock; events for asynchronous observers wait in _pending_events until it drops to 0
+        self._lock_depth = 0
+        self._pending_events = collections.deque()
+        self._dispatch_lock = threading.Lock()
+        self._writer = None
+        self._file_lock = FileLock(history_file + HISTORY_LOCK_SUFFIX) if shared else None
+        # Version of the history files that the loaded history matches; see _version
+        self._seen = None
+        self._transactions = 0
         try:
             if not os.path.exists(HISTORY_DIR):
                 os.makedirs(HISTORY_DIR)
                 logger.info(f"Created history file directory: {HISTORY_DIR}")
-            self._load_history()
+            if storage_mode in STORAGE_BACKENDS:
+                self._open_storage(storage_mode, durability == 'always')
+            if not lazy:
+                self._load_history()
+            if write_mode == 'async':
+                self._writer = HistoryWriter(self._prepare_write, self._lock, durability, HISTORY_FSYNC_INTERVAL)
         except Exception as e:
             logger.error(f"Failed to initialize history file {history_file}: {str(e)}")
             raise HistoryError(f"Failed to initialize history file: {str(e)}")
-    
+
+    def _open_storage(self, storage_mode, sync):
+        self.storage = storage_backend(storage_mode, self.history_file, sync=sync)
+        if self.storage.created and os.path.exists(self.history_file):
+            self.storage.replace(self._read_history(self.history_file))
+            logger.info(f"Copied history from {self.history_file} into {self.storage.path}")
+
+    @property
+    def _store(self):
+        if self._loaded_store is None:
+            self._load_history()
+        return self._loaded_store
+
+    @_store.setter
+    def _store(self, store):
+        self._close_mapped()
+        self._loaded_store = store
+        self._search_index = None
+
+    @property
+    def loaded(self):
+        return self._loaded_store is not None
+
+    def _mapped(self):
+        """The memory-mapped history file, while an unloaded binary history has only appends pending in its journal.
+
+        Pending ``add`` records are served from the journal, so recovering a
+        session does not require loading the snapshot.
+        """
+        if self._loaded_store is not None:
+            return None
+        if self.storage is not None:
+            # The storage backend answers positional reads itself; a background
+            # writer only gets records after the history is loaded
+            return self.storage
+        if self._mapped_file is None:
+            from app.binary import BinaryHistory, is_binary_history
+            if not is_binary_history(self.history_file):
+                return None
+            records = self.journal.read() if self.journal is not None and self.journal.pending() else []
+            if any(record.get('op') != 'add' for record in records):
+                return None
+            mapped = BinaryHistory(self.history_file)
+            self._mapped_file = AppendedRows(mapped, records) if records else mapped
+        return self._mapped_file
+
+    def _close_mapped(self):
+        if self._mapped_file is not None:
+            self._mapped_file.close()
+            self._mapped_file = None
+
+    @_synced
+    def __len__(self):
+        mapped = self._mapped()
+        if mapped is not None:
+            return len(mapped)
+        return len(self._store)
+
+    @property
+    @_synced
+    def history(self):
+        return self._store.to_frame()
+
+    def _read_csv(self, path):
+        from app.store import read_csv
+        return read_csv(path, self.exact)
+
+    def _read_history(self, path):
+        """Read a history or backup file in any format."""
+        from app.binary import is_binary_history, read_binary
+        from app.database import is_database, read_database
+        if is_binary_history(path):
+            return read_binary(path)
+        if is_database(path):
+            return read_database(path)
+        return self._read_csv(path)
+
+    def _write_history(self, path):
+        """Write the history file in the configured format."""
+        if self.history_format == 'binary':
+            from app.binary import write_binary
+            write_binary(self._store, path)
+        else:
+            self._write_csv(path)
+
     def _load_history(self):
+        if self._file_lock is None:
+            self._read_history_files()
+            return
+        # Other processes only change the files while holding the lock
+        with self._file_lock:
+            self._seen = self._version()
+            self._read_history_files()
+
+    def _read_history_files(self):
         try:
-            if os.path.exists(self.history_file):
-                self.history = pd.read_csv(self.history_file, dtype={'input': str, 'result': float, 'timestamp': str, 'steps': str})
-                if 'steps' not in self.history.columns:
-                    self.history['steps'] = pd.Series([[]] * len(self.history), index=self.history.index)
-                    logger.warning(f"No 'steps' column in {self.history_file}; initialized with empty lists")
-                else:
-                    def safe_json_loads(s):
-                        try:
-                            if pd.isna(s) or s == '':
-                                return []
-                            return json.loads(s)
-                        except json.JSONDecodeError as e:
-                            logger.warning(f"Invalid JSON in steps column: {s}, error: {str(e)}")
-                            return []
-                    self.history['steps'] = self.history['steps'].apply(safe_json_loads)
-                logger.debug(f"Loaded history from {self.history_file}: {len(self.history)} entries")
+            if self.storage is not None:
+                self._store = self.storage.load()
+                logger.debug(f"Loaded history from {self.storage.path}: {len(self._store)} entries")
+            elif os.path.exists(self.history_file):
+                self._store = self._read_history(self.history_file)
+                logger.debug(f"Loaded history from {self.history_file}: {len(self._store)} entries")
             else:
-                self.history = pd.DataFrame(columns=['input', 'result', 'timestamp', 'steps'])
+                from app.store import HistoryStore
+                self._store = HistoryStore()
                 logger.debug(f"No history file found at {self.history_file}; starting with empty history")
-        except pd.errors.ParserError as e:
-            logger.error(f"Failed to parse CSV in {self.history_file}: {str(e)}")
-            raise HistoryError(f"Failed to load history: Malformed CSV file")
+            if self.journal is not None:
+                self._replay_journal()
+            self._dependencies = None
         except Exception as e:
+            if _is_parser_error(e):
+                logger.error(f"Failed to parse CSV in {self.history_file}: {str(e)}")
+                raise HistoryError(f"Failed to load history: Malformed CSV file")
             logger.error(f"Failed to load history from {self.history_file}: {str(e)}")
             raise HistoryError(f"Failed to load history: {str(e)}")
-    
+
+    def _replay_journal(self):
+        records = self.journal.read()
+        if not records:
+            return
+        HistoryJournal.apply(self._store, records)
+        logger.debug(f"Replayed {len(records)} journal records from {self.journal.path}: {len(self._store)} entries")
+
+    def _write_csv(self, path):
+        """Write the history to *path* with the steps column encoded as JSON."""
+        from app.store import write_csv
+        write_csv(self._store, path)
+
+    def _snapshot_writer(self, path):
+        """Capture the history for writing to *path*; the returned callable does the I/O on the snapshot."""
+        if self.history_format == 'binary':
+            from app.binary import encode_binary, write_chunks
+            chunks = encode_binary(self._store)
+            return lambda: write_chunks(chunks, path)
+        from app.store import write_frame
+        frame = self._store.to_frame(encode=True)
+        return lambda: write_frame(frame, path)
+
+    def _prepare_write(self, records):
+        """Background writer hook, called under the history lock with every record not yet on disk."""
+        if self.storage is not None:
+            return self._storage_writer(records)
+        journal = self.journal
+        if journal is None or any(record['op'] == 'snapshot' for record in records) or \
+                (self._loaded_store is not None and journal.records + len(records) >= max(self.compact_threshold, len(self._store))):
+            # The snapshot already holds every drained record, so none of them go to the journal
+            write = self._snapshot_writer(self.history_file)
+            def snapshot():
+                write()
+                if journal is not None:
+                    journal.truncate()
+                return [self.history_file]
+            return snapshot
+        def append():
+            journal.append_many(records)
+            return [journal.path]
+        return append
+
+    def _storage_writer(self, records):
+        storage = self.storage
+        if any(record['op'] == 'snapshot' for record in records):
+            write = storage.snapshot(self._store)
+        else:
+            write = lambda: storage.apply(records)
+        def commit():
+            write()
+            # The backend syncs its own commits; there are no files for the writer to fsync
+            return []
+        return commit
+
+    def flush(self):
+        """Wait for background writes to reach the disk."""
+        if self._writer is not None:
+            self._writer.flush()
+
+    def close(self):
+        self.close_observers()
+        if self._writer is not None:
+            self._writer.close()
+        self._close_mapped()
+        if self.storage is not None:
+            self.storage.close()
+        if self._file_lock is not None:
+            self._file_lock.close()
+
+    @contextmanager
+    def transaction(self):
+        """Hold the history lock, plus the history file lock when shared, so that reads and changes made
+        inside see and leave one consistent history; e.g. ans(n) evaluated inside refers to the same
+        row when the result is saved.
+        """
+        try:
+            with self._lock:
+                self._lock_depth += 1
+                try:
+                    if self._file_lock is None or self._transactions:
+                        # Nested transactions run inside the outermost one, which catches up and records the version
+                        yield self
+                        return
+                    with self._file_lock:
+                        self._refresh()
+                        self._transactions += 1
+                        try:
+                            yield self
+                        except BaseException:
+                            if self._version() != self._seen:
+                                # A failed change may have written part of itself; catch up from scratch next time
+                                self._seen = None
+                            raise
+                        else:
+                            self._seen = self._version()
+                        finally:
+                            self._transactions -= 1
+                finally:
+                    self._lock_depth -= 1
+        finally:
+            if not self._lock_depth:
+                self._dispatch_events()
+
+    def _queue_event(self, event, data):
+        """Keep events for asynchronous observers until the outermost transaction releases the lock,
+        so a full queue with the 'block' overflow policy cannot stall other threads waiting for it."""
+        self._pending_events.append((event, data))
+        if not self._lock_depth:
+            self._dispatch_events()
+
+    def _dispatch_events(self):
+        """Hand the pending events to the asynchronous observers in order, from one thread at a time;
+        a thread that finds another one dispatching leaves its events to it."""
+        while self._pending_events:
+            if not self._dispatch_lock.acquire(blocking=False):
+                return
+            try:
+                while self._pending_events:
+                    Subject._queue_event(self, *self._pending_events.popleft())
+            finally:
+                self._dispatch_lock.release()
+
+    def _version(self):
+        """A value that changes whenever any process changes the history files."""
+        if self.storage is not None:
+            return self.storage.version()
+        if self.journal is not None:
+            return file_identity(self.history_file), file_identity(self.journal.path)
+        return file_identity(self.history_file)
+
+    def _refresh(self):
+        """Catch up with changes other processes made to the history files; called under the file lock."""
+        version = self._version()
+        if version == self._seen:
+            return
+        if self._loaded_store is None:
+            # Nothing to catch up with; a stale memory-mapped file is reopened on the next read
+            self._close_mapped()
+            self._seen = version
+            return
+        records = self._changes(version)
+        if records is None:
+            self._load_history()
+            logger.info(f"Reloaded {self.history_file} after changes by another process: {len(self._store)} entries")
+        else:
+            HistoryJournal.apply(self._store, records)
+            self._dependencies = None
+            self._search_index = None
+            self._seen = version
+            logger.debug(f"Applied {len(records)} changes to {self.history_file} by another process")
+        self.notify_observers("history_synced", {"entries": len(self._store)})
+
+    def _changes(self, version):
+        """The records other processes added since ``_seen``, or None if the history has to be reloaded."""
+        if self._seen is None:
+            return None
+        if self.storage is not None:
+            return self.storage.changes(self._seen, version)
+        if self.journal is None:
+            return None
+        (snapshot, journal), (seen_snapshot, seen_journal) = version, self._seen
+        # A rewritten snapshot means the journal was compacted and restarted
+        if snapshot != seen_snapshot or journal is None or seen_journal is None or \
+                journal[0] != seen_journal[0] or journal[1] < seen_journal[1]:
+            return None
+        return self.journal.read_from(seen_journal[1])
+
+    def _persist(self, records):
+        """Persist a mutation: rewrite the history file or append its journal records in one write."""
+        start = clock()
+        try:
+            if self._writer is not None:
+                self._writer.submit(records)
+            elif self.storage is not None:
+                self.storage.apply(records)
+            elif self.journal is None:
+                self._write_history(self.history_file)
+            else:
+                self.journal.append_many(records)
+                self._maybe_compact()
+        finally:
+            perf.record('persist', clock() - start)
+
+    def _maybe_compact(self):
+        # Waiting until the journal is as long as the history keeps compaction amortized O(1) per record
+        if self._loaded_store is None or self.journal.records < max(self.compact_threshold, len(self._store)):
+            return
+        try:
+            self.compact()
+        except HistoryError as e:
+            # The journal already holds the change; compaction is retried on the next write
+            logger.warning(f"Deferred journal compaction: {str(e)}")
+
+    @_locked
+    def compact(self):
+        """Fold the journal into the history file and truncate it."""
+        if self._writer is not None:
+            self._writer.submit([{'op': 'snapshot'}])
+            return
+        try:
+            if self.storage is not None:
+                self.storage.replace(self._store)
+                logger.info(f"Rewrote {self.storage.path}: {len(self._store)} entries")
+                return
+            self._write_history(self.history_file)
+            if self.journal is not None:
+                self.journal.truncate()
+            logger.info(f"Compacted history into {self.history_file}: {len(self._store)} entries")
+        except Exception as e:
+            logger.error(f"Failed to compact history into {self.history_file}: {str(e)}")
+            raise HistoryError(f"Failed to compact history: {str(e)}")
+
+    def _group(self, input_str, result, steps):
+        return {
+            'input': input_str,
+            'result': result_value(result),
+            'timestamp': datetime.now().isoformat(),
+            'steps': [step.get_state() for step in steps]
+        }
+
+    def _append_group(self, input_str, result, steps):
+        group = self._group(input_str, result, steps)
+        step_states = group['steps']
+        if self._dependencies is not None:
+            positions = reference_positions(input_str, len(self._store) + 1)
+        self._store.append(input_str, group['result'], group['timestamp'], step_states)
+        if self._dependencies is not None:
+            self._dependencies.add(self._store.id(len(self._store) - 1), [self._store.id(p - 1) for p in positions if 0 < p < len(self._store)])
+        if self._search_index is not None:
+            self._search_index.add(self._store, len(self._store) - 1)
+        return group
+
+    def _persist_groups(self, groups):
+        self._persist([{'op': 'add', **group} for group in groups])
+
+    def _rollback(self, size):
+        """Undo appends that could not be persisted."""
+        for index in range(size, len(self._store)):
+            if self._dependencies is not None:
+                self._dependencies.remove(self._store.id(index))
+            if self._search_index is not None:
+                self._search_index.remove(self._store.id(index))
+        self._store.truncate(size)
+
+    def _save_groups(self, entries):
+        """Append (input, result, steps) entries and persist them with one write, undoing the appends on failure."""
+        if self._loaded_store is None and (self.journal is not None or (self.storage is not None and self._writer is None)):
+            # A lazy journal or storage history is appended to without loading it; loading picks the records up
+            groups = [self._group(input_str, result, steps) for input_str, result, steps in entries]
+            if groups:
+                self._persist([{'op': 'add', **group} for group in groups])
+                self._close_mapped()
+            return groups
+        size_before = len(self._store)
+        try:
+            groups = [self._append_group(input_str, result, steps) for input_str, result, steps in entries]
+            if groups:
+                self._persist_groups(groups)
+        except Exception:
+            self._rollback(size_before)
+            raise
+        return groups
+
+    @_locked
     def save_calculation_group(self, input_str, result, steps):
         try:
-            group = {
-                'input': input_str,
-                'result': float(result),
-                'timestamp': datetime.now().isoformat(),
-                'steps': json.dumps([step.get_state() for step in steps])
-            }
-            new_entry = pd.DataFrame([group], columns=['input', 'result', 'timestamp', 'steps'])
-            self.history = pd.concat([self.history, new_entry], ignore_index=True)
-            self.history.to_csv(self.history_file, index=False)
-            logger.info(f"Saved calculation group to {self.history_file}: {group}")
+            group, = self._save_groups([(input_str, result, steps)])
+            # Formatted on the logging thread; the group is not modified after it is saved
+            logger.info("Saved calculation group to %s: %s", self.history_file, group)
             self.notify_observers("calculation_added", group)
         except Exception as e:
             logger.error(f"Failed to save calculation group to {self.history_file}: {str(e)}")
             raise HistoryError(f"Failed to save calculation group: {str(e)}")
-    
+
+    @_locked
+    def save_calculation_groups(self, entries):
+        """Append many (input, result, steps) entries with a single write."""
+        try:
+            groups = self._save_groups(entries)
+            if groups:
+                logger.info(f"Saved {len(groups)} calculation groups to {self.history_file}")
+            for group in groups:
+                self.notify_observers("calculation_added", group)
+        except Exception as e:
+            logger.error(f"Failed to save calculation groups to {self.history_file}: {str(e)}")
+            raise HistoryError(f"Failed to save calculation groups: {str(e)}")
+        return len(groups)
+
+    @property
+    def dependencies(self):
+        """The ans(n) DependencyIndex, built from the stored inputs on first use."""
+        if self._dependencies is None:
+            index = DependencyIndex()
+            for i in range(len(self._store)):
+                positions = reference_positions(self._store.input(i), i + 1)
+                index.add(self._store.id(i), [self._store.id(p - 1) for p in positions if 0 < p <= i])
+            self._dependencies = index
+        return self._dependencies
+
+    @property
+    def search_index(self):
+        """The HistoryIndex behind ``search``, built on first use and then maintained by every change."""
+        if self._search_index is None:
+            from app.search import HistoryIndex
+            self._search_index = HistoryIndex.build(self._store)
+        return self._search_index
+
+    @_locked
+    def search(self, query, limit=None):
+        """Return (number of matches, 1-based positions of the first *limit* matches) for a SearchQuery."""
+        try:
+            ids = self.search_index.search(self._store, query)
+            chosen = ids if limit is None else ids[:limit]
+            return len(ids), [self._store.index_of(row_id) + 1 for row_id in chosen.tolist()]
+        except Exception as e:
+            logger.error(f"Failed to search history: {str(e)}")
+            raise HistoryError(f"Failed to search history: {str(e)}")
+
+    def _check_index(self, n):
+        if len(self._store) == 0:
+            raise HistoryError("No previous calculations available")
+        if n <= 0:
+            raise HistoryError(f"Invalid history index: {n}")
+        if n > len(self._store):
+            raise HistoryError(f"History index {n} out of range")
+
+    def _positions(self, entry_ids):
+        return sorted(self._store.index_of(entry_id) + 1 for entry_id in entry_ids)
+
+    @_synced
+    def get_entry(self, n):
+        """Return the row at 1-based position *n* as a dict."""
+        self._check_index(n)
+        return self._store.row(n - 1)
+
+    @_synced
+    def references_of(self, n):
+        """Positions of the entries that entry *n* references, in ans-token order."""
+        self._check_index(n)
+        ids = self.dependencies.references.get(self._store.id(n - 1), ())
+        return [self._store.index_of(entry_id) + 1 for entry_id in ids]
+
+    @_synced
+    def dependents_of(self, n):
+        """Positions of the entries whose input references entry *n* directly."""
+        self._check_index(n)
+        return self._positions(self.dependencies.direct_dependents(self._store.id(n - 1)))
+
+    @_synced
+    def downstream_of(self, n):
+        """Positions of every entry that transitively depends on entry *n*, in order."""
+        self._check_index(n)
+        return self._positions(self.dependencies.downstream(self._store.id(n - 1)))
+
+    def _renumber_dependents(self, n):
+        """Rewrite the ans tokens that deleting entry *n* would leave pointing at the wrong rows.
+
+        Returns (new position, new input) pairs for inputs that change; the
+        dependency index is updated in place.
+        """
+        index = self.dependencies
+        deleted_id = self._store.id(n - 1)
+        deleted_value = self._store.result(n - 1)
+        affected = set()
+        for i in range(n - 1, len(self._store)):
+            affected.update(index.dependents.get(self._store.id(i), ()))
+        affected.discard(deleted_id)
+        index.remove(deleted_id)
+        index.dependents.pop(deleted_id, None)
+
+        def shifted(position):
+            return position - 1 if position > n else position
+
+        updates = []
+        for entry_id in sorted(affected):
+            references = index.references.get(entry_id, ())
+            position = self._store.index_of(entry_id) + 1
+            targets = [(None, deleted_value) if ref == deleted_id else shifted(self._store.index_of(ref) + 1) for ref in references]
+            input_str = self._store.input(position - 1)
+            new_input = rewrite_references(input_str, shifted(position), targets)
+            if deleted_id in references:
+                index.remove(entry_id)
+                index.add(entry_id, [ref for ref in references if ref != deleted_id])
+            if new_input != input_str:
+                updates.append((shifted(position), new_input))
+        return updates
+
+    @_locked
+    def update_calculations(self, updates):
+        """Replace entries in place from (position, input, result, steps) tuples with one write."""
+        try:
+            previous = []
+            records = []
+            for n, input_str, result, steps in updates:
+                self._check_index(n)
+                previous.append((n, self._store.row(n - 1)))
+                step_states = [step.get_state() for step in steps]
+                self._store.update(n - 1, input_str, result_value(result), step_states)
+                entry_id = self._store.id(n - 1)
+                self.dependencies.remove(entry_id)
+                self.dependencies.add(entry_id, [self._store.id(p - 1) for p in reference_positions(input_str, n) if 0 < p < n])
+                if self._search_index is not None:
+                    self._search_index.update(self._store, n - 1)
+                records.append({'op': 'update', **self._store.row(n - 1), 'index': n})
+            try:
+                self._persist(records)
+            except Exception:
+                for n, row in reversed(previous):
+                    self._store.update(n - 1, row['input'], row['result'], row['steps'])
+                self._dependencies = None
+                self._search_index = None
+                raise
+            logger.info(f"Updated {len(records)} calculations in {self.history_file}")
+            for record, (_, row) in zip(records, previous):
+                self.notify_observers("calculation_updated", {**{key: record[key] for key in ('index', 'input', 'result', 'steps')},
+                                                              'previous_result': row['result'], 'previous_steps': row['steps']})
+        except Exception as e:
+            logger.error(f"Failed to update calculations in {self.history_file}: {str(e)}")
+            raise HistoryError(f"Failed to update calculations: {str(e)}")
+
+    @_synced
     def get_history(self):
-        return self.history
-    
+        return self._store.to_frame()
+
+    @_synced
+    def results(self):
+        """Read-only NumPy view of the result column."""
+        return self._store.results()
+
+    @_synced
+    def encoded_steps(self):
+        """The steps column as JSON text."""
+        return self._store.encoded_steps()
+
+    @_synced
+    def rows(self, first=1, last=None):
+        """Yield (position, row) for calculations *first* to *last* (1-based, inclusive), decoding only those rows."""
+        mapped = self._mapped()
+        source = mapped if mapped is not None else self._store
+        last = len(source) if last is None else min(last, len(source))
+        for position in range(max(first, 1), last + 1):
+            yield position, source.row(position - 1)
+
+    @_synced
     def get_previous_result(self, n):
         try:
-            if self.history.empty:
+            mapped = self._mapped()
+            size = len(mapped if mapped is not None else self._store)
+            if size == 0:
                 logger.warning("No previous calculations available")
                 raise HistoryError("No previous calculations available")
             if n <= 0:
                 logger.warning(f"Invalid history index: {n}")
                 raise HistoryError(f"Invalid history index: {n}")
-            if n > len(self.history):
-                logger.warning(f"History index {n} out of range; only {len(self.history)} calculations available")
+            if n > size:
+                logger.warning(f"History index {n} out of range; only {size} calculations available")
                 raise HistoryError(f"History index {n} out of range")
-            result = self.history.iloc[n - 1]['result']
-            logger.debug(f"Retrieved previous result (ans({n})): {result}")
+            result = (mapped if mapped is not None else self._store).result(n - 1)
+            logger.debug("Retrieved previous result (ans(%s)): %s", n, result)
             return result
         except Exception as e:
             logger.error(f"Failed to retrieve previous result (ans({n})): {str(e)}")
             raise HistoryError(f"Failed to retrieve previous result: {str(e)}")
-    
+
+    @_synced
     def save_history_to_file(self):
         try:
-            if self.history.empty:
+            self.flush()
+            if len(self) == 0:
                 logger.warning("No history to save")
                 raise HistoryError("No history to save")
-            if not os.path.exists(HISTORY_BACKUP_DIR):
-                os.makedirs(HISTORY_BACKUP_DIR)
-                logger.info(f"Created backup directory: {HISTORY_BACKUP_DIR}")
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_file = os.path.join(HISTORY_BACKUP_DIR, f"history_{timestamp}.csv")
-            self.history.to_csv(backup_file, index=False)
+            backup_dir = self.backup_dir
+            if not os.path.exists(backup_dir):
+                os.makedirs(backup_dir)
+                logger.info(f"Created backup directory: {backup_dir}")
+            if self.storage is not None:
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                backup_file = os.path.join(backup_dir, f"history_{timestamp}{self.storage.backup_suffix}")
+                self.storage.backup(backup_file)
+            elif self.backup_mode == 'incremental':
+                entry = self.backups.save(self._store)
+                backup_file = os.path.join(backup_dir, entry['file'])
+            else:
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                backup_file = os.path.join(backup_dir, f"history_{timestamp}.csv")
+                self._write_csv(backup_file)
             logger.info(f"Saved history to {backup_file}")
             self.notify_observers("history_saved", {"backup_file": backup_file})
             return backup_file
         except Exception as e:
             logger.error(f"Failed to save history to backup file: {str(e)}")
             raise HistoryError(f"Failed to save history: {str(e)}")
-    
+
+    @property
+    def backup_dir(self):
+        """Where backups are saved and loaded from."""
+        return self._backup_dir or HISTORY_BACKUP_DIR
+
+    @property
+    def backups(self):
+        """The BackupCatalog of incremental snapshots in the backup directory."""
+        if self._backups is None:
+            from app.backups import BackupCatalog
+            self._backups = BackupCatalog(self.backup_dir)
+        return self._backups
+
+    def list_backups(self):
+        """Snapshots and backup files with their sizes, without opening them."""
+        try:
+            return self.backups.listing()
+        except Exception as e:
+            logger.error(f"Failed to list backups in {self.backup_dir}: {str(e)}")
+            raise HistoryError(f"Failed to list backups: {str(e)}")
+
+    @_locked
     def new_history(self):
         try:
-            self.history = pd.DataFrame(columns=['input', 'result', 'timestamp', 'steps'])
-            self.history.to_csv(self.history_file, index=False)
+            self._store.clear()
+            self._dependencies = DependencyIndex()
+            self._search_index = None
+            self._persist([{'op': 'reset'}])
             logger.info(f"Cleared history and started new history in {self.history_file}")
             self.notify_observers("history_cleared", {})
         except Exception as e:
             logger.error(f"Failed to start new history in {self.history_file}: {str(e)}")
             raise HistoryError(f"Failed to start new history: {str(e)}")
-    
+
+    @_locked
     def delete_calculation(self, n):
         try:
-            if self.history.empty:
+            size = len(self._store)
+            if size == 0:
                 logger.warning("No history to delete from")
                 raise HistoryError("No history to delete from")
             if n <= 0:
                 logger.warning(f"Invalid history index for deletion: {n}")
                 raise HistoryError(f"Invalid history index: {n}")
-            if n > len(self.history):
-                logger.warning(f"History index {n} out of range; only {len(self.history)} calculations available")
+            if n > size:
+                logger.warning(f"History index {n} out of range; only {size} calculations available")
                 raise HistoryError(f"History index {n} out of range")
-            self.history = self.history.drop(self.history.index[n - 1])
-            self.history.to_csv(self.history_file, index=False)
+            deleted = self._store.row(n - 1)
+            updates = self._renumber_dependents(n)
+            if self._search_index is not None:
+                self._search_index.remove(self._store.id(n - 1))
+            self._store.delete(n - 1)
+            records = [{'op': 'delete', 'index': n}]
+            for position, input_str in updates:
+                self._store.update(position - 1, input_str, self._store.result(position - 1), self._store.steps(position - 1))
+                if self._search_index is not None:
+                    self._search_index.update(self._store, position - 1)
+                records.append({'op': 'update', **self._store.row(position - 1), 'index': position})
+            self._persist(records)
             logger.info(f"Deleted calculation {n} from {self.history_file}")
-            self.notify_observers("calculation_deleted", {"index": n})
+            self.notify_observers("calculation_deleted", {"index": n, "input": deleted['input'], "result": deleted['result'], "steps": deleted['steps']})
         except Exception as e:
             logger.error(f"Failed to delete calculation {n} from {self.history_file}: {str(e)}")
             raise HistoryError(f"Failed to delete calculation: {str(e)}")
-    
+
+    @_locked
     def load_history_from_file(self, filename):
         try:
-            backup_file = os.path.join(HISTORY_BACKUP_DIR, filename)
-            if not os.path.exists(backup_file):
+            backup_file = os.path.join(self.backup_dir, filename)
+            restored = False
+            if self.backups.find(filename) is not None:
+                self._store = self.backups.restore(filename)
+            elif not os.path.exists(backup_file):
                 logger.warning(f"Backup file {backup_file} does not exist")
                 raise HistoryError(f"Backup file {filename} does not exist")
-            self.history = pd.read_csv(backup_file, dtype={'input': str, 'result': float, 'timestamp': str, 'steps': str})
-            self.history['steps'] = self.history['steps'].apply(lambda s: json.loads(s) if pd.notna(s) else [])
-            self.history.to_csv(self.history_file, index=False)
-            logger.info(f"Loaded history from {backup_file} into {self.history_file}: {len(self.history)} entries")
-            self.notify_observers("history_loaded", {"filename": filename, "entries": len(self.history)})
-        except pd.errors.ParserError as e:
-            logger.error(f"Failed to parse CSV in {backup_file}: {str(e)}")
-            raise HistoryError(f"Failed to load history: Malformed CSV file")
+            elif self.storage is not None and self._writer is None and self.storage.is_backup(backup_file):
+                self.storage.restore(backup_file)
+                restored = True
+            else:
+                self._store = self._read_history(backup_file)
+            self._dependencies = None
+            if restored:
+                # Rows are read from the restored storage on first use
+                self._store = None
+            elif self.journal is None and self.storage is None and self._writer is None:
+                self._write_history(self.history_file)
+            else:
+                self.compact()
+            logger.info(f"Loaded history from {backup_file} into {self.history_file}: {len(self)} entries")
+            self.notify_observers("history_loaded", {"filename": filename, "entries": len(self)})
         except Exception as e:
+            if _is_parser_error(e):
+                logger.error(f"Failed to parse CSV in {backup_file}: {str(e)}")
+                raise HistoryError(f"Failed to load history: Malformed CSV file")
             logger.error(f"Failed to load history from {backup_file}: {str(e)}")
             raise HistoryError(f"Failed to load history: {str(e)}")
@@ -0,0 +1,16 @@
+"""Helpers for results that may be exact ints (NUMERIC_MODE=exact) or floats.
+
+Kept free of NumPy so the journal and observers can use them without
+loading it at startup.
+"""
+
+def result_value(value):
+    """A result as it is stored: ints stay exact, anything else becomes a float."""
+    return value if value.__class__ is int else float(value)
+
+def approximate(value):
+    """*value* as a float, saturating ints beyond the float range to infinity."""
+    try:
+        return float(value)
+    except OverflowError:
+        return float('inf') if value > 0 else float('-inf')
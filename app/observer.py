@@ -1,22 +1,231 @@
+import atexit
+import collections
+import threading
+import time
 from abc import ABC, abstractmethod
+from app.exceptions import HistoryError
+from app.logger import get_logger
+from app.perf import clock, perf
+
+logger = get_logger("observer")  # pragma: no cover
+
+DISPATCH_MODES = ('sync', 'async')
+OVERFLOW_POLICIES = ('block', 'drop-oldest', 'coalesce')
 
 class Observer(ABC):
     @abstractmethod
     def update(self, event, data):  # pragma: no cover
         pass  # pragma: no cover
 
+class BatchObserver(Observer):
+    """Observer that takes queued events as a list when dispatched asynchronously.
+
+    ``update_batch`` receives up to the delivery's batch size of (event, data)
+    pairs per call; synchronous dispatch still calls ``update`` per event.
+    """
+
+    def update_batch(self, events):
+        for event, data in events:
+            self.update(event, data)
+
+class ObserverMetrics:
+    """Delivery counters of one observer; latency is from notify to the end of its update."""
+
+    def __init__(self, name):
+        self.name = name
+        self.delivered = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def record(self, latency):
+        self.delivered += 1
+        self.total_latency += latency
+        if latency > self.max_latency:
+            self.max_latency = latency
+
+    def snapshot(self, queued=0):
+        return {
+            'observer': self.name,
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'coalesced': self.coalesced,
+            'errors': self.errors,
+            'queued': queued,
+            'mean_latency': self.total_latency / self.delivered if self.delivered else 0.0,
+            'max_latency': self.max_latency,
+        }
+
+class AsyncDelivery:
+    """Delivers events to one observer from a bounded queue on a worker thread.
+
+    When the queue already holds *maxsize* events, *overflow* decides what
+    ``put`` does: 'block' waits for the worker to make room, 'drop-oldest'
+    discards the oldest queued event and 'coalesce' replaces the newest queued
+    event of the same kind (dropping the oldest event if there is none).
+    """
+
+    def __init__(self, observer, maxsize=1024, overflow='block', batch_size=64):
+        if overflow not in OVERFLOW_POLICIES:
+            raise HistoryError(f"Unsupported overflow policy '{overflow}', Available: '{', '.join(OVERFLOW_POLICIES)}'")
+        self.observer = observer
+        self.maxsize = max(maxsize, 1)
+        self.overflow = overflow
+        self.batch_size = max(batch_size, 1)
+        self.metrics = ObserverMetrics(type(observer).__name__)
+        self._queue = collections.deque()
+        self._condition = threading.Condition()
+        self._busy = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f"observer-{self.metrics.name}", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def __len__(self):
+        return len(self._queue)
+
+    def put(self, event, data):
+        item = (event, data, time.perf_counter())
+        with self._condition:
+            if self._closed:
+                return
+            if len(self._queue) >= self.maxsize:
+                if self.overflow == 'block':
+                    while len(self._queue) >= self.maxsize and not self._closed:
+                        self._condition.wait()
+                    if self._closed:
+                        return
+                elif self.overflow == 'coalesce' and self._coalesce(item):
+                    return
+                else:
+                    self._queue.popleft()
+                    self.metrics.dropped += 1
+            self._queue.append(item)
+            self._condition.notify_all()
+
+    def _coalesce(self, item):
+        for position in range(len(self._queue) - 1, -1, -1):
+            if self._queue[position][0] == item[0]:
+                # Keep the queued event's enqueue time so its latency still counts the wait
+                self._queue[position] = (item[0], item[1], self._queue[position][2])
+                self.metrics.coalesced += 1
+                self._condition.notify_all()
+                return True
+        return False
+
+    def _take(self):
+        with self._condition:
+            while not self._queue and not self._closed:
+                self._condition.wait()
+            batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            self._busy = bool(batch)
+            self._condition.notify_all()
+            return batch
+
+    def _deliver(self, batch):
+        try:
+            if hasattr(self.observer, 'update_batch'):
+                self.observer.update_batch([(event, data) for event, data, _ in batch])
+            else:
+                for event, data, _ in batch:
+                    self.observer.update(event, data)
+        except Exception as e:
+            self.metrics.errors += 1
+            logger.error(f"Observer {self.metrics.name} failed to handle {len(batch)} events: {str(e)}")
+        done = time.perf_counter()
+        for _, _, queued_at in batch:
+            self.metrics.record(done - queued_at)
+
+    def _run(self):
+        while True:
+            batch = self._take()
+            if not batch:
+                return
+            self._deliver(batch)
+            with self._condition:
+                self._busy = False
+                self._condition.notify_all()
+
+    def flush(self):
+        """Wait until every queued event has been delivered."""
+        with self._condition:
+            while (self._queue or self._busy) and self._thread.is_alive():
+                self._condition.wait()
+
+    def close(self):
+        """Deliver what is queued, then stop the worker thread."""
+        if self._closed:
+            return
+        self.flush()
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        atexit.unregister(self.close)
+
 class Subject(ABC):
-    def __init__(self):
+    def __init__(self, dispatch='sync', queue_size=1024, overflow='block', batch_size=64):
+        """With *dispatch* 'async', each observer gets its events from its own AsyncDelivery queue
+        (*queue_size*, *overflow* and *batch_size* are its defaults) instead of inside notify."""
+        if dispatch not in DISPATCH_MODES:
+            raise HistoryError(f"Unsupported dispatch mode '{dispatch}', Available: '{', '.join(DISPATCH_MODES)}'")
         self._observers = []
+        self._deliveries = {}
+        self._metrics = {}
+        self.dispatch = dispatch
+        self._delivery_options = {'maxsize': queue_size, 'overflow': overflow, 'batch_size': batch_size}
 
-    def register_observer(self, observer):
+    def register_observer(self, observer, dispatch=None, **options):
+        """Register *observer*; *dispatch* and AsyncDelivery *options* override the subject's defaults."""
         if observer not in self._observers:
             self._observers.append(observer)
+            if (dispatch or self.dispatch) == 'async':
+                self._deliveries[observer] = AsyncDelivery(observer, **{**self._delivery_options, **options})
+            else:
+                self._metrics[observer] = ObserverMetrics(type(observer).__name__)
 
     def remove_observer(self, observer):  # pragma: no cover
         if observer in self._observers:  # pragma: no cover
             self._observers.remove(observer)  # pragma: no cover
+            delivery = self._deliveries.pop(observer, None)  # pragma: no cover
+            if delivery is not None:  # pragma: no cover
+                delivery.close()  # pragma: no cover
+            self._metrics.pop(observer, None)  # pragma: no cover
 
     def notify_observers(self, event, data):
+        """Call the synchronous observers, then queue the event for the asynchronous ones."""
+        if not self._observers:
+            return
+        dispatched = clock()
+        for observer in self._observers:
+            if observer not in self._deliveries:
+                start = time.perf_counter()
+                observer.update(event, data)
+                self._metrics[observer].record(time.perf_counter() - start)
+        if self._deliveries:
+            self._queue_event(event, data)
+        perf.record('observers', clock() - dispatched)
+
+    def _queue_event(self, event, data):
+        """Put an event on every AsyncDelivery queue; with the 'block' overflow policy this waits for room."""
+        for delivery in list(self._deliveries.values()):
+            delivery.put(event, data)
+
+    def observer_metrics(self):
+        """Delivery counters and latencies of every observer, in registration order."""
+        metrics = []
         for observer in self._observers:
-            observer.update(event, data)
+            delivery = self._deliveries.get(observer)
+            metrics.append(delivery.metrics.snapshot(len(delivery)) if delivery is not None else self._metrics[observer].snapshot())
+        return metrics
+
+    def flush_observers(self):
+        """Wait until every asynchronously dispatched event has been delivered."""
+        for delivery in list(self._deliveries.values()):
+            delivery.flush()
+
+    def close_observers(self):
+        for delivery in list(self._deliveries.values()):
+            delivery.close()
@@ -1,6 +1,26 @@
 import math
+from app.config import EXACT_INT_MAX_BITS
 from app.exceptions import OperationError
 
+def integer_root(n: int, k: int) -> int:
+    """
+    Largest integer whose *k*-th power does not exceed *n*, by Newton's method on integers
+    **Params**
+        - *n (int)*: Non-negative integer
+        - *k (int)*: Root index, at least 1
+    **Returns**
+        - *int*: Integer *k*-th root of *n*, rounded down
+    """
+    if n < 2:
+        return n
+    # 2 ** ceil(bits / k) is above the root, and the iteration decreases monotonically from above
+    root = 1 << -(-n.bit_length() // k)
+    while True:
+        estimate = ((k - 1) * root + n // root ** (k - 1)) // k
+        if estimate >= root:
+            return root
+        root = estimate
+
 class Operation:
     @staticmethod
     def addition(a: float, b: float) -> float:
@@ -55,11 +75,13 @@ class Operation:
             - *a (float)*: First float value
             - *b (float)*: Second float value
         **Returns**
-            - *float*: Division of *a* and *b*
+            - *float*: Division of *a* and *b*; an int when both are ints and *b* divides *a*
         """
         if b == 0:
             raise OperationError("Divide By Zero Error")
         try:
+            if a.__class__ is int and b.__class__ is int and a % b == 0:
+                return a // b
             return a / b
         except OverflowError as e: # pragma: no cover
             raise OperationError(f"Division overflow: {str(e)}")  # pragma: no cover
@@ -72,11 +94,15 @@ class Operation:
             - *a (float)*: First float value
             - *b (float)*: Second float value
         **Returns**
-            - *float*: Power of *a* to the *b*
+            - *float*: Power of *a* to the *b*; an exact int when both are ints and *b* is not negative
         """
         try:
             if a == 0 and b < 0:
                 raise OperationError("Zero raised to negative power is undefined")
+            if a.__class__ is int and b.__class__ is int and b >= 0:
+                if abs(a) > 1 and (abs(a).bit_length() - 1) * b > EXACT_INT_MAX_BITS:
+                    raise OperationError(f"Power overflow: result exceeds {EXACT_INT_MAX_BITS} bits")
+                return a ** b
             return math.pow(a, b)
         except OverflowError as e:
             raise OperationError(f"Power overflow: {str(e)}")  # pragma: no cover
@@ -89,12 +115,16 @@ class Operation:
             - *a (float)*: First float value
             - *b (float)*: Second float value
         **Returns**
-            - *float*: Root of *a* with index *b*
+            - *float*: Root of *a* with index *b*; an int when both are ints and the root is exact
         """
         if b == 0:
             raise OperationError("Root with zero index is undefined")
         if a < 0 and b % 2 == 0:
             raise OperationError("Even root of negative number is undefined")
+        if a.__class__ is int and b.__class__ is int and b > 0:
+            root = integer_root(abs(a), b)
+            if root ** b == abs(a):
+                return -root if a < 0 else root
         try:
             return math.pow(a, 1 / b)
         except OverflowError as e: # pragma: no cover
@@ -142,11 +172,13 @@ class Operation:
             - *a (float)*: First float value
             - *b (float)*: Second float value
         **Returns**
-            - *float*: Percentage of *a* over *b*
+            - *float*: Percentage of *a* over *b*; an int when both are ints and the percentage is whole
         """
         if b == 0:
             raise OperationError("Divide By Zero Error")
         try:
+            if a.__class__ is int and b.__class__ is int and (a * 100) % b == 0:
+                return a * 100 // b
             return (a / b) * 100
         except OverflowError as e: # pragma: no cover
             raise OperationError(f"Percentage overflow: {str(e)}")  # pragma: no cover
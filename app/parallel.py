@@ -0,0 +1,119 @@
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from app.batch import BatchResult, PendingHistory, iter_expressions
+from app.calculator import evaluate_plan, evaluate_expression, numeric_exact
+from app.compiler import compile_expression
+from app.config import NUMERIC_MODE, BATCH_CHUNK_SIZE, PARALLEL_WORKERS, PARALLEL_CHUNK_SIZE, PARALLEL_MAX_PENDING
+from app.exceptions import OperationError, CalculatorError, HistoryError
+from app.logger import get_logger
+
+log = get_logger("parallel")  # pragma: no cover
+
+def evaluate_chunk(expressions, exact=NUMERIC_MODE == 'exact'):
+    """Worker entry point: evaluate expressions that do not reference ans, exactly with *exact*.
+
+    Returns a list of (result, steps, error) tuples in input order.
+    """
+    results = []
+    for expression in expressions:
+        try:
+            result, steps = evaluate_plan(compile_expression(expression, exact), [])
+            results.append((result, steps, None))
+        except (OperationError, CalculatorError, HistoryError) as e:
+            results.append((None, None, str(e)))
+    return results
+
+@dataclass
+class ThroughputReport:
+    workers: int = 0
+    chunks: int = 0
+    expressions: int = 0
+    failed: int = 0
+    dependent: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def expressions_per_second(self):
+        return self.expressions / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (f"Evaluated {self.expressions} expressions ({self.failed} failed, {self.dependent} ans-dependent) "
+                f"in {self.elapsed:.3f}s with {self.workers} workers over {self.chunks} chunks: "
+                f"{self.expressions_per_second:,.0f} expressions/s")
+
+class ParallelEvaluator:
+    """Evaluate large expression streams on a process pool, keeping input order.
+
+    Expressions without ans references are sharded into chunks and evaluated
+    by worker processes. Expressions that reference ans are held back and
+    evaluated in this process once every earlier expression has a result, so
+    ans(n) numbering is identical to a sequential run. At most *max_pending*
+    chunks are in flight; reading more input waits for the oldest chunk.
+    """
+
+    def __init__(self, history, workers=PARALLEL_WORKERS, chunk_size=PARALLEL_CHUNK_SIZE,
+                 max_pending=PARALLEL_MAX_PENDING, commit_size=BATCH_CHUNK_SIZE):
+        self.history = history
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = max(1, chunk_size)
+        self.max_pending = max_pending or 2 * self.workers
+        self.commit_size = commit_size
+        self.report = ThroughputReport(workers=self.workers)
+
+    def _chunks(self, expressions):
+        chunk = []
+        for line_no, expression in iter_expressions(expressions):
+            chunk.append((line_no, expression.lower(), expression))
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _submit(self, executor, chunk):
+        independent = [text for _, text, _ in chunk if 'ans' not in text]
+        self.report.chunks += 1
+        return chunk, executor.submit(evaluate_chunk, independent, numeric_exact(self.history))
+
+    def _drain(self, chunk, future, pending):
+        worker_results = iter(future.result())
+        for line_no, text, expression in chunk:
+            if 'ans' in text:
+                self.report.dependent += 1
+                try:
+                    result, steps = evaluate_expression(text, pending)
+                    error = None
+                except (OperationError, CalculatorError, HistoryError) as e:
+                    result, steps, error = None, None, str(e)
+            else:
+                result, steps, error = next(worker_results)
+            self.report.expressions += 1
+            if error is not None:
+                self.report.failed += 1
+                yield BatchResult(line_no, expression, None, error)
+                continue
+            pending.pending.append((expression, result, steps))
+            if len(pending.pending) >= self.commit_size:
+                pending.commit()
+            yield BatchResult(line_no, expression, result, None)
+
+    def evaluate(self, expressions):
+        """Yield a BatchResult per expression in input order; see ``report`` afterwards."""
+        started = time.perf_counter()
+        pending = PendingHistory(self.history)
+        in_flight = deque()
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                for chunk in self._chunks(expressions):
+                    in_flight.append(self._submit(executor, chunk))
+                    if len(in_flight) >= self.max_pending:
+                        yield from self._drain(*in_flight.popleft(), pending)
+                while in_flight:
+                    yield from self._drain(*in_flight.popleft(), pending)
+        finally:
+            pending.commit()
+            self.report.elapsed = time.perf_counter() - started
+            log.info(str(self.report))
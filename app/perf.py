@@ -0,0 +1,204 @@
+"""Hot-path timing and the REPL profiler.
+
+``perf`` keeps one cumulative latency histogram per stage. Callers take
+``clock()`` readings around a stage and pass the difference to
+``perf.record``; recording costs a few integer operations and is skipped
+when PERF_TIMING is off. Histogram buckets are 1/8 of an octave wide,
+so percentiles are within about 6% of the exact value.
+"""
+import os
+import time
+from datetime import datetime
+from app.config import PERF_TIMING, PROFILE_DIR
+
+clock = time.perf_counter_ns
+
+SUB_BUCKETS = 8  # buckets per power of two; must be a power of two
+SUB_BITS = SUB_BUCKETS.bit_length() - 1
+
+def bucket_index(ns):
+    """Histogram bucket of a duration: exact below 2 * SUB_BUCKETS ns, then SUB_BUCKETS per octave."""
+    bits = ns.bit_length()
+    if bits <= SUB_BITS + 1:
+        return ns
+    return (bits << SUB_BITS) | ((ns >> (bits - SUB_BITS - 1)) & (SUB_BUCKETS - 1))
+
+def bucket_bounds(index):
+    """The (lowest, highest) duration that falls in bucket *index*."""
+    bits = index >> SUB_BITS
+    if bits <= SUB_BITS + 1:
+        return index, index
+    shift = bits - SUB_BITS - 1
+    low = (SUB_BUCKETS + (index & (SUB_BUCKETS - 1))) << shift
+    return low, low + (1 << shift) - 1
+
+class StageHistogram:
+    """Cumulative count, total, maximum and log-bucketed distribution of one stage's durations in ns."""
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.buckets = {}
+
+    def add(self, ns):
+        self.count += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+        index = bucket_index(ns)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def percentile(self, q):
+        """Estimated duration below which a fraction *q* of the samples fall (the bucket midpoint)."""
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        # A copy, so recording threads can keep adding buckets
+        for index, count in sorted(self.buckets.copy().items()):
+            seen += count
+            if seen >= rank:
+                low, high = bucket_bounds(index)
+                return min((low + high) / 2, self.max)
+        return self.max  # pragma: no cover
+
+class PerfRecorder:
+    """Per-stage histograms shared by every thread of the process.
+
+    ``record`` takes no lock, which would cost more than the rest of it: the
+    GIL keeps each update from corrupting the histogram, and threads that
+    record the same stage at the same moment may lose the odd sample.
+    """
+
+    def __init__(self, enabled=PERF_TIMING):
+        self.enabled = enabled
+        self.stages = {}
+
+    def record(self, stage, ns):
+        if not self.enabled:
+            return
+        # StageHistogram.add inlined: this runs several times per calculation
+        bits = ns.bit_length()
+        index = ns if bits <= SUB_BITS + 1 else (bits << SUB_BITS) | ((ns >> (bits - SUB_BITS - 1)) & (SUB_BUCKETS - 1))
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages.setdefault(stage, StageHistogram())
+        histogram.count += 1
+        histogram.total += ns
+        if ns > histogram.max:
+            histogram.max = ns
+        buckets = histogram.buckets
+        buckets[index] = buckets.get(index, 0) + 1
+
+    def summary(self):
+        """One dict per stage, in first-recorded order, with count, p50/p95/p99, max and total in microseconds."""
+        return [{
+            'stage': stage,
+            'count': histogram.count,
+            'p50': histogram.percentile(0.50) / 1000,
+            'p95': histogram.percentile(0.95) / 1000,
+            'p99': histogram.percentile(0.99) / 1000,
+            'max': histogram.max / 1000,
+            'total': histogram.total / 1000,
+        } for stage, histogram in list(self.stages.items())]
+
+    def reset(self):
+        self.stages = {}
+
+perf = PerfRecorder()
+
+def _label(function):
+    filename, line, name = function
+    if filename == '~':
+        # Built-ins are reported as ('~', 0, '<built-in method ...>')
+        label = name
+    else:
+        label = f"{name} ({os.path.basename(filename)}:{line})"
+    return label.replace(';', ',')
+
+def collapsed_stacks(stats, max_depth=64, min_us=1):
+    """Fold a pstats.Stats call graph into ``{"root;caller;callee": microseconds}`` for flamegraph tools.
+
+    cProfile keeps caller/callee edges rather than whole stacks, so each
+    function's own time is split over the paths into it in proportion to
+    the time each caller spent in it. Recursion is cut at the first repeat
+    and paths carrying less than *min_us* are dropped.
+    """
+    entries = stats.stats
+    callees = {}
+    for function, (_, _, _, _, callers) in entries.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((function, edge[3]))
+    folded = {}
+
+    def walk(function, path, share, depth):
+        _, _, own, cumulative, _ = entries[function]
+        path = path + [_label(function)]
+        weight = own * share * 1e6
+        if weight >= min_us:
+            key = ';'.join(path)
+            folded[key] = folded.get(key, 0) + weight
+        if depth >= max_depth:
+            return
+        for callee, edge_time in callees.get(function, ()):
+            callee_time = entries[callee][3]
+            if callee in on_path or callee_time <= 0 or edge_time * share * 1e6 < min_us:
+                continue
+            on_path.add(callee)
+            walk(callee, path, share * edge_time / callee_time, depth + 1)
+            on_path.discard(callee)
+
+    for function, entry in entries.items():
+        if not entry[4]:
+            on_path = {function}
+            walk(function, [], 1.0, 1)
+    return {key: round(value) for key, value in folded.items() if round(value) > 0}
+
+class Profiler:
+    """cProfile switched on and off from the REPL.
+
+    ``stop`` writes ``profile_<timestamp>.pstats`` (for pstats/snakeviz) and
+    ``profile_<timestamp>.folded`` (collapsed stacks for flamegraph.pl or
+    speedscope) to *directory*. ``suspend``/``resume`` leave time spent
+    waiting for input out of the profile.
+    """
+
+    def __init__(self, directory=PROFILE_DIR):
+        self.directory = directory
+        self._profile = None
+
+    @property
+    def active(self):
+        return self._profile is not None
+
+    def start(self):
+        import cProfile
+        if self._profile is None:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def suspend(self):
+        if self._profile is not None:
+            self._profile.disable()
+
+    def resume(self):
+        if self._profile is not None:
+            self._profile.enable()
+
+    def stop(self):
+        """Stop profiling and return the (pstats, folded) paths written, or None if not profiling."""
+        import pstats
+        if self._profile is None:
+            return None
+        profile, self._profile = self._profile, None
+        profile.disable()
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+        profile.dump_stats(base + '.pstats')
+        stacks = collapsed_stacks(pstats.Stats(profile))
+        with open(base + '.folded', 'w', encoding='utf-8') as f:
+            for stack, weight in sorted(stacks.items()):
+                f.write(f"{stack} {weight}\n")
+        return base + '.pstats', base + '.folded'
@@ -0,0 +1,388 @@
+import json
+import re
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+import numpy as np
+from app.exceptions import HistoryError
+from app.numeric import approximate
+from app.store import NO_TIMESTAMP, encode_steps, to_microseconds
+
+OPERATION_PATTERN = re.compile(r'"operation":\s*"((?:[^"\\]|\\.)*)"')
+COMPARISONS = ('>=', '<=', '>', '<', '=', '~')
+FILTER_FIELDS = ('result', 'op', 'since', 'until', 'input', 'regex')
+# Up to this many rows left by the indexed criteria are checked one by one instead of scanning the text column
+SCAN_LIMIT = 4096
+
+def step_operators(raw):
+    """Operators used by a raw steps cell, read without decoding stored JSON."""
+    if isinstance(raw, list):
+        return {step.get('operation') for step in raw if isinstance(step, dict)}
+    if isinstance(raw, str):
+        return set(OPERATION_PATTERN.findall(raw))
+    return set()
+
+class SortedColumn:
+    """(key, id) pairs kept sorted by key for range queries.
+
+    The bulk of the pairs live in sorted NumPy arrays. Inserts go to a small
+    buffer and removals of merged pairs are remembered by id; both are folded
+    into the arrays once *merge_size* changes have accumulated, so a change
+    costs amortized O(n / merge_size) and a range query is a binary search
+    plus a scan of the buffer.
+    """
+
+    def __init__(self, keys=(), ids=(), dtype=np.float64, merge_size=1024):
+        keys = np.asarray(keys, dtype=dtype)
+        ids = np.asarray(ids, dtype=np.int64)
+        order = np.argsort(keys, kind='stable')
+        self._keys = keys[order]
+        self._ids = ids[order]
+        self._dtype = dtype
+        self._merge_size = merge_size
+        self._pending = {}
+        self._removed = set()
+
+    def __len__(self):
+        return len(self._ids) - len(self._removed) + len(self._pending)
+
+    def add(self, row_id, key):
+        self._pending[row_id] = key
+        self._maybe_merge()
+
+    def remove(self, row_id):
+        # A pending pair was never merged, so dropping it from the buffer is enough
+        if self._pending.pop(row_id, None) is None:
+            self._removed.add(row_id)
+            self._maybe_merge()
+
+    def _maybe_merge(self):
+        if len(self._pending) + len(self._removed) >= self._merge_size:
+            self.merge()
+
+    def merge(self):
+        keys, ids = self._keys, self._ids
+        if self._removed:
+            keep = ~np.isin(ids, np.fromiter(self._removed, dtype=np.int64, count=len(self._removed)))
+            keys, ids = keys[keep], ids[keep]
+        if self._pending:
+            keys = np.concatenate([keys, np.fromiter(self._pending.values(), dtype=self._dtype, count=len(self._pending))])
+            ids = np.concatenate([ids, np.fromiter(self._pending.keys(), dtype=np.int64, count=len(self._pending))])
+            order = np.argsort(keys, kind='stable')
+            keys, ids = keys[order], ids[order]
+        self._keys, self._ids = keys, ids
+        self._pending = {}
+        self._removed = set()
+
+    def contains(self, ids):
+        """Mask of the sorted *ids* that have a pair in a column keyed on the ids themselves."""
+        positions = np.minimum(np.searchsorted(self._keys, ids), max(len(self._keys) - 1, 0))
+        mask = self._keys[positions] == ids if len(self._keys) else np.zeros(len(ids), dtype=bool)
+        if self._removed or self._pending:
+            mask = np.asarray([(found and row_id not in self._removed) or row_id in self._pending
+                               for found, row_id in zip(mask.tolist(), ids.tolist())], dtype=bool)
+        return mask
+
+    def range(self, low=None, high=None, low_inclusive=True, high_inclusive=True):
+        """Ids whose key lies between *low* and *high* (None is unbounded)."""
+        start = 0 if low is None else np.searchsorted(self._keys, low, side='left' if low_inclusive else 'right')
+        stop = len(self._keys) if high is None else np.searchsorted(self._keys, high, side='right' if high_inclusive else 'left')
+        ids = self._ids[start:stop]
+        if self._removed:
+            ids = ids[~np.isin(ids, np.fromiter(self._removed, dtype=np.int64, count=len(self._removed)))]
+        if self._pending:
+            def inside(key):
+                return (low is None or key > low or (low_inclusive and key == low)) and \
+                       (high is None or key < high or (high_inclusive and key == high))
+            extra = [row_id for row_id, key in self._pending.items() if inside(key)]
+            if extra:
+                ids = np.concatenate([ids, np.asarray(extra, dtype=np.int64)])
+        return ids
+
+class SearchQuery:
+    """Criteria for CalculationHistory.search; every criterion that is set must match."""
+
+    def __init__(self, text=None, pattern=None, result_range=None, time_range=None, operators=()):
+        self.text = text
+        self.pattern = re.compile(pattern) if isinstance(pattern, str) else pattern
+        # (low, high, low_inclusive, high_inclusive); None bounds are open
+        self.result_range = result_range
+        self.time_range = time_range
+        self.operators = tuple(operators)
+
+    def __bool__(self):
+        return any((self.text, self.pattern, self.result_range, self.time_range, self.operators))
+
+def _bound(field, value, parser):
+    try:
+        return parser(value)
+    except ValueError:
+        raise HistoryError(f"Invalid {field} value: {value}")
+
+def _timestamp(value, end=False):
+    """Microseconds for an ISO date or time; a bare date used as an upper bound covers the whole day."""
+    moment = datetime.fromisoformat(value)
+    if end and len(value) == 10:
+        return to_microseconds(moment + timedelta(days=1)), False
+    return to_microseconds(moment), True
+
+def _merge_range(current, low=None, high=None, low_inclusive=True, high_inclusive=True):
+    old_low, old_high, old_low_inclusive, old_high_inclusive = current or (None, None, True, True)
+    if old_low is not None and (low is None or old_low > low or (old_low == low and not old_low_inclusive)):
+        low, low_inclusive = old_low, old_low_inclusive
+    if old_high is not None and (high is None or old_high < high or (old_high == high and not old_high_inclusive)):
+        high, high_inclusive = old_high, old_high_inclusive
+    return (low, high, low_inclusive, high_inclusive)
+
+def parse_filter(args):
+    """Build a SearchQuery from filter terms such as ``result>=10``, ``op=^``, ``since=2025-06-30`` or ``input~ans``."""
+    query = SearchQuery()
+    operators = []
+    for term in args:
+        for comparison in COMPARISONS:
+            field, found, value = term.partition(comparison)
+            if found and field in FILTER_FIELDS and value:
+                break
+        else:
+            raise HistoryError(f"Invalid filter term '{term}'; use result<op>number, op=<operator>, since=<date>, until=<date>, input~<text> or regex=<pattern>")
+        if field == 'result':
+            number = _bound(field, value, float)
+            if comparison in ('=', '~'):
+                query.result_range = _merge_range(query.result_range, number, number)
+            elif comparison in ('>', '>='):
+                query.result_range = _merge_range(query.result_range, low=number, low_inclusive=comparison == '>=')
+            else:
+                query.result_range = _merge_range(query.result_range, high=number, high_inclusive=comparison == '<=')
+        elif field == 'op':
+            operators.append(value)
+        elif field == 'since':
+            low, _ = _bound(field, value, _timestamp)
+            query.time_range = _merge_range(query.time_range, low=low)
+        elif field == 'until':
+            high, inclusive = _bound(field, value, lambda v: _timestamp(v, end=True))
+            query.time_range = _merge_range(query.time_range, high=high, high_inclusive=inclusive)
+        elif field == 'input':
+            query.text = value
+        else:
+            try:
+                query.pattern = re.compile(value)
+            except re.error as e:
+                raise HistoryError(f"Invalid regex '{value}': {str(e)}")
+    query.operators = tuple(operators)
+    return query
+
+def intersect(a, b):
+    """Intersection of two sorted arrays of unique ids, probing the longer one with the shorter."""
+    if len(a) > len(b):
+        a, b = b, a
+    if not len(a):
+        return a
+    positions = np.minimum(np.searchsorted(b, a), len(b) - 1)
+    return a[b[positions] == a]
+
+class TextColumn:
+    """Lower-cased inputs joined into chunk strings, so that substring and regex
+    searches run as C-level scans instead of a Python loop over the rows.
+
+    Rows are kept in id order in chunks of *chunk_size*; a changed chunk is
+    joined again when it is next searched.
+    """
+
+    def __init__(self, ids=(), texts=(), chunk_size=65536):
+        self.chunk_size = chunk_size
+        self._firsts = []
+        self._chunks = []
+        ids, texts = list(ids), [text.lower() for text in texts]
+        for start in range(0, len(ids), chunk_size):
+            self._new_chunk(ids[start:start + chunk_size], texts[start:start + chunk_size])
+
+    def _new_chunk(self, ids, texts):
+        self._firsts.append(ids[0])
+        self._chunks.append({'ids': ids, 'texts': texts, 'joined': None, 'offsets': None})
+
+    def add(self, row_id, text):
+        if not self._chunks or len(self._chunks[-1]['ids']) >= self.chunk_size or self._chunks[-1]['ids'][-1] > row_id:
+            self._new_chunk([row_id], [text.lower()])
+            return
+        chunk = self._chunks[-1]
+        chunk['ids'].append(row_id)
+        chunk['texts'].append(text.lower())
+        chunk['joined'] = None
+
+    def _locate(self, row_id):
+        index = bisect_right(self._firsts, row_id) - 1
+        if index < 0:
+            return None, None
+        chunk = self._chunks[index]
+        position = bisect_left(chunk['ids'], row_id)
+        if position < len(chunk['ids']) and chunk['ids'][position] == row_id:
+            return chunk, position
+        return None, None
+
+    def remove(self, row_id):
+        chunk, position = self._locate(row_id)
+        if chunk is not None:
+            del chunk['ids'][position]
+            del chunk['texts'][position]
+            chunk['joined'] = None
+
+    def _joined(self, chunk):
+        if chunk['joined'] is None:
+            chunk['joined'] = '\n'.join(chunk['texts'])
+            lengths = np.fromiter(map(len, chunk['texts']), dtype=np.int64, count=len(chunk['texts'])) + 1
+            chunk['offsets'] = np.cumsum(lengths) - lengths
+        return chunk['joined'], chunk['offsets']
+
+    def prepare(self):
+        """Join every chunk now rather than on the first search."""
+        for chunk in self._chunks:
+            self._joined(chunk)
+
+    def search(self, text=None, pattern=None):
+        """Sorted ids of the rows containing *text* and matching *pattern*."""
+        if pattern is not None:
+            # Multiline anchors match at row boundaries in the joined text
+            scanner = re.compile(pattern.pattern, pattern.flags | re.MULTILINE)
+        found = []
+        for chunk in self._chunks:
+            if not chunk['ids']:
+                continue
+            joined, offsets = self._joined(chunk)
+            last = len(offsets) - 1
+            start = 0
+            while True:
+                if pattern is not None:
+                    match = scanner.search(joined, start)
+                    at = match.start() if match else -1
+                else:
+                    at = joined.find(text, start)
+                if at == -1:
+                    break
+                row = int(np.searchsorted(offsets, at, side='right')) - 1
+                candidate = chunk['texts'][row]
+                if (text is None or text in candidate) and (pattern is None or pattern.search(candidate)):
+                    found.append(chunk['ids'][row])
+                if row == last:
+                    break
+                # Resume at the next row so every row is reported once
+                start = int(offsets[row + 1])
+        return np.asarray(found, dtype=np.int64)
+
+class HistoryIndex:
+    """Search indexes over a HistoryStore, maintained as rows are added, updated and removed.
+
+    A sorted result column, a sorted timestamp column, an inverted index from
+    operator (the steps' ``operation``) to row ids and a text column of the
+    inputs. Everything is keyed on the store's stable row ids, so deleting a
+    row does not renumber the others.
+    """
+
+    def __init__(self):
+        self.results = SortedColumn()
+        self.timestamps = SortedColumn(dtype=np.int64)
+        self.operators = {}
+        self.inputs = TextColumn()
+
+    @classmethod
+    def build(cls, store):
+        index = cls()
+        ids = store.ids()
+        index.results = SortedColumn(store.results(), ids)
+        index.timestamps = SortedColumn(store.timestamps(), ids, dtype=np.int64)
+        index.inputs = TextColumn(ids, store.inputs())
+        index.inputs.prepare()
+        for operator, operator_ids in operator_postings(store).items():
+            index.operators[operator] = SortedColumn(operator_ids, operator_ids, dtype=np.int64)
+        return index
+
+    def _postings(self, operator):
+        column = self.operators.get(operator)
+        if column is None:
+            column = self.operators[operator] = SortedColumn(dtype=np.int64)
+        return column
+
+    def add(self, store, index):
+        """Index the row at 0-based *index* of *store*."""
+        row_id = store.id(index)
+        # Exact ints are keyed by their float value, as in the result column the index is built from
+        self.results.add(row_id, approximate(store.result(index)))
+        self.timestamps.add(row_id, store.timestamps()[index])
+        self.inputs.add(row_id, store.input(index))
+        for operator in step_operators(store.raw_steps(index)):
+            self._postings(operator).add(row_id, row_id)
+
+    def remove(self, row_id):
+        self.results.remove(row_id)
+        self.timestamps.remove(row_id)
+        self.inputs.remove(row_id)
+        # The row's old steps may be gone already, so it is dropped from every operator's postings
+        for column in self.operators.values():
+            column.remove(row_id)
+
+    def update(self, store, index):
+        """Re-index a row whose input, result or steps changed; it keeps its id."""
+        self.remove(store.id(index))
+        self.add(store, index)
+
+    def _operator_ids(self, operator):
+        column = self.operators.get(operator)
+        return np.empty(0, dtype=np.int64) if column is None else np.sort(column.range())
+
+    def search(self, store, query):
+        """Sorted ids of the rows of *store* matching *query*."""
+        candidates = None
+        # Range and operator criteria are binary searches; their intersection bounds the text scan
+        if query.result_range is not None:
+            candidates = np.sort(self.results.range(*query.result_range))
+        if query.time_range is not None:
+            low, high, low_inclusive, high_inclusive = query.time_range
+            if low is None:
+                low, low_inclusive = NO_TIMESTAMP, False
+            ids = np.sort(self.timestamps.range(low, high, low_inclusive, high_inclusive))
+            candidates = ids if candidates is None else intersect(candidates, ids)
+        for operator in query.operators:
+            if candidates is None:
+                candidates = self._operator_ids(operator)
+            else:
+                column = self.operators.get(operator)
+                candidates = candidates[column.contains(candidates)] if column is not None else candidates[:0]
+        text = query.text.lower() if query.text else None
+        if not (text or query.pattern):
+            return np.asarray(store.ids(), dtype=np.int64) if candidates is None else candidates
+        if candidates is not None and len(candidates) <= SCAN_LIMIT:
+            keep = [(not text or text in value) and (query.pattern is None or query.pattern.search(value) is not None)
+                    for value in (store.input(store.index_of(row_id)).lower() for row_id in candidates.tolist())]
+            return candidates[np.asarray(keep, dtype=bool)] if keep else candidates
+        ids = self.inputs.search(text, query.pattern)
+        return ids if candidates is None else intersect(candidates, ids)
+
+def operator_postings(store):
+    """Sorted row ids per operator, found by scanning the steps column as one string."""
+    from app.calculation import CalculationFactory
+    texts = [raw if isinstance(raw, str) else encode_steps(raw) for raw in (store.raw_steps(i) for i in range(len(store)))]
+    if not texts:
+        return {}
+    joined = '\n'.join(texts)
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts)) + 1
+    offsets = np.cumsum(lengths) - lengths
+    ids = np.asarray(store.ids(), dtype=np.int64)
+    operators = set(CalculationFactory.dispatch_table())
+    prefixes = ['"operation": ']
+    if '"operation":"' in joined:
+        # Steps written without the default JSON separators; find their operators with the slower regex
+        prefixes.append('"operation":')
+        operators.update(OPERATION_PATTERN.findall(joined))
+    postings = {}
+    for operator in operators:
+        starts = []
+        for prefix in prefixes:
+            needle = prefix + json.dumps(operator)
+            if needle not in joined:
+                continue
+            pieces = joined.split(needle)
+            if len(pieces) > 1:
+                lengths = np.fromiter(map(len, pieces[:-1]), dtype=np.int64, count=len(pieces) - 1)
+                starts.append(np.cumsum(lengths) + np.arange(len(pieces) - 1) * len(needle))
+        if starts:
+            rows = np.unique(np.searchsorted(offsets, np.concatenate(starts), side='right') - 1)
+            postings[operator] = ids[rows]
+    return postings
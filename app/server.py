@@ -0,0 +1,279 @@
+"""Calculation service: a JSON-lines protocol over a local TCP socket.
+
+Each request is one JSON object per line::
+
+    {"id": 1, "op": "calculate", "expression": "1 + 2"}
+    {"id": 2, "op": "ans", "n": 1}
+    {"id": 3, "op": "history", "page": 1, "size": 20}
+    {"id": 4, "op": "save"} / {"op": "delete", "index": 1} / {"op": "load", "filename": "..."}
+    {"id": 5, "op": "ping"}
+
+and gets one response line, ``{"id": 1, "ok": true, "result": 3.0}`` or
+``{"id": 1, "ok": false, "error": "..."}``. Clients may pipeline requests;
+responses come back in request order. A request's optional ``session``
+names the history it works on and is shared by every connection that names
+it; without one, a request uses its connection's private session, whose
+history is discarded when the connection closes. Each session saves and
+loads backups in its own directory, ``<session dir>/backups/<session>``;
+``save`` returns the backup's file name, which is what ``load`` takes.
+Every session runs its
+history calls on its own worker thread, so persistence never blocks the
+event loop and a session's requests apply in order.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import re
+import shutil
+import sys
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from app.calculator import calculate_expression
+from app.config import HISTORY_DIR, SERVER_HOST, SERVER_PORT, SERVER_MAX_PIPELINE
+from app.exceptions import OperationError, CalculatorError, HistoryError
+from app.logger import get_logger
+
+logger = get_logger("server")  # pragma: no cover
+
+SESSION_NAME = re.compile(r'[A-Za-z0-9_-]{1,64}')
+MAX_LINE = 1 << 20
+OPERATIONS = ('calculate', 'ans', 'history', 'save', 'delete', 'load', 'ping')
+
+class RequestError(Exception):
+    """A request the server cannot act on (malformed JSON, unknown op, bad arguments)."""
+
+class Session:
+    """A named history and the single worker thread that all of its calls run on."""
+
+    def __init__(self, name, path, backup_dir):
+        from app.memento import CalculationHistory
+        self.name = name
+        # Backups stay with their session, so no client can load another session's history
+        self.history = CalculationHistory(path, lazy=True, backup_dir=backup_dir)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"session-{name}")
+
+    async def run(self, call, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, call, *args)
+
+    def close(self, discard=False):
+        """Finish queued calls and close the history; with *discard*, also delete its files."""
+        self.executor.shutdown(wait=True)
+        self.history.close()
+        if discard:
+            paths = [self.history.history_file]
+            if self.history.journal is not None:
+                paths.append(self.history.journal.path)
+            if self.history.storage is not None:
+                paths.append(self.history.storage.path)
+            for path in paths:
+                if os.path.exists(path):
+                    os.remove(path)
+            shutil.rmtree(self.history.backup_dir, ignore_errors=True)
+
+def _require(request, key, kind):
+    value = request.get(key)
+    if not isinstance(value, kind) or isinstance(value, bool):
+        raise RequestError(f"'{key}' must be {'an integer' if kind is int else 'a string'}")
+    return value
+
+def _page(history, page, size):
+    total = len(history)
+    first = (page - 1) * size + 1
+    rows = [{'index': position, **row} for position, row in history.rows(first, min(first + size - 1, total))]
+    return {'page': page, 'size': size, 'total': total, 'rows': rows}
+
+def _calculate(history, expression):
+    return calculate_expression(expression.strip().lower(), history)
+
+class CalculationServer:
+    """asyncio server exposing calculator sessions over JSON lines.
+
+    Session histories live in *session_dir* as ``<session>.csv``. At most
+    *max_pipeline* requests per connection are in flight; the connection
+    stops reading until earlier responses have been written.
+    """
+
+    def __init__(self, host=SERVER_HOST, port=SERVER_PORT, session_dir=None, max_pipeline=SERVER_MAX_PIPELINE):
+        self.host = host
+        self.port = port
+        self.session_dir = session_dir or os.path.join(HISTORY_DIR, 'sessions')
+        self.max_pipeline = max(max_pipeline, 1)
+        # Session name -> task opening it, so concurrent first requests share one history
+        self.sessions = {}
+        self._clients = itertools.count(1)
+        self._instance = uuid.uuid4().hex[:8]
+        self._server = None
+        self.requests = 0
+
+    async def start(self):
+        os.makedirs(self.session_dir, exist_ok=True)
+        self._server = await asyncio.start_server(self._handle, self.host, self.port, limit=MAX_LINE)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Calculation server listening on {self.host}:{self.port}")
+        return self
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for name in list(self.sessions):
+            await self._close_session(name, discard=name.startswith('client-'))
+        logger.info(f"Calculation server stopped after {self.requests} requests")
+
+    async def _session(self, name):
+        opening = self.sessions.get(name)
+        if opening is None:
+            path = os.path.join(self.session_dir, f"{name}.csv")
+            backup_dir = os.path.join(self.session_dir, 'backups', name)
+            # Opening a history touches the disk, so it runs off the loop like every other history call
+            opening = asyncio.ensure_future(asyncio.get_running_loop().run_in_executor(None, Session, name, path, backup_dir))
+            self.sessions[name] = opening
+        try:
+            return await opening
+        except Exception:
+            if self.sessions.get(name) is opening:
+                del self.sessions[name]
+            raise
+
+    async def _close_session(self, name, discard=False):
+        opening = self.sessions.pop(name, None)
+        if opening is None:
+            return
+        try:
+            session = await opening
+        except Exception:
+            return
+        # Closing flushes pending history writes; keep that off the loop too
+        await asyncio.get_running_loop().run_in_executor(None, session.close, discard)
+
+    async def _handle(self, reader, writer):
+        client = f"client-{self._instance}-{next(self._clients)}"
+        pending = asyncio.Queue(self.max_pipeline)
+        responder = asyncio.create_task(self._respond(pending, writer))
+        logger.info(f"Connection {client} from {writer.get_extra_info('peername')}")
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (asyncio.LimitOverrunError, ValueError):
+                    await pending.put(self._failed(None, f"Request line exceeds {MAX_LINE} bytes"))
+                    break
+                except ConnectionError:
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                # A full queue makes the reader wait, which is the back-pressure on pipelining clients
+                await pending.put(asyncio.ensure_future(self._dispatch(line, client)))
+        finally:
+            await pending.put(None)
+            await responder
+            await self._close_session(client, discard=True)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:  # pragma: no cover
+                pass
+            logger.info(f"Connection {client} closed")
+
+    async def _respond(self, pending, writer):
+        """Write responses in request order as they complete."""
+        while True:
+            response = await pending.get()
+            if response is None:
+                return
+            response = await response
+            try:
+                writer.write(json.dumps(response).encode('utf-8') + b'\n')
+                await writer.drain()
+            except ConnectionError:
+                logger.warning("Client went away before its responses were written")
+
+    def _failed(self, request_id, message):
+        future = asyncio.get_running_loop().create_future()
+        future.set_result({'id': request_id, 'ok': False, 'error': message})
+        return future
+
+    async def _dispatch(self, line, client):
+        self.requests += 1
+        request_id = None
+        try:
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                raise RequestError(f"Invalid JSON: {str(e)}")
+            if not isinstance(request, dict):
+                raise RequestError("A request must be a JSON object")
+            request_id = request.get('id')
+            name = request.get('session', client)
+            if not isinstance(name, str) or not SESSION_NAME.fullmatch(name):
+                raise RequestError("'session' must be 1-64 letters, digits, '_' or '-'")
+            result = await self._execute(request, await self._session(name))
+            return {'id': request_id, 'ok': True, 'result': result}
+        except (RequestError, OperationError, CalculatorError, HistoryError) as e:
+            return {'id': request_id, 'ok': False, 'error': str(e)}
+        except Exception as e:
+            logger.error(f"Unexpected error handling request from {client}: {str(e)}")
+            return {'id': request_id, 'ok': False, 'error': f"Unexpected error: {str(e)}"}
+
+    async def _execute(self, request, session):
+        op = request.get('op')
+        history = session.history
+        if op == 'ping':
+            return 'pong'
+        if op == 'calculate':
+            return await session.run(_calculate, history, _require(request, 'expression', str))
+        if op == 'ans':
+            return await session.run(history.get_previous_result, _require(request, 'n', int))
+        if op == 'history':
+            page = request.get('page', 1)
+            size = request.get('size', 20)
+            if not all(isinstance(value, int) and not isinstance(value, bool) and value > 0 for value in (page, size)):
+                raise RequestError("'page' and 'size' must be positive integers")
+            return await session.run(_page, history, page, size)
+        if op == 'save':
+            return os.path.basename(await session.run(history.save_history_to_file))
+        if op == 'delete':
+            index = _require(request, 'index', int)
+            await session.run(history.delete_calculation, index)
+            return index
+        if op == 'load':
+            filename = _require(request, 'filename', str)
+            # Only backups in the session's own backup directory may be loaded, never arbitrary paths
+            if os.path.basename(filename) != filename or filename in ('', '.', '..'):
+                raise RequestError("'filename' must be the name of a backup, not a path")
+            await session.run(history.load_history_from_file, filename)
+            return await session.run(len, history)
+        raise RequestError(f"Unknown op '{op}', Available: '{', '.join(OPERATIONS)}'")
+
+async def serve(host=SERVER_HOST, port=SERVER_PORT, session_dir=None):
+    server = await CalculationServer(host, port, session_dir).start()
+    print(f"Calculation server listening on {server.host}:{server.port}", file=sys.stderr)
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the calculator over a local JSON-lines socket")
+    parser.add_argument('--host', default=SERVER_HOST)
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--session-dir', help="directory of the per-session history files")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.session_dir))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
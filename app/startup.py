@@ -0,0 +1,30 @@
+import sys
+import time
+
+# Modules whose import dominates startup; fast start defers them until they are needed
+HEAVY_MODULES = ('pandas', 'numpy')
+
+class StartupTimer:
+    """Record named startup phases and report them in the style of ``python -X importtime``."""
+
+    def __init__(self, start=None):
+        self.start = time.perf_counter() if start is None else start
+        self.phases = []
+
+    def mark(self, phase, at=None):
+        self.phases.append((phase, time.perf_counter() if at is None else at))
+
+    @property
+    def elapsed(self):
+        return (self.phases[-1][1] if self.phases else time.perf_counter()) - self.start
+
+    def report(self):
+        lines = ["startup: self [us] | cumulative | phase"]
+        previous = self.start
+        for phase, at in self.phases:
+            lines.append(f"startup: {int((at - previous) * 1e6):>9} | {int((at - self.start) * 1e6):>10} | {phase}")
+            previous = at
+        loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+        deferred = [name for name in HEAVY_MODULES if name not in sys.modules]
+        lines.append(f"startup: loaded {', '.join(loaded) or 'none'}; deferred {', '.join(deferred) or 'none'}")
+        return '\n'.join(lines)
@@ -0,0 +1,165 @@
+import json
+import math
+import re
+from collections import Counter
+from app.logger import get_logger
+from app.numeric import approximate
+from app.observer import Observer
+
+logger = get_logger("stats")  # pragma: no cover
+
+OPERATION_PATTERN = re.compile(r'"operation":\s*"((?:[^"\\]|\\.)*)"')
+
+def step_operations(steps):
+    steps = json.loads(steps) if isinstance(steps, str) else steps or []
+    return [step.get('operation') for step in steps if isinstance(step, dict)]
+
+def operator_counts(encoded_steps):
+    """Steps per operator across a steps column of JSON text, counted with C-level string scans."""
+    from app.calculation import CalculationFactory
+    joined = '\n'.join(encoded_steps)
+    counts = Counter()
+    for operator in CalculationFactory.dispatch_table():
+        count = joined.count(f'"operation": {json.dumps(operator)}')
+        if count:
+            counts[operator] = count
+    if '"operation":"' in joined:
+        # Steps written without the default JSON separators
+        counts = Counter(OPERATION_PATTERN.findall(joined))
+    return counts
+
+class RunningStats:
+    """Count, sum, mean, variance (Welford), min/max and per-operator step counts, updated one value at a time.
+
+    Removing the current minimum or maximum cannot be undone incrementally;
+    the extremes are then marked stale and recomputed by the caller.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = None
+        self.maximum = None
+        self.extremes_stale = False
+        self.operators = Counter()
+
+    def add(self, value, operations=()):
+        self.count += 1
+        self.total += value
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if not self.extremes_stale:
+            self.minimum = value if self.minimum is None else min(self.minimum, value)
+            self.maximum = value if self.maximum is None else max(self.maximum, value)
+        self.operators.update(operations)
+
+    def remove(self, value, operations=()):
+        if self.count <= 1:
+            self.__init__()
+            return
+        mean = (self.mean * self.count - value) / (self.count - 1)
+        self.m2 = max(self.m2 - (value - self.mean) * (value - mean), 0.0)
+        self.mean = mean
+        self.count -= 1
+        self.total -= value
+        if value == self.minimum or value == self.maximum:
+            self.extremes_stale = True
+        self.operators.subtract(operations)
+        self.operators = +self.operators
+
+    @property
+    def variance(self):
+        """Sample variance, like pandas' Series.var()."""
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @classmethod
+    def from_columns(cls, results, encoded_steps):
+        """Compute every aggregate from whole columns with vectorized NumPy."""
+        stats = cls()
+        stats.count = len(results)
+        if stats.count:
+            stats.total = float(results.sum())
+            stats.mean = float(results.mean())
+            stats.m2 = float(((results - stats.mean) ** 2).sum())
+            stats.minimum = float(results.min())
+            stats.maximum = float(results.max())
+        stats.operators = operator_counts(encoded_steps)
+        return stats
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'mean': self.mean if self.count else None,
+            'min': self.minimum,
+            'max': self.maximum,
+            'variance': self.variance,
+            'std': math.sqrt(self.variance),
+            'operators': dict(sorted(self.operators.items(), key=lambda item: (-item[1], item[0]))),
+        }
+
+class HistoryStatsObserver(Observer):
+    """Keeps RunningStats of a history current from its observer events.
+
+    The first ``summary()`` computes the statistics from the history's
+    columns; after that every added, deleted or updated calculation adjusts
+    them in O(1), so ``summary()`` does not rescan the history.
+    """
+
+    def __init__(self, history):
+        self.history = history
+        self.stats = None
+
+    def update(self, event, data):
+        stats = self.stats
+        if stats is None:
+            return
+        if event == "calculation_added":
+            stats.add(approximate(data['result']), step_operations(data['steps']))
+        elif event == "calculation_deleted":
+            stats.remove(approximate(data['result']), step_operations(data['steps']))
+        elif event == "calculation_updated":
+            stats.remove(approximate(data['previous_result']), step_operations(data['previous_steps']))
+            stats.add(approximate(data['result']), step_operations(data['steps']))
+        elif event == "history_cleared":
+            self.stats = RunningStats()
+        elif event in ("history_loaded", "history_synced"):
+            # Recomputed from the loaded or caught-up history on the next summary
+            self.stats = None
+
+    def recompute(self):
+        """Compute the statistics from scratch from the history's columns."""
+        return RunningStats.from_columns(self.history.results(), self.history.encoded_steps())
+
+    def summary(self):
+        if self.stats is None:
+            self.stats = self.recompute()
+        elif self.stats.extremes_stale:
+            results = self.history.results()
+            self.stats.minimum = float(results.min()) if len(results) else None
+            self.stats.maximum = float(results.max()) if len(results) else None
+            self.stats.extremes_stale = False
+        return self.stats.summary()
+
+    def verify(self, tolerance=1e-9):
+        """Compare the running statistics with a full recompute and adopt the recomputed values.
+
+        Returns the names of the aggregates that differed.
+        """
+        running = self.summary()
+        self.stats = self.recompute()
+        recomputed = self.stats.summary()
+        mismatches = []
+        for key, value in recomputed.items():
+            expected = running[key]
+            if isinstance(value, float) and isinstance(expected, float):
+                if not math.isclose(value, expected, rel_tol=tolerance, abs_tol=tolerance):
+                    mismatches.append(key)
+            elif value != expected:
+                mismatches.append(key)
+        if mismatches:
+            logger.warning(f"Running statistics differed from a full recompute: {', '.join(mismatches)}")
+        return mismatches
@@ -0,0 +1,80 @@
+import importlib
+from abc import ABC, abstractmethod
+
+# Storage mode -> "module:class" of its backend. CSV and journal storage are
+# built into CalculationHistory; other modes are backends imported on first use.
+STORAGE_BACKENDS = {
+    'sqlite': 'app.database:SqliteStorage',
+}
+
+class StorageBackend(ABC):
+    """Where a CalculationHistory keeps its rows when the history file is not the store.
+
+    A backend persists the history's mutation records (``add``, ``update``,
+    ``delete``, ``reset``; see HistoryJournal) and answers positional reads
+    without the history being loaded, so ``ans(n)`` and history pages do not
+    pay for a full load. Positions are 0-based here, as in HistoryStore.
+    """
+
+    path = None
+    backup_suffix = None
+
+    @abstractmethod
+    def __len__(self):  # pragma: no cover
+        pass  # pragma: no cover
+
+    @abstractmethod
+    def result(self, index):  # pragma: no cover
+        pass  # pragma: no cover
+
+    @abstractmethod
+    def row(self, index):  # pragma: no cover
+        pass  # pragma: no cover
+
+    @abstractmethod
+    def load(self):  # pragma: no cover
+        """Return every row as a new HistoryStore."""
+
+    @abstractmethod
+    def apply(self, records):  # pragma: no cover
+        """Persist mutation records atomically, in order."""
+
+    @abstractmethod
+    def snapshot(self, store):  # pragma: no cover
+        """Capture the rows of *store* now; the returned callable replaces every stored row with them."""
+
+    def replace(self, store):
+        self.snapshot(store)()
+
+    @abstractmethod
+    def backup(self, path):  # pragma: no cover
+        """Write a consistent copy of the storage to *path*."""
+
+    @abstractmethod
+    def restore(self, path):  # pragma: no cover
+        """Replace the storage with a copy written by ``backup``."""
+
+    @abstractmethod
+    def is_backup(self, path):  # pragma: no cover
+        """True if *path* is in the format ``backup`` writes."""
+
+    @abstractmethod
+    def version(self):  # pragma: no cover
+        """A value that changes with every committed change, including those of other processes."""
+
+    @abstractmethod
+    def changes(self, seen, version):  # pragma: no cover
+        """The ``add`` records that turn the rows at version *seen* into those at *version*.
+
+        Returns None when the rows changed in other ways, so the history has
+        to be reloaded.
+        """
+
+    def close(self):
+        pass
+
+def storage_backend(mode, history_file, **options):
+    """Open the backend for storage *mode* next to *history_file*."""
+    module_name, class_name = STORAGE_BACKENDS[mode].split(':')
+    backend = getattr(importlib.import_module(module_name), class_name)
+    return backend(history_file, **options)
@@ -0,0 +1,344 @@
+import json
+from bisect import bisect_left
+from datetime import datetime, timedelta
+import numpy as np
+from app.atomic import atomic_write
+from app.logger import get_logger
+from app.numeric import approximate
+
+logger = get_logger("store")  # pragma: no cover
+
+COLUMNS = ['input', 'result', 'timestamp', 'steps']
+EPOCH = datetime(1970, 1, 1)
+ONE_MICROSECOND = timedelta(microseconds=1)
+NO_TIMESTAMP = np.iinfo(np.int64).min  # same bit pattern as numpy's NaT
+
+def decode_steps(raw):
+    """Return the list of step dicts for a raw steps cell (list, JSON string or missing)."""
+    if isinstance(raw, list):
+        return raw
+    try:
+        if raw is None or raw == '' or (isinstance(raw, float) and raw != raw):
+            return []
+        return json.loads(raw)
+    except (TypeError, json.JSONDecodeError) as e:
+        logger.warning(f"Invalid JSON in steps column: {raw}, error: {str(e)}")
+        return []
+
+def encode_steps(raw):
+    """Return the JSON text for a raw steps cell without decoding stored JSON."""
+    if isinstance(raw, str):
+        return raw
+    return json.dumps(raw if isinstance(raw, list) else [])
+
+def to_microseconds(timestamp):
+    """Convert a datetime or ISO timestamp string to microseconds since the epoch."""
+    try:
+        if isinstance(timestamp, str):
+            timestamp = datetime.fromisoformat(timestamp)
+        if isinstance(timestamp, datetime):
+            return (timestamp.replace(tzinfo=None) - EPOCH) // ONE_MICROSECOND
+    except ValueError as e:
+        logger.warning(f"Invalid timestamp {timestamp}: {str(e)}")
+    return NO_TIMESTAMP
+
+def from_microseconds(value):
+    """Convert microseconds since the epoch back to an ISO timestamp string."""
+    if value == NO_TIMESTAMP:
+        return None
+    return (EPOCH + timedelta(microseconds=int(value))).isoformat()
+
+class HistoryStore:
+    """Columnar, append-optimised container for calculation history.
+
+    Results and timestamps live in growable ``float64``/``int64`` arrays with
+    amortized O(1) append and O(1) positional lookup. Inputs and steps are kept
+    as plain lists; steps loaded from disk stay JSON-encoded until a row is read.
+    Every row also gets a stable id that survives deletes of other rows; ids
+    increase with position, so an id's current position is a binary search.
+
+    Int results (exact mode) are kept as Python ints in a map from row id,
+    so they stay exact at any size; the result column holds their float
+    approximation for search, statistics and other vectorized readers.
+    """
+
+    def __init__(self, capacity=64, next_id=1):
+        self._size = 0
+        self._ids = []
+        self._next_id = next_id
+        self._results = np.empty(capacity, dtype=np.float64)
+        self._timestamps = np.empty(capacity, dtype=np.int64)
+        self._inputs = []
+        self._steps = []
+        self._exact = {}
+        self._frame = None
+        self._exported = False
+
+    def __len__(self):
+        return self._size
+
+    def _reserve(self, extra):
+        needed = self._size + extra
+        capacity = len(self._results)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity = max(capacity * 2, 64)
+        results = np.empty(capacity, dtype=np.float64)
+        timestamps = np.empty(capacity, dtype=np.int64)
+        results[:self._size] = self._results[:self._size]
+        timestamps[:self._size] = self._timestamps[:self._size]
+        self._results = results
+        self._timestamps = timestamps
+        self._exported = False
+
+    def append(self, input_str, result, timestamp, steps):
+        """Append one row; *timestamp* may be a datetime or an ISO string."""
+        if self._size == len(self._results):
+            self._reserve(1)
+        if result.__class__ is int:
+            self._exact[self._next_id] = result
+            result = approximate(result)
+        self._results[self._size] = result
+        self._timestamps[self._size] = to_microseconds(timestamp)
+        self._inputs.append(input_str)
+        self._steps.append(steps)
+        self._ids.append(self._next_id)
+        self._next_id += 1
+        self._size += 1
+        self._frame = None
+
+    def extend(self, inputs, results, timestamps, steps):
+        """Append whole columns at once; *timestamps* are ISO strings or datetimes."""
+        count = len(inputs)
+        self._reserve(count)
+        self._results[self._size:self._size + count] = self._split_exact(results, self._next_id)
+        self._timestamps[self._size:self._size + count] = [to_microseconds(ts) for ts in timestamps]
+        self._inputs.extend(inputs)
+        self._steps.extend(steps)
+        self._ids.extend(range(self._next_id, self._next_id + count))
+        self._next_id += count
+        self._size += count
+        self._frame = None
+
+    @classmethod
+    def from_columns(cls, inputs, results, timestamps, steps):
+        store = cls(capacity=max(len(inputs), 64))
+        store.extend(inputs, results, timestamps, steps)
+        return store
+
+    @classmethod
+    def from_arrays(cls, inputs, results, timestamps, steps, exact=()):
+        """Build a store from ready columns: *timestamps* are int64 microseconds since the epoch.
+
+        *exact* lists (position, int) pairs of rows whose float result stands for an exact int.
+        """
+        count = len(inputs)
+        store = cls(capacity=max(count, 64))
+        store._results[:count] = store._split_exact(results, 1)
+        for position, value in exact:
+            store._exact[position + 1] = value
+        store._timestamps[:count] = timestamps
+        store._inputs = list(inputs)
+        store._steps = list(steps)
+        store._ids = list(range(1, count + 1))
+        store._next_id = count + 1
+        store._size = count
+        return store
+
+    def _split_exact(self, results, first_id):
+        """The float column for *results*, recording any int results under ids from *first_id*."""
+        if isinstance(results, np.ndarray) or not any(value.__class__ is int for value in results):
+            return np.asarray(results, dtype=np.float64)
+        column = np.empty(len(results), dtype=np.float64)
+        for offset, value in enumerate(results):
+            if value.__class__ is int:
+                self._exact[first_id + offset] = value
+            column[offset] = approximate(value)
+        return column
+
+    def delete(self, index):
+        """Remove the row at 0-based *index*."""
+        if not 0 <= index < self._size:
+            raise IndexError(f"History row {index} out of range")
+        # np.delete allocates new arrays so previously exported views stay intact
+        self._results = np.delete(self._results, index)
+        self._timestamps = np.delete(self._timestamps, index)
+        self._exported = False
+        del self._inputs[index]
+        del self._steps[index]
+        if self._exact:
+            self._exact.pop(self._ids[index], None)
+        del self._ids[index]
+        self._size -= 1
+        self._frame = None
+
+    def truncate(self, size):
+        """Drop every row after the first *size* rows."""
+        if size >= self._size:
+            return
+        if self._exported:
+            # Later appends reuse the dropped slots; keep views handed out earlier intact
+            self._results = self._results.copy()
+            self._exported = False
+        del self._inputs[size:]
+        del self._steps[size:]
+        if self._exact:
+            for row_id in self._ids[size:]:
+                self._exact.pop(row_id, None)
+        del self._ids[size:]
+        self._size = size
+        self._frame = None
+
+    def clear(self):
+        self.__init__(next_id=self._next_id)
+
+    def update(self, index, input_str, result, steps):
+        """Replace the input, result and steps of the row at *index*, keeping its id and timestamp."""
+        if not 0 <= index < self._size:
+            raise IndexError(f"History row {index} out of range")
+        if self._exported:
+            # Copy on write so DataFrame views handed out earlier keep their values
+            self._results = self._results.copy()
+            self._exported = False
+        if self._exact:
+            self._exact.pop(self._ids[index], None)
+        if result.__class__ is int:
+            self._exact[self._ids[index]] = result
+            result = approximate(result)
+        self._results[index] = result
+        self._inputs[index] = input_str
+        self._steps[index] = steps
+        self._frame = None
+
+    def id(self, index):
+        return self._ids[index]
+
+    def ids(self):
+        return self._ids
+
+    def index_of(self, row_id):
+        """Return the current 0-based position of *row_id*, or None if it was removed."""
+        index = bisect_left(self._ids, row_id)
+        if index < self._size and self._ids[index] == row_id:
+            return index
+        return None
+
+    def result(self, index):
+        if self._exact:
+            exact = self._exact.get(self._ids[index])
+            if exact is not None:
+                return exact
+        return float(self._results[index])
+
+    def exact_results(self):
+        """(position, int) for every row with an exact int result, in position order."""
+        return sorted((self.index_of(row_id), value) for row_id, value in self._exact.items())
+
+    def result_values(self):
+        """The result column as a list, with exact int results in place of their approximations."""
+        values = self._results[:self._size].tolist()
+        for position, value in self.exact_results():
+            values[position] = value
+        return values
+
+    def input(self, index):
+        return self._inputs[index]
+
+    def timestamp(self, index):
+        return from_microseconds(self._timestamps[index])
+
+    def steps(self, index):
+        raw = self._steps[index]
+        if not isinstance(raw, list):
+            raw = decode_steps(raw)
+            self._steps[index] = raw
+        return raw
+
+    def raw_steps(self, index):
+        """The steps cell as stored: a list of dicts, or JSON text that has not been decoded yet."""
+        return self._steps[index]
+
+    def row(self, index):
+        return {
+            'input': self._inputs[index],
+            'result': self.result(index),
+            'timestamp': self.timestamp(index),
+            'steps': self.steps(index)
+        }
+
+    def inputs(self):
+        return self._inputs
+
+    def encoded_steps(self):
+        """The steps column as JSON text, reusing stored JSON that was never decoded."""
+        return [encode_steps(raw) for raw in self._steps]
+
+    def timestamps(self):
+        """Read-only view of the timestamp column in microseconds since the epoch."""
+        view = self._timestamps[:self._size]
+        view.flags.writeable = False
+        return view
+
+    def results(self):
+        """Zero-copy read-only view of the result column."""
+        view = self._results[:self._size]
+        view.flags.writeable = False
+        self._exported = True
+        return view
+
+    def to_frame(self, encode=False):
+        """Return the history as a DataFrame, building it only on demand.
+
+        The result column shares memory with the store. With *encode* the steps
+        column is JSON text, ready to be written to CSV.
+        """
+        import pandas as pd
+        if self._frame is not None and not encode:
+            return self._frame
+        timestamps = np.datetime_as_string(self._timestamps[:self._size].view('datetime64[us]'), unit='us').astype(object)
+        timestamps[timestamps == 'NaT'] = None
+        if encode:
+            steps = self.encoded_steps()
+        else:
+            steps = [self.steps(i) for i in range(self._size)]
+        # Exact int results need an object column; otherwise the column shares memory with the store
+        results = pd.Series(self.result_values(), dtype=object) if self._exact else self.results()
+        frame = pd.DataFrame({
+            'input': pd.Series(self._inputs, dtype=object),
+            'result': results,
+            'timestamp': timestamps,
+            'steps': pd.Series(steps, dtype=object)
+        }, columns=COLUMNS, copy=False)
+        if not encode:
+            self._frame = frame
+        return frame
+
+def read_csv(path, exact=False):
+    """Read a history CSV into a new store, leaving the steps JSON undecoded.
+
+    With *exact*, results written as integers are read back as exact ints.
+    """
+    import pandas as pd
+    frame = pd.read_csv(path, dtype={'input': str, 'result': str if exact else float, 'timestamp': str, 'steps': str})
+    if 'steps' not in frame.columns:
+        logger.warning(f"No 'steps' column in {path}; initialized with empty lists")
+        steps = [[] for _ in range(len(frame))]
+    else:
+        steps = frame['steps'].tolist()
+    timestamps = frame['timestamp'].where(frame['timestamp'].notna(), None).tolist()
+    results = frame['result'].to_numpy()
+    if exact:
+        text = frame['result'].fillna('nan')
+        integral = text.str.fullmatch(r'[-+]?\d+').to_numpy()
+        results = text.astype(float).to_numpy() if not integral.any() else \
+            [int(value) if is_int else float(value) for value, is_int in zip(text.tolist(), integral.tolist())]
+    return HistoryStore.from_columns(frame['input'].fillna('').tolist(), results, timestamps, steps)
+
+def write_frame(frame, path):
+    """Write an encoded history frame to *path*, replacing the file atomically."""
+    atomic_write(path, lambda f: frame.to_csv(f, index=False))
+
+def write_csv(store, path):
+    """Write *store* to *path* with the steps column encoded as JSON."""
+    write_frame(store.to_frame(encode=True), path)
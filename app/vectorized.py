@@ -0,0 +1,166 @@
+from typing import NamedTuple
+import numpy as np
+
+# Per-element error codes; 0 means the element was computed successfully
+OK = 0
+DIVIDE_BY_ZERO = 1
+ZERO_NEGATIVE_POWER = 2
+ZERO_ROOT_INDEX = 3
+EVEN_ROOT_OF_NEGATIVE = 4
+OVERFLOW = 5
+DOMAIN_ERROR = 6
+
+ERROR_MESSAGES = {
+    DIVIDE_BY_ZERO: "Divide By Zero Error",
+    ZERO_NEGATIVE_POWER: "Zero raised to negative power is undefined",
+    ZERO_ROOT_INDEX: "Root with zero index is undefined",
+    EVEN_ROOT_OF_NEGATIVE: "Even root of negative number is undefined",
+    OVERFLOW: "Result overflow: math range error",
+    DOMAIN_ERROR: "Calculation error: math domain error",
+}
+
+class VectorResult(NamedTuple):
+    """Element-wise result: *values* holds NaN wherever *codes* is non-zero."""
+    values: np.ndarray
+    codes: np.ndarray
+
+    @property
+    def errors(self):
+        return self.codes != OK
+
+    def messages(self):
+        """Return the error message for each element, or None where it succeeded."""
+        messages = np.full(self.codes.shape, None, dtype=object)
+        for code, message in ERROR_MESSAGES.items():
+            messages[self.codes == code] = message
+        return messages
+
+def _operands(a, b):
+    a, b = np.broadcast_arrays(np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64))
+    return a, b, np.zeros(a.shape, dtype=np.int8)
+
+def _finish(values, codes):
+    values = np.asarray(values, dtype=np.float64)
+    if codes.any():
+        values = np.where(codes != OK, np.nan, values)
+    return VectorResult(values, codes)
+
+def _flag(codes, mask, code):
+    """Record *code* for elements in *mask* that have no earlier error."""
+    codes[mask & (codes == OK)] = code
+
+class VectorOperation:
+    """Array counterparts of Operation with per-element error reporting.
+
+    Each method accepts scalars or array-likes (broadcast against each other)
+    and returns a VectorResult instead of raising OperationError.
+    """
+
+    @staticmethod
+    def addition(a, b) -> VectorResult:
+        a, b, codes = _operands(a, b)
+        with np.errstate(all='ignore'):
+            return _finish(np.add(a, b), codes)
+
+    @staticmethod
+    def subtraction(a, b) -> VectorResult:
+        a, b, codes = _operands(a, b)
+        with np.errstate(all='ignore'):
+            return _finish(np.subtract(a, b), codes)
+
+    @staticmethod
+    def absSubtraction(a, b) -> VectorResult:
+        a, b, codes = _operands(a, b)
+        with np.errstate(all='ignore'):
+            return _finish(np.abs(np.subtract(a, b)), codes)
+
+    @staticmethod
+    def multiply(a, b) -> VectorResult:
+        a, b, codes = _operands(a, b)
+        with np.errstate(all='ignore'):
+            return _finish(np.multiply(a, b), codes)
+
+    @staticmethod
+    def divide(a, b) -> VectorResult:
+        a, b, codes = _operands(a, b)
+        _flag(codes, b == 0, DIVIDE_BY_ZERO)
+        with np.errstate(all='ignore'):
+            return _finish(np.true_divide(a, b), codes)
+
+    @staticmethod
+    def modulo(a, b) -> VectorResult:
+        a, b, codes = _operands(a, b)
+        _flag(codes, b == 0, DIVIDE_BY_ZERO)
+        with np.errstate(all='ignore'):
+            return _finish(np.mod(a, b), codes)
+
+    @staticmethod
+    def intDivide(a, b) -> VectorResult:
+        a, b, codes = _operands(a, b)
+        _flag(codes, b == 0, DIVIDE_BY_ZERO)
+        with np.errstate(all='ignore'):
+            return _finish(np.floor_divide(a, b), codes)
+
+    @staticmethod
+    def percentage(a, b) -> VectorResult:
+        a, b, codes = _operands(a, b)
+        _flag(codes, b == 0, DIVIDE_BY_ZERO)
+        with np.errstate(all='ignore'):
+            return _finish(np.true_divide(a, b) * 100, codes)
+
+    @staticmethod
+    def pow(a, b) -> VectorResult:
+        a, b, codes = _operands(a, b)
+        _flag(codes, (a == 0) & (b < 0), ZERO_NEGATIVE_POWER)
+        with np.errstate(all='ignore'):
+            values = np.power(a, b)
+        finite_inputs = np.isfinite(a) & np.isfinite(b)
+        _flag(codes, np.isnan(values) & finite_inputs, DOMAIN_ERROR)
+        _flag(codes, np.isinf(values) & finite_inputs, OVERFLOW)
+        return _finish(values, codes)
+
+    @staticmethod
+    def root(a, b) -> VectorResult:
+        a, b, codes = _operands(a, b)
+        _flag(codes, b == 0, ZERO_ROOT_INDEX)
+        with np.errstate(all='ignore'):
+            _flag(codes, (a < 0) & (np.mod(b, 2) == 0), EVEN_ROOT_OF_NEGATIVE)
+            values = np.power(a, 1 / b)
+        finite_inputs = np.isfinite(a) & np.isfinite(b)
+        _flag(codes, np.isnan(values) & finite_inputs, DOMAIN_ERROR)
+        _flag(codes, np.isinf(values) & finite_inputs, OVERFLOW)
+        return _finish(values, codes)
+
+VECTOR_OPERATIONS = {
+    '+': VectorOperation.addition,
+    '-': VectorOperation.subtraction,
+    '--': VectorOperation.absSubtraction,
+    '*': VectorOperation.multiply,
+    '/': VectorOperation.divide,
+    '%': VectorOperation.modulo,
+    '//': VectorOperation.intDivide,
+    '/%': VectorOperation.percentage,
+    '^': VectorOperation.pow,
+    '?': VectorOperation.root,
+}
+
+def evaluate_columns(a, operators, b) -> VectorResult:
+    """Evaluate ``a[i] operators[i] b[i]`` for every row, grouping rows by operator."""
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    operators = np.asarray(operators, dtype=str)
+    values = np.full(a.shape, np.nan)
+    codes = np.zeros(a.shape, dtype=np.int8)
+    matched = np.zeros(a.shape, dtype=bool)
+    for operator, kernel in VECTOR_OPERATIONS.items():
+        rows = operators == operator
+        if not rows.any():
+            continue
+        result = kernel(a[rows], b[rows])
+        values[rows] = result.values
+        codes[rows] = result.codes
+        matched |= rows
+    if not matched.all():
+        operator = operators[~matched][0]
+        raise ValueError(f"Unsupported calculation '{operator}', Available: '{', '.join(VECTOR_OPERATIONS)}'")
+    return VectorResult(values, codes)
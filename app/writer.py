@@ -0,0 +1,148 @@
+import atexit
+import queue
+import threading
+import time
+from app.atomic import fsync_path
+from app.exceptions import HistoryError
+from app.logger import get_logger
+
+logger = get_logger("writer")  # pragma: no cover
+
+DURABILITY_POLICIES = ('always', 'interval', 'exit')
+_STOP = object()
+
+class HistoryWriter:
+    """Background thread that persists history mutations with group commit.
+
+    ``submit`` queues a list of journal records and returns immediately. The
+    thread takes *lock*, drains everything queued so far and calls
+    ``prepare(records)``, which must return an I/O callable; the callable runs
+    after the lock is released and returns the paths it wrote. A burst of
+    mutations therefore becomes a single write. Written paths are fsynced
+    according to *durability*: after every commit ('always'), at most every
+    *interval* seconds ('interval') or only on flush and close ('exit').
+
+    Failed commits keep their records and are retried with the next commit;
+    the error is raised once from the next ``submit`` or ``flush``.
+    """
+
+    def __init__(self, prepare, lock, durability='always', interval=1.0):
+        if durability not in DURABILITY_POLICIES:
+            raise HistoryError(f"Unsupported durability policy '{durability}', Available: '{', '.join(DURABILITY_POLICIES)}'")
+        self._prepare = prepare
+        self._lock = lock
+        self.durability = durability
+        self.interval = interval
+        self._queue = queue.Queue()
+        self._pending = []
+        self._unsynced = set()
+        self._last_sync = time.monotonic()
+        self._error = None
+        self._closed = False
+        self.commits = 0
+        self.operations = 0
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _raise_error(self):
+        error, self._error = self._error, None
+        if error is not None:
+            raise HistoryError(f"Background history write failed: {str(error)}")
+
+    def submit(self, records):
+        if self._closed:
+            raise HistoryError("History writer is closed")
+        self._raise_error()
+        self._queue.put(records)
+
+    def flush(self):
+        """Wait until everything submitted so far is written and synced to disk."""
+        if not self._closed:
+            done = threading.Event()
+            self._queue.put(done)
+            done.wait()
+        self._raise_error()
+
+    def close(self):
+        """Flush, then stop the writer thread."""
+        if self._closed:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._closed = True
+        atexit.unregister(self.close)
+        self._raise_error()
+
+    def _next(self):
+        if self.durability == 'interval' and self._unsynced:
+            timeout = max(self.interval - (time.monotonic() - self._last_sync), 0)
+            try:
+                return self._queue.get(timeout=timeout)
+            except queue.Empty:
+                return None
+        return self._queue.get()
+
+    def _run(self):
+        while True:
+            item = self._next()
+            waiters = []
+            stop = False
+            if item is not None:
+                with self._lock:
+                    # Draining under the lock means the records match the state prepare() sees
+                    items = [item]
+                    while True:
+                        try:
+                            items.append(self._queue.get_nowait())
+                        except queue.Empty:
+                            break
+                    for entry in items:
+                        if entry is _STOP:
+                            stop = True
+                        elif isinstance(entry, threading.Event):
+                            waiters.append(entry)
+                        else:
+                            self._pending.extend(entry)
+                    write = self._prepare_pending()
+                if write is not None:
+                    self._write(write)
+            if waiters or stop or self.durability == 'always' or \
+                    (self.durability == 'interval' and time.monotonic() - self._last_sync >= self.interval):
+                self._sync()
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                return
+
+    def _prepare_pending(self):
+        if not self._pending:
+            return None
+        try:
+            return self._prepare(self._pending)
+        except Exception as e:
+            logger.error(f"Failed to prepare history write: {str(e)}")
+            self._error = e
+            return None
+
+    def _write(self, write):
+        count = len(self._pending)
+        try:
+            self._unsynced.update(write())
+        except Exception as e:
+            logger.error(f"Failed to write {count} history records; retrying with the next commit: {str(e)}")
+            self._error = e
+            return
+        self._pending = []
+        self.commits += 1
+        self.operations += count
+        logger.debug(f"Committed {count} history records in one write")
+
+    def _sync(self):
+        for path in self._unsynced:
+            try:
+                fsync_path(path)
+            except OSError as e:
+                logger.warning(f"Failed to sync {path}: {str(e)}")
+        self._unsynced.clear()
+        self._last_sync = time.monotonic()
@@ -0,0 +1,349 @@
+"""Standalone benchmark runner.
+
+    python -m benchmarks.run --sizes 1000,100000,1000000 --output results.json
+    python -m benchmarks.run --sizes 1000 --compare results.json
+
+Latency benchmarks time individual calls and report percentiles in
+microseconds; throughput benchmarks report rows per second. Results are
+written as JSON so that runs can be compared with --compare.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+import numpy as np
+from app.binary import csv_to_binary
+from app.calculator import calculate_expression, evaluate_expression, evaluate_plan
+from app.compiler import compile_expression, clear_plan_cache
+from app.history import display_history, display_history_page
+from app.logger import LOG_LEVEL, set_log_level
+from app.memento import CalculationHistory
+from app.search import SearchQuery
+from benchmarks.workloads import integer_expressions, synthetic_expressions, write_history
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SIZES = (1000, 100000, 1000000)
+COLD_START = "import sys; from app.memento import CalculationHistory; import app.calculator; CalculationHistory(sys.argv[1])"
+
+def latency(name, size, calls):
+    """Time each zero-argument callable in *calls* and summarize in microseconds."""
+    timings = []
+    for call in calls:
+        start = time.perf_counter_ns()
+        call()
+        timings.append(time.perf_counter_ns() - start)
+    values = np.array(timings, dtype=np.float64) / 1000.0
+    return {
+        'name': name,
+        'size': size,
+        'unit': 'us',
+        'samples': len(timings),
+        'p50': float(np.percentile(values, 50)),
+        'p95': float(np.percentile(values, 95)),
+        'p99': float(np.percentile(values, 99)),
+        'mean': float(values.mean()),
+        'min': float(values.min()),
+        'max': float(values.max()),
+    }
+
+def throughput(name, size, rows, call):
+    start = time.perf_counter()
+    call()
+    seconds = time.perf_counter() - start
+    return {
+        'name': name,
+        'size': size,
+        'unit': 'rows/s',
+        'rows': rows,
+        'seconds': seconds,
+        'rows_per_second': rows / seconds if seconds else float('inf'),
+    }
+
+def guarded(call):
+    """Wrap *call* so expected calculation errors do not abort a latency run."""
+    def run():
+        try:
+            call()
+        except Exception:
+            pass
+    return run
+
+class Context:
+    def __init__(self, size, workdir, samples, csv_samples, cold_runs, seed):
+        self.size = size
+        self.workdir = workdir
+        self.samples = min(size, samples)
+        self.csv_samples = min(size, csv_samples)
+        self.cold_runs = cold_runs
+        self.seed = seed
+        self.base = write_history(os.path.join(workdir, f"history_{size}.csv"), size, seed)
+        self._history = None
+
+    @property
+    def history(self):
+        """A read-only history loaded from the synthetic CSV, shared between benchmarks."""
+        if self._history is None:
+            self._history = CalculationHistory(self.copy('shared'), storage_mode='csv')
+        return self._history
+
+    def copy(self, label):
+        path = os.path.join(self.workdir, f"{label}_{self.size}.csv")
+        shutil.copyfile(self.base, path)
+        return path
+
+    def binary_copy(self, label):
+        path = os.path.join(self.workdir, f"{label}_{self.size}.bin")
+        csv_to_binary(self.base, path)
+        return path
+
+    def expressions(self, count, seed_offset=0):
+        return synthetic_expressions(count, self.size, self.seed + seed_offset)
+
+def bench_parse(ctx):
+    clear_plan_cache()
+    expressions = ctx.expressions(ctx.samples)
+    return latency('parse', ctx.size, [lambda e=e: compile_expression(e) for e in expressions])
+
+def bench_evaluate(ctx):
+    history = ctx.history
+    expressions = ctx.expressions(ctx.samples, 1)
+    return latency('evaluate', ctx.size, [guarded(lambda e=e: evaluate_expression(e, history)) for e in expressions])
+
+def bench_calculate(ctx):
+    history = CalculationHistory(ctx.copy('journal'), storage_mode='journal')
+    expressions = ctx.expressions(ctx.samples, 2)
+    return latency('calculate', ctx.size, [guarded(lambda e=e: calculate_expression(e, history)) for e in expressions])
+
+def bench_calculate_csv(ctx):
+    history = CalculationHistory(ctx.copy('csv'), storage_mode='csv')
+    expressions = ctx.expressions(ctx.csv_samples, 3)
+    return latency('calculate_csv', ctx.size, [guarded(lambda e=e: calculate_expression(e, history)) for e in expressions])
+
+def bench_calculate_sqlite(ctx):
+    history = CalculationHistory(ctx.copy('sqlite'), storage_mode='sqlite', lazy=True)
+    expressions = ctx.expressions(ctx.samples, 2)
+    return latency('calculate_sqlite', ctx.size, [guarded(lambda e=e: calculate_expression(e, history)) for e in expressions])
+
+def bench_ans_lookup(ctx):
+    history = ctx.history
+    rng = random.Random(ctx.seed)
+    positions = [rng.randint(1, ctx.size) for _ in range(ctx.samples)]
+    return latency('ans_lookup', ctx.size, [lambda n=n: history.get_previous_result(n) for n in positions])
+
+def bench_history_load(ctx):
+    path = ctx.copy('load')
+    return throughput('history_load', ctx.size, ctx.size, lambda: CalculationHistory(path, storage_mode='csv'))
+
+def bench_history_load_binary(ctx):
+    path = ctx.binary_copy('load')
+    return throughput('history_load_binary', ctx.size, ctx.size, lambda: CalculationHistory(path, storage_mode='csv', history_format='binary'))
+
+def bench_ans_lookup_mapped(ctx):
+    history = CalculationHistory(ctx.binary_copy('mapped'), storage_mode='csv', lazy=True, history_format='binary')
+    rng = random.Random(ctx.seed)
+    positions = [rng.randint(1, ctx.size) for _ in range(ctx.samples)]
+    return latency('ans_lookup_mapped', ctx.size, [lambda n=n: history.get_previous_result(n) for n in positions])
+
+def bench_ans_lookup_sqlite(ctx):
+    history = CalculationHistory(ctx.copy('sqlite_lookup'), storage_mode='sqlite', lazy=True)
+    rng = random.Random(ctx.seed)
+    positions = [rng.randint(1, ctx.size) for _ in range(ctx.samples)]
+    return latency('ans_lookup_sqlite', ctx.size, [lambda n=n: history.get_previous_result(n) for n in positions])
+
+def bench_history_save(ctx):
+    history = ctx.history
+    return throughput('history_save', ctx.size, ctx.size, history.compact)
+
+def bench_display_history(ctx):
+    history = ctx.history
+    def display():
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            display_history(history)
+    return throughput('display_history', ctx.size, ctx.size, display)
+
+def bench_display_page(ctx):
+    history = ctx.history
+    rng = random.Random(ctx.seed)
+    pages = [rng.randint(1, max(ctx.size // 20, 1)) for _ in range(min(ctx.samples, 200))]
+    def display(page):
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            display_history_page(history, page, 20)
+    return latency('display_page', ctx.size, [lambda p=p: display(p) for p in pages])
+
+def bench_display_page_mapped(ctx):
+    # Opening an unloaded binary history and showing its first page, as after a fast start
+    path = ctx.binary_copy('page')
+    def first_page():
+        history = CalculationHistory(path, storage_mode='csv', lazy=True, history_format='binary')
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            display_history_page(history, 1, 20)
+        history.close()
+    return latency('display_page_mapped', ctx.size, [first_page] * min(ctx.samples, 50))
+
+def bench_search(ctx):
+    history = ctx.history
+    history.search_index
+    rng = random.Random(ctx.seed)
+    queries = []
+    for _ in range(min(ctx.samples, 200)):
+        low = rng.uniform(0, 2000)
+        queries.append(SearchQuery(result_range=(low, low + 1, True, False)))
+        queries.append(SearchQuery(result_range=(low, low + 50, True, False), operators=('+',)))
+        queries.append(SearchQuery(text=f"{rng.randint(1, 999)}.{rng.randint(0, 999):03d}"))
+    return latency('search', ctx.size, [lambda q=q: history.search(q, 20) for q in queries])
+
+def integer_latency(ctx, name, exact):
+    """Evaluation latency of integer-only expressions on the float or the exact numeric path."""
+    plans = [compile_expression(e, exact=exact) for e in integer_expressions(ctx.samples, ctx.seed)]
+    return latency(name, ctx.size, [guarded(lambda p=p: evaluate_plan(p, [])) for p in plans])
+
+def bench_integer_float(ctx):
+    return integer_latency(ctx, 'integer_float', False)
+
+def bench_integer_exact(ctx):
+    return integer_latency(ctx, 'integer_exact', True)
+
+def logging_latency(ctx, name, level):
+    """Latency of calculate at *level*, with the overhead over the same expressions with logging off."""
+    expressions = ctx.expressions(ctx.samples, 4)
+    results = {}
+    try:
+        for label, run_level in (('off', 'CRITICAL'), (name, level)):
+            set_log_level(run_level)
+            # No fsync per append, so the timings are dominated by evaluation and logging
+            history = CalculationHistory(ctx.copy(f'log_{label}'), storage_mode='journal', durability='exit')
+            results[label] = latency(name, ctx.size, [guarded(lambda e=e: calculate_expression(e, history)) for e in expressions])
+            history.close()
+    finally:
+        set_log_level(LOG_LEVEL)
+    result = results[name]
+    result['level'] = level
+    result['overhead_p50'] = result['p50'] - results['off']['p50']
+    result['overhead_mean'] = result['mean'] - results['off']['mean']
+    return result
+
+def bench_log_debug(ctx):
+    return logging_latency(ctx, 'log_debug', 'DEBUG')
+
+def bench_log_info(ctx):
+    return logging_latency(ctx, 'log_info', 'INFO')
+
+def bench_cold_start(ctx):
+    path = ctx.copy('cold')
+    command = [sys.executable, '-c', COLD_START, path]
+    calls = [lambda: subprocess.run(command, cwd=ROOT, check=True, capture_output=True)] * ctx.cold_runs
+    return latency('cold_start', ctx.size, calls)
+
+BENCHMARKS = {
+    'parse': bench_parse,
+    'evaluate': bench_evaluate,
+    'calculate': bench_calculate,
+    'calculate_csv': bench_calculate_csv,
+    'calculate_sqlite': bench_calculate_sqlite,
+    'ans_lookup': bench_ans_lookup,
+    'history_load': bench_history_load,
+    'history_load_binary': bench_history_load_binary,
+    'ans_lookup_mapped': bench_ans_lookup_mapped,
+    'ans_lookup_sqlite': bench_ans_lookup_sqlite,
+    'history_save': bench_history_save,
+    'display_history': bench_display_history,
+    'display_page': bench_display_page,
+    'display_page_mapped': bench_display_page_mapped,
+    'search': bench_search,
+    'integer_float': bench_integer_float,
+    'integer_exact': bench_integer_exact,
+    'log_debug': bench_log_debug,
+    'log_info': bench_log_info,
+    'cold_start': bench_cold_start,
+}
+
+def run(sizes=DEFAULT_SIZES, names=None, samples=10000, csv_samples=20, cold_runs=5, seed=0, progress=None):
+    """Run the selected benchmarks for every size and return the JSON-ready report."""
+    names = list(names or BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        raise ValueError(f"Unknown benchmarks: {', '.join(unknown)}. Available: {', '.join(BENCHMARKS)}")
+    results = []
+    with tempfile.TemporaryDirectory(prefix='calculator-bench-') as workdir:
+        for size in sizes:
+            ctx = Context(size, workdir, samples, csv_samples, cold_runs, seed)
+            for name in names:
+                result = BENCHMARKS[name](ctx)
+                results.append(result)
+                if progress:
+                    progress(format_result(result))
+    return {
+        'meta': {
+            'created': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'seed': seed,
+        },
+        'benchmarks': results,
+    }
+
+def format_result(result):
+    if result['unit'] == 'us':
+        overhead = f", logging overhead {result['overhead_p50']:.1f}us p50" if 'overhead_p50' in result else ""
+        return (f"{result['name']:<16} {result['size']:>9}  p50 {result['p50']:10.1f}us  "
+                f"p95 {result['p95']:10.1f}us  p99 {result['p99']:10.1f}us  ({result['samples']} samples{overhead})")
+    return f"{result['name']:<16} {result['size']:>9}  {result['rows_per_second']:12.0f} rows/s  ({result['seconds']:.3f}s)"
+
+def compare(current, baseline):
+    """Yield one line per benchmark present in both reports with the change of its headline metric."""
+    previous = {(r['name'], r['size']): r for r in baseline['benchmarks']}
+    for result in current['benchmarks']:
+        before = previous.get((result['name'], result['size']))
+        if before is None:
+            continue
+        if result['unit'] == 'us':
+            old, new, label = before['p50'], result['p50'], 'p50'
+            change = (new - old) / old if old else 0.0
+        else:
+            old, new, label = before['rows_per_second'], result['rows_per_second'], 'rows/s'
+            change = (old - new) / old if old else 0.0
+        verdict = 'slower' if change > 0 else 'faster'
+        yield f"{result['name']:<16} {result['size']:>9}  {label} {old:.1f} -> {new:.1f}  ({abs(change):.1%} {verdict})"
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Calculator benchmark suite")
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)), help="comma-separated history sizes")
+    parser.add_argument('--only', help=f"comma-separated benchmarks to run ({', '.join(BENCHMARKS)})")
+    parser.add_argument('--samples', type=int, default=10000, help="maximum timed calls per latency benchmark")
+    parser.add_argument('--csv-samples', type=int, default=20, help="timed calls for calculate_csv (each rewrites the history)")
+    parser.add_argument('--cold-runs', type=int, default=5, help="interpreter launches per cold start benchmark")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', '-o', metavar='FILE', help="write the JSON report to FILE")
+    parser.add_argument('--compare', metavar='FILE', help="compare against a previous JSON report")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    names = [name.strip() for name in args.only.split(',')] if args.only else None
+    report = run(sizes, names, args.samples, args.csv_samples, args.cold_runs, args.seed,
+                 progress=lambda line: print(line, file=sys.stderr))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        for line in compare(report, baseline):
+            print(line, file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+import json
+import random
+from datetime import datetime, timedelta
+import pandas as pd
+
+OPERATORS = ('+', '-', '*', '/', '%', '//', '--', '/%', '^', '?')
+
+def random_operand(rng):
+    return f"{rng.uniform(1, 1000):.3f}"
+
+def synthetic_expressions(count, history_size=0, seed=0, ans_ratio=0.1):
+    """Expressions with 1-4 operators; about *ans_ratio* of them reference earlier history rows."""
+    rng = random.Random(seed)
+    expressions = []
+    for _ in range(count):
+        if history_size and rng.random() < ans_ratio:
+            terms = [f"ans({rng.randint(1, history_size)})"]
+        else:
+            terms = [random_operand(rng)]
+        for _ in range(rng.randint(1, 4)):
+            operator = rng.choice(OPERATORS)
+            # Keep roots and powers in range so most expressions succeed
+            operand = str(rng.randint(2, 3)) if operator in ('^', '?') else random_operand(rng)
+            terms.append(f"{operator} {operand}")
+        expressions.append(' '.join(terms))
+    return expressions
+
+INTEGER_OPERATORS = ('+', '-', '*', '//', '%', '^')
+
+def integer_expressions(count, seed=0):
+    """Integer-only expressions with 1-4 operators, for comparing the float and exact numeric paths."""
+    rng = random.Random(seed)
+    expressions = []
+    for _ in range(count):
+        terms = [str(rng.randint(1, 10 ** 6))]
+        for _ in range(rng.randint(1, 4)):
+            operator = rng.choice(INTEGER_OPERATORS)
+            operand = str(rng.randint(2, 4)) if operator == '^' else str(rng.randint(1, 10 ** 6))
+            terms.append(f"{operator} {operand}")
+        expressions.append(' '.join(terms))
+    return expressions
+
+def synthetic_history(rows, seed=0):
+    """A history DataFrame with one single-step calculation per row."""
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1)
+    inputs, results, timestamps, steps = [], [], [], []
+    for i in range(rows):
+        a = rng.uniform(1, 1000)
+        b = rng.uniform(1, 1000)
+        text = f"{a} + {b}"
+        inputs.append(text)
+        results.append(a + b)
+        timestamps.append((start + timedelta(seconds=i)).isoformat(timespec='microseconds'))
+        steps.append(json.dumps([{'input': text, 'operation': '+', 'a': a, 'b': b, 'result': a + b}]))
+    return pd.DataFrame({'input': inputs, 'result': results, 'timestamp': timestamps, 'steps': steps})
+
+def write_history(path, rows, seed=0):
+    synthetic_history(rows, seed).to_csv(path, index=False)
+    return path